@@ -42,10 +42,68 @@ class Settings(BaseSettings):
     
     # Database
     DATABASE_URL: str = Field(default="sqlite:///./data/db/rpgpdf2text.db")
+    # Pool de connexions (par processus) ; pool_timeout et pool_recycle ne concernent que les bases serveur (PostgreSQL)
+    DB_POOL_SIZE: int = Field(default=_deploy_config.get("db_pool_size", 10))
+    DB_MAX_OVERFLOW: int = Field(default=_deploy_config.get("db_max_overflow", 20))
+    DB_POOL_TIMEOUT: int = Field(default=30)
+    DB_POOL_RECYCLE: int = Field(default=1800)
+    # SQLite : attente maximale du verrou d'écriture (secondes) et taille de la projection mmap (Mo)
+    SQLITE_BUSY_TIMEOUT: float = Field(default=30.0)
+    SQLITE_MMAP_SIZE_MB: int = Field(default=256)
     
     # Extraction
+    # Nombre de demandes traitées simultanément par chaque worker
     MAX_CONCURRENT_EXTRACTIONS: int = Field(default=_deploy_config.get("max_concurrent_extractions", 1))
 
+    # File d'attente persistante (voir app/worker.py)
+    # "embedded" : le serveur web lance et supervise des processus worker dédiés ;
+    # "inline" : le worker tourne dans la boucle du serveur web (développement) ;
+    # "external" : workers lancés séparément via `python -m app.worker`
+    EXTRACTION_WORKER_MODE: str = Field(default=_deploy_config.get("extraction_worker_mode", "embedded"))
+    EXTRACTION_WORKER_PROCESSES: int = Field(default=_deploy_config.get("extraction_worker_processes", 1))
+    # Identifiant du worker (défaut : <hostname>-<pid>) ; il doit être propre à chaque processus :
+    # deux workers de même identifiant mélangent leurs battements de cœur et leurs métriques
+    WORKER_ID: Optional[str] = None
+    WORKER_POLL_INTERVAL: float = Field(default=1.0)
+    WORKER_HEARTBEAT_INTERVAL: int = Field(default=15)
+    WORKER_STALE_AFTER: int = Field(default=120)  # Secondes sans battement de cœur avant récupération d'une demande
+    # Avancement des demandes : écritures du worker espacées d'au moins PROGRESS_MIN_INTERVAL secondes,
+    # diffusion SSE après une lecture de la base toutes les PROGRESS_POLL_INTERVAL secondes
+    PROGRESS_MIN_INTERVAL: float = Field(default=1.0)
+    PROGRESS_POLL_INTERVAL: float = Field(default=1.0)
+
+    # Lots (POST /extract/batch) : nombre maximal de PDF par appel
+    BATCH_MAX_ITEMS: int = Field(default=_deploy_config.get("batch_max_items", 100))
+
+    # Contrôle d'admission (état en mémoire par processus web, rechargé depuis la base) :
+    # quotas par utilisateur, puis refus (429 + Retry-After) quand le service est saturé
+    ADMISSION_MAX_ACTIVE_JOBS: int = Field(default=_deploy_config.get("admission_max_active_jobs", 20))
+    ADMISSION_PAGES_PER_HOUR: int = Field(default=_deploy_config.get("admission_pages_per_hour", 5000))
+    ADMISSION_MAX_QUEUED_COST: int = Field(default=_deploy_config.get("admission_max_queued_cost", 200000))
+    ADMISSION_MIN_FREE_DISK_MB: int = Field(default=_deploy_config.get("admission_min_free_disk_mb", 1024))
+    ADMISSION_REFRESH_INTERVAL: float = Field(default=5.0)
+    ADMISSION_RETRY_AFTER: int = Field(default=30)  # Retry-After (s) quand la saturation n'a pas d'échéance connue
+
+    # OCR parallèle (pool de processus, une page par tâche)
+    OCR_WORKERS: int = Field(default=_deploy_config.get("ocr_workers", os.cpu_count() or 1))
+    OCR_DPI: int = Field(default=200)
+    # Moteur OCR : "auto" (tesserocr s'il est installé, pytesseract sinon), "tesserocr" ou "pytesseract"
+    OCR_BACKEND: str = Field(default=_deploy_config.get("ocr_backend", "auto"))
+    # Budget mémoire approximatif des pages rasterisées en cours d'OCR (en Mo)
+    OCR_MEMORY_BUDGET_MB: int = Field(default=_deploy_config.get("ocr_memory_budget_mb", 1024))
+    # Cache disque des pages OCRisées (clé = empreinte du contenu de la page), éviction LRU
+    PAGE_CACHE_MAX_MB: int = Field(default=_deploy_config.get("page_cache_max_mb", 512))
+
+    # Métriques Prometheus (GET /metrics) : instantané de chaque processus écrit dans DATA_DIR/metrics
+    # toutes les METRICS_FLUSH_INTERVAL secondes ; si METRICS_TOKEN est défini, la collecte exige
+    # l'en-tête `Authorization: Bearer <METRICS_TOKEN>`
+    METRICS_FLUSH_INTERVAL: float = Field(default=10.0)
+    METRICS_TOKEN: Optional[str] = None
+
+    # Cache mémoire des utilisateurs authentifiés (clé = jeton), par processus web
+    USER_CACHE_TTL: float = Field(default=60.0)
+    USER_CACHE_MAX_ENTRIES: int = Field(default=10000)
+
     # Security
     SECRET_KEY: str = Field(default="CHANGE_ME_IN_PRODUCTION_A_VERY_LONG_SECRET_KEY")
     ALGORITHM: str = "HS256"
@@ -55,11 +113,43 @@ class Settings(BaseSettings):
     # but we can have environment fallbacks
     HF_TOKEN: Optional[str] = None
     DISCORD_WEBHOOK_URL: Optional[str] = None
+
+    # Téléchargement des PDF par URL (client HTTP asynchrone partagé)
+    DOWNLOAD_MAX_MB: int = Field(default=_deploy_config.get("download_max_mb", 500))
+    DOWNLOAD_TIMEOUT: float = Field(default=30.0)  # Délai maximal (s) entre deux octets reçus
+    DOWNLOAD_TOTAL_TIMEOUT: float = Field(default=600.0)  # Durée maximale (s) d'un téléchargement
+    DOWNLOAD_MAX_CONNECTIONS: int = Field(default=20)
+
+    # Webhooks : boîte d'envoi persistante et dispatcher
+    WEBHOOK_TIMEOUT: float = Field(default=10.0)
+    WEBHOOK_MAX_CONNECTIONS: int = Field(default=50)
+    WEBHOOK_PER_HOST_CONCURRENCY: int = Field(default=4)  # Envois simultanés maximum vers un même hôte
+    WEBHOOK_BATCH_SIZE: int = Field(default=100)  # Livraisons réservées par tour du dispatcher
+    WEBHOOK_MAX_ATTEMPTS: int = Field(default=8)
+    WEBHOOK_BACKOFF_BASE: float = Field(default=5.0)  # Délai (s) avant la 2e tentative, doublé ensuite
+    WEBHOOK_BACKOFF_MAX: float = Field(default=3600.0)
+    WEBHOOK_POLL_INTERVAL: float = Field(default=2.0)
+    WEBHOOK_STALE_AFTER: int = Field(default=300)  # Secondes avant de reprendre une livraison restée en `sending`
+
+    # Correction IA : parallélisme et limitation de débit des appels HuggingFace
+    HF_BASE_URL: Optional[str] = None  # Point d'accès compatible OpenAI (TGI auto-hébergé) ; défaut : API HuggingFace
+    HF_MAX_IN_FLIGHT: int = Field(default=4)  # Appels simultanés maximum
+    HF_RATE_PER_SECOND: float = Field(default=2.0)  # Débit moyen autorisé (seau à jetons)
+    HF_RATE_BURST: int = Field(default=4)  # Rafale maximale au-delà du débit moyen
+    HF_MAX_RETRIES: int = Field(default=4)  # Nouvelles tentatives sur 429/5xx
+    HF_BACKOFF_BASE: float = Field(default=1.0)  # Délai initial (s) du backoff exponentiel
+    # Cache disque des morceaux corrigés (clé = modèle, version du prompt, empreinte du morceau)
+    CORRECTION_CACHE_MAX_MB: int = Field(default=_deploy_config.get("correction_cache_max_mb", 256))
+    CORRECTION_CACHE_MAX_AGE_DAYS: int = Field(default=_deploy_config.get("correction_cache_max_age_days", 90))
     
     # Storage
     DATA_DIR: str = "./data"
     USERS_DIR: str = "./data/users"
     TEMP_DIR: str = "./data/temp"
+    # Textes résultats adressés par leur contenu (DATA_DIR/blobs) : passage du ramasse-miettes et
+    # délai de grâce (s) avant suppression d'un blob qui n'est plus référencé
+    BLOB_GC_INTERVAL: float = Field(default=3600.0)
+    BLOB_GC_GRACE: float = Field(default=600.0)
 
     # Propriétés dynamiques pour récupérer les informations Git
     @property
@@ -1,12 +1,106 @@
-from sqlalchemy import create_engine
+import importlib.util
+from typing import Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 from app.core.config import settings
 
-engine = create_engine(
-    settings.DATABASE_URL, connect_args={"check_same_thread": False}
-)
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    """
+    Réglages appliqués à chaque nouvelle connexion SQLite : journal WAL (les lecteurs ne sont
+    plus bloqués par l'écriture en cours), fsync allégé, attente du verrou au lieu de
+    "database is locked" et lecture par mmap.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT * 1000)}")
+        cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE_MB * 1024 * 1024}")
+    finally:
+        cursor.close()
+
+
+def build_engine(database_url: str) -> Engine:
+    """Crée le moteur SQLAlchemy adapté à la base : SQLite (WAL, busy timeout) ou serveur (PostgreSQL...) avec pool dimensionné."""
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        in_memory = url.database in (None, "", ":memory:")
+        engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT},
+            # Une base en mémoire n'existe que dans sa connexion : SQLAlchemy choisit alors son propre pool
+            **({} if in_memory else {"pool_size": settings.DB_POOL_SIZE, "max_overflow": settings.DB_MAX_OVERFLOW}),
+        )
+        if not in_memory:
+            event.listen(engine, "connect", _configure_sqlite)
+        return engine
+
+    return create_engine(
+        url,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        # Connexions coupées par le serveur ou un proxy (pgbouncer, redémarrage) détectées avant usage
+        pool_pre_ping=True,
+    )
+
+
+# Pilotes asynchrones utilisés par le moteur des routes de l'API
+_ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def async_database_url(database_url: str) -> URL:
+    """Même base que `database_url`, avec le pilote asynchrone correspondant (aiosqlite, asyncpg)."""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"Pas de pilote asynchrone connu pour la base '{backend}'")
+    return url.set(drivername=f"{backend}+{_ASYNC_DRIVERS[backend]}")
+
+
+def build_async_engine(database_url: str) -> AsyncEngine:
+    """Moteur asynchrone des routes de l'API, avec les mêmes réglages que `build_engine`."""
+    url = async_database_url(database_url)
+    driver = url.get_driver_name()
+    if importlib.util.find_spec(driver) is None:
+        raise RuntimeError(
+            f"Le pilote asynchrone '{driver}' requis par DATABASE_URL n'est pas installé"
+            + (" (uv sync --extra postgresql)" if url.get_backend_name() == "postgresql" else "")
+        )
+    if url.get_backend_name() == "sqlite":
+        in_memory = url.database in (None, "", ":memory:")
+        engine = create_async_engine(
+            url,
+            connect_args={"timeout": settings.SQLITE_BUSY_TIMEOUT},
+            **({} if in_memory else {"pool_size": settings.DB_POOL_SIZE, "max_overflow": settings.DB_MAX_OVERFLOW}),
+        )
+        if not in_memory:
+            event.listen(engine.sync_engine, "connect", _configure_sqlite)
+        return engine
+
+    return create_async_engine(
+        url,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+
+engine = build_engine(settings.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Moteur asynchrone des routes (authentification, /extract, /user/requests, téléchargement), créé
+# paresseusement : les workers et les scripts n'ont pas besoin du pilote asynchrone
+_async_engine: Optional[AsyncEngine] = None
+_async_session_factory: Optional[async_sessionmaker] = None
+
 Base = declarative_base()
 
 def get_db():
@@ -15,3 +109,21 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine, _async_session_factory
+    if _async_engine is None:
+        _async_engine = build_async_engine(settings.DATABASE_URL)
+        # expire_on_commit=False : les objets restent lisibles après le commit sans nouvel aller-retour implicite
+        _async_session_factory = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_engine
+
+async def dispose_async_engine():
+    """Ferme les connexions du moteur asynchrone s'il a été créé (arrêt de l'application)."""
+    if _async_engine is not None:
+        await _async_engine.dispose()
+
+async def get_async_db():
+    get_async_engine()
+    async with _async_session_factory() as db:
+        yield db
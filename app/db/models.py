@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, Text, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.db.database import Base
@@ -21,6 +21,7 @@ class User(Base):
     is_validated = Column(Boolean, default=False)
     directory_name = Column(String, unique=True, nullable=True)
     api_token = Column(String, unique=True, index=True, nullable=True)
+    priority = Column(String, default="normal") # Classe de priorité dans la file : "low", "normal", "high"
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class ExtractionRequest(Base):
@@ -34,14 +35,92 @@ class ExtractionRequest(Base):
     file_path = Column(String, nullable=True) # l'emplacement du fichier pdf uploadé
     file_hash = Column(String, index=True, nullable=True) # Empreinte SHA-256 pour le cache
     txt_file_path = Column(String, nullable=True) # the final output text
+    result_hash = Column(String, index=True, nullable=True) # Empreinte SHA-256 du texte (blob partagé de result_blobs)
+    result_filename = Column(String, nullable=True) # Nom proposé au téléchargement
     ia_validate = Column(Boolean, default=False)
+    estimated_cost = Column(Integer, nullable=True) # Coût estimé (pages, OCR pondéré) pour servir les petits travaux d'abord
+    page_count = Column(Integer, nullable=True) # Nombre total de pages du PDF
+    ocr_page_count = Column(Integer, nullable=True) # Pages OCRisées (les autres sont extraites nativement)
     error_message = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     completed_at = Column(DateTime(timezone=True), nullable=True)
+    submitted_at = Column(DateTime(timezone=True), index=True, nullable=True) # Dernière soumission (quota de pages par heure)
+    # File d'attente persistante : worker ayant réservé la demande et dernier signe de vie
+    worker_id = Column(String, nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    # Avancement publié par le worker (étape, élément courant / total), diffusé en SSE
+    progress_stage = Column(String, nullable=True) # hashing, ocr, correction, saving, webhook
+    progress_current = Column(Integer, nullable=True)
+    progress_total = Column(Integer, nullable=True)
+    progress_at = Column(DateTime(timezone=True), nullable=True)
+    # Lot d'appartenance (POST /extract/batch) : pas de webhook individuel, un récapitulatif par lot
+    batch_id = Column(Integer, ForeignKey("extraction_batches.id"), index=True, nullable=True)
     
     # Relationship to user
     user = relationship("User", backref="extraction_requests")
 
+    __table_args__ = (
+        # File d'attente : demandes actives dans l'ordre de réservation
+        Index("ix_extraction_requests_status_created", "status", "created_at"),
+        # Historique paginé d'un utilisateur (curseur sur l'identifiant)
+        Index("ix_extraction_requests_user_id_id", "user_id", "id"),
+    )
+
+class ExtractionBatch(Base):
+    """
+    Lot de demandes soumis en un seul appel. Quand sa dernière demande se termine, le lot passe
+    en `completed` et un unique webhook récapitulatif est envoyé à `webhook_url`.
+    """
+    __tablename__ = "extraction_batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    webhook_url = Column(String, nullable=False)
+    status = Column(String, default="pending") # pending, completed
+    item_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+    requests = relationship("ExtractionRequest", backref="batch")
+
+class ResultBlob(Base):
+    """
+    Texte résultat stocké une seule fois sous DATA_DIR/blobs (adressé par son empreinte) et
+    partagé par toutes les demandes qui y renvoient. `refcount` compte ces demandes ; un blob
+    qui n'est plus référencé est supprimé par le ramasse-miettes après un délai de grâce.
+    """
+    __tablename__ = "result_blobs"
+
+    sha256 = Column(String, primary_key=True)
+    size = Column(Integer, nullable=False)
+    refcount = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    released_at = Column(DateTime(timezone=True), nullable=True) # Passage de refcount à 0
+
+    __table_args__ = (Index("ix_result_blobs_refcount_released", "refcount", "released_at"),)
+
+class WebhookDelivery(Base):
+    """
+    Boîte d'envoi persistante des webhooks (clients et Discord) : chaque notification est
+    enregistrée dans la même transaction que le changement d'état qui la déclenche,
+    puis livrée par le dispatcher avec nouvelles tentatives.
+    """
+    __tablename__ = "webhook_deliveries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    url = Column(String, nullable=False)
+    payload = Column(Text, nullable=False) # Corps JSON à envoyer
+    status = Column(String, default="pending") # pending, sending, delivered, failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now())
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    delivered_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (Index("ix_webhook_deliveries_status_next", "status", "next_attempt_at"),)
+
 class ActivityLog(Base):
     """
     Modèle de journal d'activité pour tracer les actions importantes.
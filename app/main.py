@@ -5,6 +5,7 @@ from app.core.config import settings
 from app.db.database import engine, Base
 from app.db import models
 import os
+import asyncio
 from loguru import logger
 import sys
 
@@ -31,7 +32,7 @@ def create_directories():
 os.makedirs(f"{settings.DATA_DIR}/db", exist_ok=True)
 Base.metadata.create_all(bind=engine)
 
-from app.routes import auth_routes, view_routes, api_routes
+from app.routes import auth_routes, view_routes, api_routes, metrics_routes
 
 # Préfixe de l'application (ex: "/rpgpdf2txt" en prod, "" en local)
 _prefix = settings.APP_PREFIX
@@ -43,7 +44,48 @@ async def lifespan(app: FastAPI):
     prefix_info = f" avec préfixe '{settings.APP_PREFIX}'" if settings.APP_PREFIX else " (sans préfixe)"
     logger.info(f"Démarrage de l'API{prefix_info}...")
     create_directories()
+    # Pilote asynchrone des routes manquant (asyncpg pour PostgreSQL) : erreur explicite dès le démarrage
+    from app.db.database import get_async_engine
+    get_async_engine()
+    # Workers pilotés par le serveur web : processus dédiés (embedded) ou boucle locale (inline)
+    worker_stop = asyncio.Event()
+    worker_task = None
+    # Livraison des webhooks de la boîte d'envoi (un dispatcher par processus, réservations atomiques)
+    from app.services.webhook import run_webhook_dispatcher, notify_webhooks
+    webhook_task = asyncio.create_task(run_webhook_dispatcher(worker_stop))
+    # Ramasse-miettes des textes résultats partagés (DATA_DIR/blobs)
+    from app.services.blob_store import run_blob_gc
+    blob_gc_task = asyncio.create_task(run_blob_gc(worker_stop))
+    # Rechargement périodique de l'état d'admission (quotas en mémoire)
+    from app.services.admission import run_admission_refresh
+    admission_task = asyncio.create_task(run_admission_refresh(worker_stop))
+    # Instantané des métriques du processus web (agrégé par GET /metrics avec ceux des workers)
+    from app.services.metrics import run_metrics_flush
+    metrics_task = asyncio.create_task(run_metrics_flush(worker_stop))
+    if settings.EXTRACTION_WORKER_MODE == "embedded":
+        from app.worker import run_worker_processes
+        worker_task = asyncio.create_task(run_worker_processes(worker_stop))
+    elif settings.EXTRACTION_WORKER_MODE == "inline":
+        from app.worker import run_worker
+        worker_task = asyncio.create_task(run_worker(worker_stop))
     yield
+    if worker_task:
+        from app.worker import notify_new_job
+        worker_stop.set()
+        notify_new_job()
+        await worker_task
+    worker_stop.set()
+    notify_webhooks()
+    await webhook_task
+    await blob_gc_task
+    await admission_task
+    await metrics_task
+    from app.services.ocr_engine import shutdown_ocr_pool
+    shutdown_ocr_pool()
+    from app.services.downloader import close_http_client
+    await close_http_client()
+    from app.db.database import dispose_async_engine
+    await dispose_async_engine()
 
 app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
 
@@ -55,6 +97,7 @@ app.mount(f"{_prefix}/static", StaticFiles(directory="app/static"), name="static
 app.include_router(view_routes.router, prefix=_prefix)
 app.include_router(auth_routes.router, prefix=_prefix + settings.API_V1_STR + "/auth", tags=["auth"])
 app.include_router(api_routes.router, prefix=_prefix + settings.API_V1_STR, tags=["api"])
+app.include_router(metrics_routes.router, prefix=_prefix)
 
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
@@ -95,6 +138,7 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         content={"detail": exc.detail},
+        headers=getattr(exc, "headers", None),
     )
 
 
@@ -1,27 +1,54 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, UploadFile, File, Form, Query, Request
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func # Added for func.count()
-from app.db.database import get_db
-from app.db.models import User, ActivityLog, ExtractionRequest
-from app.routes.deps import get_current_admin_user, get_current_active_user, get_token
+from fastapi import APIRouter, Body, Depends, HTTPException, UploadFile, File, Form, Query, Request, Response
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app.db.database import get_db, get_async_db
+from app.db.models import User, ActivityLog, ExtractionBatch, ExtractionRequest
+from app.routes.deps import get_current_admin_user, get_current_active_user, get_token, get_user_from_token
 from app.core.config import settings
-from app.services.extractor_job import process_extraction
-from app.services.webhook import send_client_webhook # Added for webhook in queue deletion
+from app.worker import notify_new_job
+from app.services.extractor_job import apply_cached_result, find_cached_extraction, queue_error_webhook, queue_success_webhook
+from app.services.batches import complete_batch, create_batch
+from app.services.ingest import save_upload
+from app.services.downloader import DownloadError, DownloadTooLarge, download_pdf
+from app.services.webhook import notify_webhooks
+from app.services.progress import get_progress_broker, progress_event
+from app.services.job_queue import ACTIVE_STATUSES, PRIORITY_WEIGHTS, queue_positions
+from app.services.pdf_extractor import ExtractionEstimate, estimate_extraction
+from app.services.admission import AdmissionRejected, get_admission
+from app.services.metrics import EXTRACTION_CACHE
+from app.services.user_cache import get_user_cache
+from app.services.blob_store import discard_result, result_download_name
+from app.services.text_variants import choose_encoding, etag_matches, fresh_variant, write_compressed_variants
 import os
 import re
-import shutil
 import aiofiles
 import uuid
 from loguru import logger
 from datetime import datetime, timezone
 import asyncio
+import json
+from typing import List, Optional
 
 router = APIRouter()
 
 @router.get("/admin/users")
 def get_users(db: Session = Depends(get_db), current_user: User = Depends(get_current_admin_user)):
     users = db.query(User).all()
-    return [{"id": u.id, "email": u.email, "role": u.role, "is_validated": u.is_validated, "directory_name": u.directory_name, "api_token": u.api_token} for u in users]
+    return [{"id": u.id, "email": u.email, "role": u.role, "is_validated": u.is_validated, "directory_name": u.directory_name, "api_token": u.api_token, "priority": u.priority or "normal"} for u in users]
+
+@router.post("/admin/users/{user_id}/priority")
+def set_user_priority(user_id: int, priority: str = Body(..., embed=True), db: Session = Depends(get_db), current_user: User = Depends(get_current_admin_user)):
+    """Change la classe de priorité de l'utilisateur dans la file d'extraction (low, normal, high)."""
+    if priority not in PRIORITY_WEIGHTS:
+        raise HTTPException(status_code=400, detail=f"Priority must be one of: {', '.join(PRIORITY_WEIGHTS)}")
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    user.priority = priority
+    db.add(ActivityLog(user_id=current_user.id, action=f"L'admin a passé la priorité de {user.email} à '{priority}'"))
+    db.commit()
+    return {"msg": "Priority updated", "priority": priority}
 
 @router.post("/admin/users/{user_id}/validate")
 def validate_user(user_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_admin_user)):
@@ -58,15 +85,28 @@ def validate_user(user_id: int, db: Session = Depends(get_db), current_user: Use
     return {"msg": "User validated and directory created", "directory": dir_name}
 
 
+def _admission_error(e: AdmissionRejected) -> HTTPException:
+    """429 + Retry-After pour un refus temporaire ; 413 si la demande dépasse à elle seule le quota."""
+    logger.warning(f"Demande refusée par le contrôle d'admission : {e}")
+    if e.retry_after is None:
+        return HTTPException(status_code=413, detail=str(e))
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def _check_admission(user_id: int, jobs: int = 1):
+    try:
+        get_admission().check(user_id, jobs)
+    except AdmissionRejected as e:
+        raise _admission_error(e)
+
+
 @router.post("/extract", status_code=202)
 async def extract_document(
-    background_tasks: BackgroundTasks,
     id_texte: str = Form(..., min_length=3),
     webhook_url: str = Form(...),
     ia_validate: bool = Form(False),
     pdf_file: UploadFile = File(None),
     pdf_url: str = Form(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
@@ -74,8 +114,11 @@ async def extract_document(
     Supporte soit l'envoi direct de fichier (pdf_file), soit une URL (pdf_url).
     """
     logger.info(f"Requête d'extraction reçue | Utilisateur: {current_user.email} | ID Texte: {id_texte}")
+    # Quotas et saturation vérifiés avant de recevoir le PDF (état en mémoire, sans requête)
+    _check_admission(current_user.id)
     
     file_path = None
+    file_hash = None
     temp_filename = f"{uuid.uuid4()}.pdf"
     file_path = os.path.abspath(os.path.join(settings.TEMP_DIR, temp_filename))
 
@@ -84,100 +127,40 @@ async def extract_document(
             logger.warning(f"Fichier rejeté (non-PDF): {pdf_file.filename}")
             raise HTTPException(status_code=400, detail="Only PDF files are allowed")
             
+        # Écriture asynchrone par blocs, empreinte calculée au passage (pas de relecture par le worker)
         logger.debug(f"Sauvegarde du PDF chargé dans: {file_path}")
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(pdf_file.file, buffer)
+        file_hash = await save_upload(pdf_file, file_path)
     elif pdf_url:
         logger.info(f"Tentative de téléchargement du PDF depuis l'URL: {pdf_url}")
-        
-        # Gestion spécifique Google Drive
-        if "drive.google.com" in pdf_url:
-            match = re.search(r"/d/([^/]+)", pdf_url)
-            if not match:
-                match = re.search(r"id=([^&]+)", pdf_url)
-                
-            if match:
-                file_id = match.group(1)
-                logger.info(f"Lien Google Drive détecté (ID: {file_id}), utilisation de la logique robuste...")
-                
-                try:
-                    import requests
-                    session = requests.Session()
-                    # 1. Tentative initiale pour obtenir le cookie et éventuellement le token de confirmation
-                    download_url = f"https://drive.google.com/uc?export=download&id={file_id}"
-                    response = session.get(download_url, stream=True, timeout=30)
-                    
-                    # 2. Vérification si Google demande une confirmation pour les gros fichiers
-                    confirm_token = None
-                    for key, value in response.cookies.items():
-                        if key.startswith('download_warning'):
-                            confirm_token = value
-                            break
-                    
-                    if not confirm_token:
-                        if 'text/html' in response.headers.get('Content-Type', ''):
-                            confirm_match = re.search(r'confirm=([0-9A-Za-z_]+)', response.text)
-                            if confirm_match:
-                                confirm_token = confirm_match.group(1)
-                    
-                    if confirm_token:
-                        logger.info(f"Token de confirmation détecté ({confirm_token}), second passage...")
-                        download_url = f"https://drive.google.com/uc?export=download&id={file_id}&confirm={confirm_token}"
-                        response = session.get(download_url, stream=True, timeout=30)
-                    
-                    response.raise_for_status()
-                    
-                    # Sauvegarde avec le nom demandé id_texte.tmp.pdf
-                    file_path = os.path.abspath(os.path.join(settings.TEMP_DIR, f"{id_texte}.tmp.pdf"))
-                    
-                    with open(file_path, "wb") as f:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            f.write(chunk)
-                    
-                    # Vérification signature PDF
-                    with open(file_path, "rb") as f:
-                        if f.read(4) != b"%PDF":
-                            logger.error("Le fichier téléchargé Google Drive n'est pas un PDF valide.")
-                            os.remove(file_path)
-                            raise HTTPException(status_code=400, detail="Google Drive link did not return a valid PDF (private file or invalid link?)")
-                    
-                    logger.info(f"Téléchargement Google Drive réussi: {file_path}")
-                except Exception as e:
-                    logger.error(f"Échec Google Drive: {e}")
-                    if isinstance(e, HTTPException): raise e
-                    raise HTTPException(status_code=400, detail=f"Failed to download from Google Drive: {str(e)}")
-            else:
-                raise HTTPException(status_code=400, detail="Invalid Google Drive link format")
-        else:
-            # Téléchargement standard pour les autres URLs
-            try:
-                import requests
-                response = requests.get(pdf_url, stream=True, timeout=30)
-                response.raise_for_status()
-                file_path = os.path.abspath(os.path.join(settings.TEMP_DIR, f"{id_texte}.tmp.pdf"))
-                with open(file_path, "wb") as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                logger.info(f"Téléchargement réussi: {file_path}")
-            except Exception as e:
-                logger.error(f"Échec téléchargement URL: {e}")
-                raise HTTPException(status_code=400, detail=f"Failed to download from URL: {str(e)}")
+        try:
+            file_hash = await download_pdf(pdf_url, file_path)
+        except DownloadTooLarge as e:
+            logger.error(f"Échec téléchargement URL: {e}")
+            raise HTTPException(status_code=413, detail=str(e))
+        except DownloadError as e:
+            logger.error(f"Échec téléchargement URL: {e}")
+            raise HTTPException(status_code=400, detail=str(e))
     else:
         raise HTTPException(status_code=400, detail="Missing pdf_file or pdf_url")
     
         
     # Find existing job or create new one
-    req = db.query(ExtractionRequest).filter(ExtractionRequest.id_texte == id_texte).first()
+    req = await db.scalar(select(ExtractionRequest).where(ExtractionRequest.id_texte == id_texte).limit(1))
+    previous_batch_id = None
     
     if req:
-        # Overwrite existing request
+        # Overwrite existing request : le résultat précédent est libéré, la demande quitte son lot éventuel
+        await db.run_sync(discard_result, req)
+        previous_batch_id, req.batch_id = req.batch_id, None
         req.user_id = current_user.id
         req.status = "pending"
         req.webhook_url = webhook_url
         req.file_path = file_path
+        req.file_hash = file_hash
         req.ia_validate = ia_validate
         req.error_message = None
         req.completed_at = None
+        req.submitted_at = datetime.now(timezone.utc)
         action_msg = f"Demande d'extraction relancée/écrasée pour '{id_texte}'"
     else:
         # Create new request
@@ -187,32 +170,209 @@ async def extract_document(
             status="pending",
             webhook_url=webhook_url,
             file_path=file_path,
-            ia_validate=ia_validate
+            file_hash=file_hash,
+            ia_validate=ia_validate,
+            submitted_at=datetime.now(timezone.utc),
         )
         db.add(req)
         action_msg = f"Nouvelle demande d'extraction initiée pour '{id_texte}'"
     
+    # PDF déjà extrait : la demande est servie immédiatement, sans passer par la file
+    cached_req = await db.run_sync(find_cached_extraction, file_hash, req.id) if file_hash else None
+    if cached_req and not await db.run_sync(apply_cached_result, req, cached_req):
+        cached_req = None
+    EXTRACTION_CACHE.inc("reception", "hit" if cached_req else "miss")
+    if cached_req:
+        req.file_path = None
+        action_msg += " (servie depuis le cache)"
+    else:
+        # Coût estimé (pages, part à OCRiser, IA) : l'ordonnanceur sert les petits travaux d'abord,
+        # le contrôle d'admission décompte les pages du quota horaire
+        estimate = await asyncio.to_thread(estimate_extraction, file_path, ia_validate)
+        try:
+            get_admission().admit(current_user.id, [estimate])
+        except AdmissionRejected as e:
+            await db.rollback()
+            os.remove(file_path)
+            raise _admission_error(e)
+        req.estimated_cost = estimate.cost if estimate is not None else None
+        req.page_count = estimate.pages if estimate is not None else None
+
     log = ActivityLog(user_id=current_user.id, action=action_msg)
     db.add(log)
     
-    db.commit()
-    db.refresh(req)
-    
-    # Lancement du traitement en arrière-plan
+    if cached_req:
+        await db.flush()  # attribue l'identifiant utilisé dans le lien de téléchargement
+        async with aiofiles.open(req.txt_file_path, "r", encoding="utf-8") as f:
+            text = await f.read()
+        await db.run_sync(queue_success_webhook, req, text, from_cache=True)
+    batch_completed = previous_batch_id is not None and await db.run_sync(complete_batch, previous_batch_id)
+
+    await db.commit()
+    if batch_completed:
+        notify_webhooks()
+    
+    if cached_req:
+        os.remove(file_path)
+        notify_webhooks()
+        logger.info(f"Cache hit à la réception : demande {req.id} ({id_texte}) servie depuis la demande {cached_req.id}.")
+        return {"msg": "Extraction served from cache", "request_id": req.id, "status": req.status}
+
+    # La demande est persistée en `pending` : un worker (embarqué ou `python -m app.worker`) la réservera
     logger.info(f"Demande {req.id} ({id_texte}) ajoutée à la file d'attente.")
-    background_tasks.add_task(process_extraction, req.id)
+    notify_new_job()
     
-    return {"msg": "Extraction started", "request_id": req.id}
+    return {"msg": "Extraction started", "request_id": req.id, "status": req.status}
+
+@router.post("/extract/batch", status_code=202)
+async def extract_batch(
+    webhook_url: str = Form(...),
+    items: str = Form(...),
+    ia_validate: bool = Form(False),
+    pdf_files: List[UploadFile] = File(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Soumet un lot de PDF en un seul appel. `items` est une liste JSON d'objets
+    `{"id_texte": ..., "pdf_url": ...}` ou `{"id_texte": ..., "pdf_file": <nom d'un fichier de pdf_files>}`.
+    Les demandes sont créées dans une seule transaction ; les PDF déjà extraits sont servis depuis
+    le cache et un PDF présent plusieurs fois n'est extrait qu'une fois. Un unique webhook
+    récapitulatif est envoyé à `webhook_url` quand tout le lot est terminé. Un lot de plus de
+    ADMISSION_MAX_ACTIVE_JOBS PDF distincts est refusé (413) avant la réception des PDF.
+    """
+    try:
+        entries = json.loads(items)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="items must be a JSON list")
+    if not isinstance(entries, list) or not entries:
+        raise HTTPException(status_code=400, detail="items must be a non-empty JSON list")
+    if len(entries) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Too many items (max {settings.BATCH_MAX_ITEMS})")
+    logger.info(f"Lot d'extraction reçu | Utilisateur: {current_user.email} | {len(entries)} demande(s)")
+
+    uploads = {f.filename: f for f in pdf_files or []}
+    seen_ids, used_files = set(), set()
+    for entry in entries:
+        id_texte = entry.get("id_texte") if isinstance(entry, dict) else None
+        if not isinstance(id_texte, str) or len(id_texte) < 3:
+            raise HTTPException(status_code=400, detail="Each item needs an id_texte of at least 3 characters")
+        if id_texte in seen_ids:
+            raise HTTPException(status_code=400, detail=f"Duplicate id_texte '{id_texte}' in batch")
+        seen_ids.add(id_texte)
+        if bool(entry.get("pdf_url")) == bool(entry.get("pdf_file")):
+            raise HTTPException(status_code=400, detail=f"Item '{id_texte}' needs either pdf_url or pdf_file")
+        name = entry.get("pdf_file")
+        if name is not None:
+            if name not in uploads or name in used_files:
+                raise HTTPException(status_code=400, detail=f"Item '{id_texte}': unknown or reused pdf_file '{name}'")
+            if not name.lower().endswith('.pdf'):
+                raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+            used_files.add(name)
+    # Avant toute réception : chaque PDF distinct du lot compte comme une demande active
+    _check_admission(current_user.id, len({(e.get("pdf_url"), e.get("pdf_file")) for e in entries}))
+
+    # Réception de tous les PDF en parallèle (envois écrits par blocs, URL téléchargées) ; empreintes au passage
+    paths = [os.path.abspath(os.path.join(settings.TEMP_DIR, f"{uuid.uuid4()}.pdf")) for _ in entries]
+
+    async def receive(entry: dict, path: str) -> str:
+        if entry.get("pdf_file"):
+            return await save_upload(uploads[entry["pdf_file"]], path)
+        return await download_pdf(entry["pdf_url"], path)
+
+    hashes = await asyncio.gather(*(receive(e, p) for e, p in zip(entries, paths)), return_exceptions=True)
+    failure = next((h for h in hashes if isinstance(h, BaseException)), None)
+    if failure is not None:
+        # Lot refusé en bloc : aucun PDF reçu n'est conservé
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        logger.error(f"Échec de réception du lot: {failure}")
+        if isinstance(failure, DownloadTooLarge):
+            raise HTTPException(status_code=413, detail=str(failure))
+        if isinstance(failure, DownloadError):
+            raise HTTPException(status_code=400, detail=str(failure))
+        raise failure
+
+    estimates = await asyncio.gather(*(asyncio.to_thread(estimate_extraction, p, ia_validate) for p in paths))
+    batch, requests, unused_paths = await db.run_sync(
+        create_batch, current_user.id, webhook_url, ia_validate,
+        list(zip([e["id_texte"] for e in entries], paths, hashes, estimates)),
+    )
+    # Seules les demandes mises en file sont admises ; un doublon du lot ne coûte rien de plus
+    by_path = dict(zip(paths, estimates))
+    queued_estimates, seen_paths = [], set()
+    for r in requests:
+        if r.status == "pending":
+            queued_estimates.append(by_path[r.file_path] if r.file_path not in seen_paths else ExtractionEstimate(0, 0, 0))
+            seen_paths.add(r.file_path)
+    try:
+        get_admission().admit(current_user.id, queued_estimates)
+    except AdmissionRejected as e:
+        await db.rollback()
+        for path in paths:
+            os.remove(path)
+        raise _admission_error(e)
+    queued = len(queued_estimates)
+    db.add(ActivityLog(
+        user_id=current_user.id,
+        action=f"Lot {batch.id} : {len(requests)} demande(s) d'extraction ({len(requests) - queued} servie(s) depuis le cache)",
+    ))
+    await db.commit()
+
+    for path in unused_paths:
+        os.remove(path)
+    notify_webhooks()
+    if queued:
+        notify_new_job()
+    logger.info(f"Lot {batch.id} créé : {queued} demande(s) en file, {len(requests) - queued} servie(s) depuis le cache.")
+    return {
+        "msg": "Batch started",
+        "batch_id": batch.id,
+        "status": batch.status,
+        "requests": [{"id": r.id, "id_texte": r.id_texte, "status": r.status} for r in requests],
+    }
+
+@router.get("/extract/batch/{batch_id}")
+async def get_batch(
+    batch_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """État d'un lot et de ses demandes."""
+    batch = await db.scalar(select(ExtractionBatch).where(ExtractionBatch.id == batch_id, ExtractionBatch.user_id == current_user.id))
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    requests = (await db.scalars(
+        select(ExtractionRequest).where(ExtractionRequest.batch_id == batch_id).order_by(ExtractionRequest.id)
+    )).all()
+    return {
+        "id": batch.id,
+        "status": batch.status,
+        "item_count": batch.item_count,
+        "created_at": batch.created_at,
+        "completed_at": batch.completed_at,
+        "requests": [
+            {"id": r.id, "id_texte": r.id_texte, "status": r.status, "error_message": r.error_message}
+            for r in requests
+        ],
+    }
 
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from app.core.security import decode_access_token
 
 @router.get("/extract/{request_id}/download")
-def download_text(
+async def download_text(
     request_id: int, 
+    request: Request,
     token: str = Depends(get_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
+    """
+    Télécharge le texte extrait. L'ETag dérive de l'empreinte du texte servi (If-None-Match -> 304),
+    les requêtes Range sont honorées et une variante précompressée (zstd, gzip) est servie
+    si le client l'accepte.
+    """
     actual_token = token
             
     if not actual_token:
@@ -225,49 +385,81 @@ def download_text(
     if payload.get("type") == "download":
         if str(payload.get("sub")) != str(request_id):
             raise HTTPException(status_code=403, detail="Invalid token for this download")
-        req = db.query(ExtractionRequest).filter(ExtractionRequest.id == request_id).first()
+        req = await db.get(ExtractionRequest, request_id)
     else:
         email = payload.get("sub")
         if not email:
             raise HTTPException(status_code=401, detail="Invalid token")
-        user = db.query(User).filter(User.email == email, User.is_validated == True).first()
-        if not user:
+        user = await get_user_from_token(actual_token, db)
+        if not user or not user.is_validated:
             raise HTTPException(status_code=401, detail="Invalid user")
-        req = db.query(ExtractionRequest).filter(ExtractionRequest.id == request_id, ExtractionRequest.user_id == user.id).first()
+        req = await db.scalar(select(ExtractionRequest).where(ExtractionRequest.id == request_id, ExtractionRequest.user_id == user.id))
 
     if not req or req.status not in ["success", "success_cached"] or not req.txt_file_path:
         raise HTTPException(status_code=404, detail="File not found or not ready")
-        
-    return FileResponse(path=req.txt_file_path, filename=os.path.basename(req.txt_file_path), media_type="text/plain")
+    txt_path = req.txt_file_path
+    if not await asyncio.to_thread(os.path.exists, txt_path):
+        raise HTTPException(status_code=404, detail="File not found or not ready")
+
+    path = txt_path
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    if encoding:
+        variant = fresh_variant(txt_path, encoding)
+        if variant is None:
+            # Résultat antérieur aux variantes précompressées : elles sont écrites une fois pour toutes
+            await asyncio.to_thread(write_compressed_variants, txt_path)
+            variant = fresh_variant(txt_path, encoding)
+        if variant is None:
+            encoding = None
+        else:
+            path = variant
+
+    # Le contenu varie selon Accept-Encoding ; le client doit revalider (304 si inchangé)
+    headers = {"Vary": "Accept-Encoding", "Cache-Control": "private, no-cache"}
+    # ETag tiré du texte servi, pas du PDF : le même PDF resoumis avec ou sans correction IA change de texte
+    if req.result_hash:
+        tag = req.result_hash
+    else:
+        # Résultat antérieur au stockage adressé par le contenu : date et taille du fichier
+        stat = await asyncio.to_thread(os.stat, txt_path)
+        tag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    headers["ETag"] = f'"{tag}-{encoding}"' if encoding else f'"{tag}"'
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+
+    return FileResponse(path=path, filename=result_download_name(req), media_type="text/plain", headers=headers)
 
 @router.get("/user/requests")
-def get_user_requests(db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+async def get_user_requests(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[int] = Query(None, description="Identifiant de la dernière demande de la page précédente"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user),
+):
     """
-    Récupère la liste des demandes de l'utilisateur avec la position dans la file d'attente globale si applicable.
+    Récupère une page de l'historique de l'utilisateur (plus récentes d'abord) avec la position
+    dans la file d'attente globale des demandes actives. Si d'autres demandes existent, l'en-tête
+    `X-Next-Cursor` contient la valeur de `cursor` à passer pour obtenir la page suivante.
     """
     logger.debug(f"Récupération de l'historique pour {current_user.email}")
-    
-    # 1. On récupère toutes les demandes globales actives (pour calculer la file d'attente de n'importe quel utilisateur)
-    # Les requêtes les plus anciennes (created_at asc) sont servies en premier à cause de l'attente FIFO du process_extraction
-    active_requests = db.query(ExtractionRequest.id).filter(
-        ExtractionRequest.status.in_(["pending", "processing"])
-    ).order_by(ExtractionRequest.created_at.asc()).all()
-    
-    # Liste ordonnée des IDs actifs
-    active_ids = [r[0] for r in active_requests]
-    
-    # 2. On récupère les requêtes de l'utilisateur
-    requests = db.query(ExtractionRequest).options(joinedload(ExtractionRequest.user)).filter(
-        ExtractionRequest.user_id == current_user.id
-    ).order_by(ExtractionRequest.created_at.desc()).all()
-    
+
+    # Pagination par curseur sur l'identifiant (croissant dans l'ordre de création), servie par l'index (user_id, id)
+    query = select(ExtractionRequest).where(ExtractionRequest.user_id == current_user.id)
+    if cursor is not None:
+        query = query.where(ExtractionRequest.id < cursor)
+    requests = (await db.scalars(query.order_by(ExtractionRequest.id.desc()).limit(limit + 1))).all()
+    if len(requests) > limit:
+        requests = requests[:limit]
+        response.headers["X-Next-Cursor"] = str(requests[-1].id)
+
+    # Positions des seules demandes actives de la page, dans l'ordre de réservation des workers
+    positions = await db.run_sync(queue_positions, [r.id for r in requests if r.status in ACTIVE_STATUSES])
+
     result = []
     for r in requests:
-        queue_pos = None
-        # Si la demande est active, on cherche sa position dans la grande file
-        if r.status in ["pending", "processing"] and r.id in active_ids:
-            queue_pos = active_ids.index(r.id)
-            
         result.append({
             "id": r.id,
             "id_texte": r.id_texte,
@@ -276,13 +468,75 @@ def get_user_requests(db: Session = Depends(get_db), current_user: User = Depend
             "completed_at": r.completed_at.isoformat() if r.completed_at else None,
             "error_message": r.error_message,
             "file_hash": r.file_hash,
-            "queue_position": queue_pos
+            "page_count": r.page_count,
+            "ocr_page_count": r.ocr_page_count,
+            "progress_stage": r.progress_stage if r.status == "processing" else None,
+            "progress_current": r.progress_current if r.status == "processing" else None,
+            "progress_total": r.progress_total if r.status == "processing" else None,
+            "queue_position": positions.get(r.id)
         })
     return result
 
+@router.get("/user/requests/stream")
+async def stream_user_requests(
+    request_id: Optional[int] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Flux Server-Sent Events de l'avancement des demandes de l'utilisateur (ou d'une seule avec `request_id`).
+    Chaque événement `progress` contient le statut, l'étape (hashing, ocr, correction, saving, webhook),
+    l'avancement courant / total et, pour une demande en attente, sa position dans la file. EventSource ne pouvant pas envoyer d'en-tête, le jeton
+    peut être passé en paramètre `?token=`.
+    """
+    user_id = current_user.id
+    query = select(ExtractionRequest).where(
+        ExtractionRequest.user_id == user_id,
+        ExtractionRequest.status.in_(["pending", "processing"])
+    )
+    if request_id is not None:
+        query = query.where(ExtractionRequest.id == request_id)
+    active = (await db.scalars(query)).all()
+    positions = await db.run_sync(queue_positions, [r.id for r in active if r.status == "pending"])
+    initial = [progress_event(r, positions.get(r.id)) for r in active]
+    # La connexion à la base est rendue tout de suite : le flux peut rester ouvert des heures
+    await db.close()
+
+    def format_event(event: dict) -> str:
+        return f"event: progress\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    async def events():
+        broker = get_progress_broker()
+        queue = broker.subscribe(user_id)
+        try:
+            for event in initial:
+                yield format_event(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Commentaire SSE : garde la connexion ouverte à travers les proxys
+                    yield ": keepalive\n\n"
+                    continue
+                if request_id is None or event["id"] == request_id:
+                    yield format_event(event)
+        finally:
+            broker.unsubscribe(user_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/admin/user-cache")
+async def user_cache_stats(current_user: User = Depends(get_current_admin_user)):
+    """Statistiques du cache des utilisateurs authentifiés de ce processus (taux de succès, évictions...)."""
+    return get_user_cache().stats()
+
 @router.delete("/admin/cache")
 def clear_cache(db: Session = Depends(get_db), current_user: User = Depends(get_current_admin_user)):
-    """Vide le cache (toutes les extractions réussies) et supprime les fichiers .txt associés."""
+    """Vide le cache (toutes les extractions réussies) ; les textes qui ne sont plus référencés sont libérés."""
     logger.info(f"Admin {current_user.email} demande la purge du cache.")
     
     # Récupérer les requêtes avec succès
@@ -292,12 +546,7 @@ def clear_cache(db: Session = Depends(get_db), current_user: User = Depends(get_
     
     count = 0
     for req in success_requests:
-        # Suppression du fichier physique
-        if req.txt_file_path and os.path.exists(req.txt_file_path):
-            try:
-                os.remove(req.txt_file_path)
-            except Exception as e:
-                logger.error(f"Erreur lors de la suppression de {req.txt_file_path}: {e}")
+        discard_result(db, req)
         # Suppression de l'entrée en base de données
         db.delete(req)
         count += 1
@@ -328,18 +577,14 @@ async def clear_queue(db: Session = Depends(get_db), current_user: User = Depend
         req.completed_at = datetime.now(timezone.utc)
         count += 1
         
-        # Envoi de la notification webhook d'erreur pour prévenir le client
-        if req.webhook_url:
-            asyncio.create_task(
-                send_client_webhook(req.webhook_url, {
-                    "message": "L'extraction a échoué.",
-                    "etat": "échec",
-                    "id_texte": req.id_texte,
-                    "erreur": req.error_message
-                })
-            )
+        # Notification webhook d'erreur pour prévenir le client (boîte d'envoi, même transaction)
+        queue_error_webhook(db, req)
+    # Les lots concernés sont terminés : leur récapitulatif part dans la même transaction
+    for batch_id in {req.batch_id for req in active_requests if req.batch_id is not None}:
+        complete_batch(db, batch_id)
             
     db.commit()
+    notify_webhooks()
     
     # Log the action
     log = ActivityLog(user_id=current_user.id, action=f"L'admin a purgé la file d'attente ({count} requêtes interrompues)")
@@ -351,7 +596,7 @@ async def clear_queue(db: Session = Depends(get_db), current_user: User = Depend
 
 @router.delete("/extract/{request_id}")
 async def delete_extraction(request_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    """Supprime une extraction spécifique, son fichier texte et son entrée en base de données."""
+    """Supprime une extraction spécifique et son entrée en base de données (le texte partagé est libéré)."""
     logger.info(f"Demande de suppression de l'extraction {request_id} par {current_user.email}")
     
     # Récupérer la requête
@@ -366,23 +611,22 @@ async def delete_extraction(request_id: int, db: Session = Depends(get_db), curr
         raise HTTPException(status_code=403, detail="Vous n'avez pas l'autorisation de supprimer cette extraction")
         
     id_texte = req.id_texte
+    batch_id = req.batch_id
     
-    # Suppression du fichier physique
-    if req.txt_file_path and os.path.exists(req.txt_file_path):
-        try:
-            os.remove(req.txt_file_path)
-            logger.info(f"Fichier supprimé: {req.txt_file_path}")
-        except Exception as e:
-            logger.error(f"Erreur lors de la suppression de {req.txt_file_path}: {e}")
-            
+    # Libération du texte résultat : il reste disponible pour les autres demandes qui le partagent
+    discard_result(db, req)
+
     # Suppression de l'entrée en base de données
     db.delete(req)
     
     # Log de l'activité
     log = ActivityLog(user_id=current_user.id, action=f"Suppression de l'extraction '{id_texte}' (ID: {request_id})")
     db.add(log)
-    
+    # Une demande d'un lot supprimée peut être la dernière attendue par ce lot
+    batch_completed = batch_id is not None and complete_batch(db, batch_id)
     db.commit()
+    if batch_completed:
+        notify_webhooks()
     
     logger.info(f"Extraction {request_id} ('{id_texte}') supprimée avec succès.")
     return {"message": f"Extraction '{id_texte}' supprimée avec succès"}
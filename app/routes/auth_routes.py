@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
-from app.db.database import get_db
+import asyncio
+from app.db.database import get_db, get_async_db
 from app.db.models import User
 from app.core.security import verify_password, create_access_token
 from app.core.config import settings
@@ -48,12 +50,15 @@ class PasswordChangeRequest(BaseModel):
 @router.post("/change-password")
 async def change_password(
     data: PasswordChangeRequest, 
-    db: Session = Depends(get_db), 
+    db: AsyncSession = Depends(get_async_db), 
     current_user: User = Depends(get_current_active_user)
 ):
-    if not verify_password(data.current_password, current_user.hashed_password):
+    # L'utilisateur est relu dans la session de la route : c'est elle qui enregistre la modification
+    user = await db.get(User, current_user.id)
+    # bcrypt est volontairement lent : calcul hors de la boucle d'événements
+    if not await asyncio.to_thread(verify_password, data.current_password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Ancien mot de passe incorrect")
     
-    current_user.hashed_password = get_password_hash(data.new_password)
-    db.commit()
+    user.hashed_password = await asyncio.to_thread(get_password_hash, data.new_password)
+    await db.commit()
     return {"msg": "Mot de passe mis à jour avec succès"}
@@ -1,11 +1,13 @@
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer, APIKeyHeader
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.config import settings
-from app.db.database import get_db
+from app.db.database import get_async_db
 from app.db.models import User
 
 from app.core.security import decode_access_token
+from app.services.user_cache import get_user_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login", auto_error=False)
 api_key_header = APIKeyHeader(name="token", auto_error=False)
@@ -38,17 +40,29 @@ def get_token(
         
     return None
 
-def get_user_from_token(token: str, db: Session) -> User | None:
+async def _load_user(db: AsyncSession, key: tuple, condition, expires_at: float | None = None) -> User | None:
+    """Charge l'utilisateur et le met en cache, détaché de la session (il peut servir à d'autres requêtes)."""
+    user = await db.scalar(select(User).where(condition).limit(1))
+    if user is not None:
+        db.expunge(user)
+        get_user_cache().put(key, user, expires_at)
+    return user
+
+async def get_user_from_token(token: str, db: AsyncSession) -> User | None:
+    key = ("jwt", token)
+    user = get_user_cache().get(key)
+    if user is not None:
+        return user
     payload = decode_access_token(token)
     if not payload:
         return None
     email: str = payload.get("sub")
     if not email:
         return None
-    return db.query(User).filter(User.email == email).first()
+    return await _load_user(db, key, User.email == email, payload.get("exp"))
 
-def get_current_user(
-    db: Session = Depends(get_db),
+async def get_current_user(
+    db: AsyncSession = Depends(get_async_db),
     token: str | None = Depends(get_token),
     api_token: str = Depends(api_key_header)
 ):
@@ -61,27 +75,28 @@ def get_current_user(
     # Check custom API token first if provided
     if api_token:
         # On vérifie si ce token correspond directement au token d'API d'un compte systeme (ex: creator)
-        user = db.query(User).filter(User.api_token == api_token).first()
+        key = ("api", api_token)
+        user = get_user_cache().get(key) or await _load_user(db, key, User.api_token == api_token)
         if user:
             return user
 
     if not token:
         raise credentials_exception
 
-    user = get_user_from_token(token, db)
+    user = await get_user_from_token(token, db)
     if user is None:
         raise credentials_exception
         
     return user
 
-def get_current_user_optional(
-    db: Session = Depends(get_db),
+async def get_current_user_optional(
+    db: AsyncSession = Depends(get_async_db),
     token: str | None = Depends(get_token)
 ) -> User | None:
     """Retourne l'utilisateur courant s'il est loggé, sinon None. Ne lève pas d'exception 401."""
     if not token:
         return None
-    return get_user_from_token(token, db)
+    return await get_user_from_token(token, db)
 
 def get_current_active_user(current_user: User = Depends(get_current_user)):
     if not current_user.is_validated:
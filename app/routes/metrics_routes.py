@@ -0,0 +1,24 @@
+import asyncio
+import hmac
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.database import get_async_db
+from app.services.metrics import collect_gauges, render
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Métriques de tous les processus (serveur web et workers) au format texte Prometheus."""
+    if settings.METRICS_TOKEN:
+        expected = f"Bearer {settings.METRICS_TOKEN}"
+        if not hmac.compare_digest(request.headers.get("authorization", ""), expected):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    gauges = await db.run_sync(collect_gauges)
+    # Lecture des instantanés des autres processus hors de la boucle
+    body = await asyncio.to_thread(render, gauges)
+    return Response(body, media_type="text/plain; version=0.0.4; charset=utf-8")
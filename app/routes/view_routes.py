@@ -5,7 +5,7 @@ from sqlalchemy.orm import Session
 from app.db.database import get_db
 from app.db.models import SystemConfig, User
 from app.core.security import get_password_hash
-from app.services.webhook import send_discord_notification
+from app.services.webhook import enqueue_discord_notification, notify_webhooks
 from app.core.config import settings
 import os
 
@@ -112,7 +112,9 @@ async def register_user(
     config = db.query(SystemConfig).first()
     if config and config.discord_webhook:
         msg = f"🔔 Nouveau compte en attente de validation: {email}\nLien: {request.base_url}admin/users"
-        await send_discord_notification(config.discord_webhook, msg)
+        enqueue_discord_notification(db, config.discord_webhook, msg)
+        db.commit()
+        notify_webhooks()
         
     return templates.TemplateResponse("login.html", {"request": request, "app_prefix": _prefix, "success": "Registration successful. Please wait for an admin to validate your account before logging in."})
 
@@ -167,6 +169,8 @@ async def setup_creator(
     user_dir_path = os.path.join(settings.USERS_DIR, admin_user.directory_name)
     os.makedirs(user_dir_path, exist_ok=True)
     
-    await send_discord_notification(discord_webhook, f"✅ RPGPDF2Text is successfully configured and running! Creator email: {creator_email}")
+    enqueue_discord_notification(db, discord_webhook, f"✅ RPGPDF2Text is successfully configured and running! Creator email: {creator_email}")
+    db.commit()
+    notify_webhooks()
     return RedirectResponse(url=f"{_prefix}/login", status_code=302)
 
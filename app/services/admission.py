@@ -0,0 +1,190 @@
+"""
+Contrôle d'admission des demandes d'extraction.
+
+Chaque processus web tient en mémoire, par utilisateur, le nombre de demandes actives et les
+pages soumises sur l'heure glissante, ainsi que le coût total des demandes en attente. Cet état
+est rechargé depuis la base toutes les ADMISSION_REFRESH_INTERVAL secondes (`run_admission_refresh`)
+et complété localement à chaque admission : une soumission ne coûte aucune requête SQL.
+Une demande qui dépasserait un quota, ou un service saturé (coût en file, espace libre de
+TEMP_DIR), est refusée par `AdmissionRejected`, que les routes traduisent en 429 + Retry-After.
+"""
+import asyncio
+import math
+import shutil
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models import ExtractionRequest
+from app.services.job_queue import ACTIVE_STATUSES, UNKNOWN_JOB_COST
+from app.services.metrics import CallbackCounter
+from app.services.pdf_extractor import ExtractionEstimate
+
+# Fenêtre glissante du quota de pages (secondes)
+PAGES_WINDOW = 3600.0
+
+
+class AdmissionRejected(Exception):
+    """Demande refusée ; `retry_after` (s) vaut None si elle ne pourra jamais être admise en l'état."""
+
+    def __init__(self, detail: str, retry_after: Optional[float]):
+        super().__init__(detail)
+        self.retry_after = None if retry_after is None else max(1, math.ceil(retry_after))
+
+
+class AdmissionController:
+    """État d'admission en mémoire : demandes actives et pages récentes par utilisateur, coût en file."""
+
+    def __init__(self):
+        self._active: Dict[int, int] = {}
+        self._pages: Dict[int, Deque[Tuple[float, int]]] = {}
+        self._queued_cost = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def load(self, active: Dict[int, int], recent_pages: Iterable[Tuple[int, float, int]], queued_cost: int):
+        """Remplace l'état par celui lu en base ; `recent_pages` : (utilisateur, horodatage epoch, pages)."""
+        pages = defaultdict(deque)
+        for user_id, at, count in sorted(recent_pages, key=lambda row: row[1]):
+            pages[user_id].append((at, count))
+        self._active, self._pages, self._queued_cost = dict(active), dict(pages), queued_cost
+
+    def _window(self, user_id: int, now: float) -> Deque[Tuple[float, int]]:
+        window = self._pages.setdefault(user_id, deque())
+        while window and window[0][0] <= now - PAGES_WINDOW:
+            window.popleft()
+        return window
+
+    def _reject(self, detail: str, retry_after: Optional[float]):
+        self.rejected += 1
+        raise AdmissionRejected(detail, retry_after)
+
+    def check(self, user_id: int, jobs: int = 1):
+        """Vérification préalable, avant la réception des PDF : demandes actives, saturation, pages déjà consommées."""
+        if jobs > settings.ADMISSION_MAX_ACTIVE_JOBS:
+            # Plus de demandes que le plafond à elles seules : réessayer n'y changerait rien
+            self._reject(f"Submission exceeds the active extraction limit ({settings.ADMISSION_MAX_ACTIVE_JOBS} per user)",
+                         None)
+        if self._active.get(user_id, 0) + jobs > settings.ADMISSION_MAX_ACTIVE_JOBS:
+            self._reject(f"Too many active extractions (max {settings.ADMISSION_MAX_ACTIVE_JOBS} per user)",
+                         settings.ADMISSION_RETRY_AFTER)
+        if self._queued_cost >= settings.ADMISSION_MAX_QUEUED_COST:
+            self._reject("Extraction queue is saturated", settings.ADMISSION_RETRY_AFTER)
+        if shutil.disk_usage(settings.TEMP_DIR).free < settings.ADMISSION_MIN_FREE_DISK_MB * 1024 * 1024:
+            self._reject("Not enough disk space for new extractions", settings.ADMISSION_RETRY_AFTER)
+        now = time.time()
+        window = self._window(user_id, now)
+        used = sum(count for _, count in window)
+        if used >= settings.ADMISSION_PAGES_PER_HOUR:
+            self._reject(f"Hourly page quota exhausted ({settings.ADMISSION_PAGES_PER_HOUR} pages)",
+                         self._pages_retry_after(window, used - settings.ADMISSION_PAGES_PER_HOUR + 1, now))
+
+    def admit(self, user_id: int, estimates: List[Optional[ExtractionEstimate]]):
+        """Vérifie les quotas pour ces demandes puis les compte, sans point d'attente entre les deux."""
+        self.check(user_id, len(estimates))
+        pages = sum(e.pages for e in estimates if e is not None)
+        quota = settings.ADMISSION_PAGES_PER_HOUR
+        if pages > quota:
+            self._reject(f"Submission exceeds the hourly page quota ({quota} pages)", None)
+        now = time.time()
+        window = self._window(user_id, now)
+        used = sum(count for _, count in window)
+        if used + pages > quota:
+            self._reject(f"Hourly page quota exceeded ({quota} pages)",
+                         self._pages_retry_after(window, used + pages - quota, now))
+        self._active[user_id] = self._active.get(user_id, 0) + len(estimates)
+        window.append((now, pages))
+        self._queued_cost += sum(e.cost if e is not None else UNKNOWN_JOB_COST for e in estimates)
+        self.admitted += len(estimates)
+
+    @staticmethod
+    def _pages_retry_after(window: Deque[Tuple[float, int]], excess: int, now: float) -> float:
+        """Délai avant que les soumissions les plus anciennes sortent de la fenêtre et libèrent `excess` pages."""
+        freed = 0
+        for at, count in window:
+            freed += count
+            if freed >= excess:
+                return at + PAGES_WINDOW - now
+        return PAGES_WINDOW
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "active_jobs": sum(self._active.values()),
+            "queued_cost": self._queued_cost,
+        }
+
+
+# Contrôleur du processus web, initialisé paresseusement
+_admission: Optional[AdmissionController] = None
+
+
+def get_admission() -> AdmissionController:
+    global _admission
+    if _admission is None:
+        _admission = AdmissionController()
+    return _admission
+
+
+CallbackCounter(
+    "rpgpdf2txt_admission_total", "Demandes d'extraction admises ou refusées par le contrôle d'admission", ["result"],
+    lambda: {} if _admission is None else {("admitted",): _admission.admitted, ("rejected",): _admission.rejected},
+)
+
+
+def _epoch(at: datetime) -> float:
+    # SQLite rend des dates naïves, enregistrées en UTC
+    return (at if at.tzinfo else at.replace(tzinfo=timezone.utc)).timestamp()
+
+
+def load_admission_state(db: Session):
+    """Recharge l'état d'admission depuis la base (trois requêtes agrégées)."""
+    since = datetime.now(timezone.utc) - timedelta(seconds=PAGES_WINDOW)
+    active = dict(db.execute(
+        select(ExtractionRequest.user_id, func.count())
+        .where(ExtractionRequest.status.in_(ACTIVE_STATUSES))
+        .group_by(ExtractionRequest.user_id)
+    ).all())
+    queued_cost = db.scalar(
+        select(func.coalesce(func.sum(func.coalesce(ExtractionRequest.estimated_cost, UNKNOWN_JOB_COST)), 0))
+        .where(ExtractionRequest.status == "pending")
+    )
+    # Pages soumises sur l'heure écoulée ; une demande servie depuis le cache n'en consomme pas
+    recent = db.execute(
+        select(ExtractionRequest.user_id, ExtractionRequest.submitted_at, ExtractionRequest.page_count)
+        .where(
+            ExtractionRequest.submitted_at >= since,
+            ExtractionRequest.page_count.isnot(None),
+            ExtractionRequest.status != "success_cached",
+        )
+    ).all()
+    get_admission().load(active, [(user_id, _epoch(at), pages) for user_id, at, pages in recent], queued_cost)
+
+
+def _refresh():
+    db = SessionLocal()
+    try:
+        load_admission_state(db)
+    finally:
+        db.close()
+
+
+async def run_admission_refresh(stop_event: asyncio.Event):
+    """Recharge l'état d'admission toutes les ADMISSION_REFRESH_INTERVAL secondes jusqu'à `stop_event`."""
+    while not stop_event.is_set():
+        try:
+            await asyncio.to_thread(_refresh)
+        except Exception as e:
+            logger.error(f"Erreur de rechargement de l'état d'admission : {e}")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=settings.ADMISSION_REFRESH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
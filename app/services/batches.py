@@ -0,0 +1,172 @@
+"""
+Lots de demandes d'extraction (`POST /extract/batch`).
+
+Toutes les demandes d'un lot sont créées dans une seule transaction, dédoublonnées par
+empreinte de PDF : un PDF déjà extrait est servi depuis le cache et un PDF présent plusieurs
+fois dans le lot n'est conservé (et extrait) qu'une fois. Les demandes d'un lot n'envoient pas
+de webhook individuel : quand la dernière se termine, `complete_batch` passe le lot en
+`completed` par un UPDATE conditionnel (un seul processus l'emporte) et met en file, dans la
+même transaction, un unique webhook récapitulatif.
+"""
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import exists, select, update
+from sqlalchemy.orm import Session
+
+from app.db.database import SessionLocal
+from app.db.models import ExtractionBatch, ExtractionRequest
+from app.services.blob_store import discard_result
+from app.services.extractor_job import apply_cached_result, download_url
+from app.services.job_queue import ACTIVE_STATUSES
+from app.services.metrics import EXTRACTION_CACHE
+from app.services.pdf_extractor import ExtractionEstimate
+from app.services.webhook import enqueue_client_webhook, notify_webhooks
+
+_SUCCESS_STATUSES = ["success", "success_cached"]
+
+
+def find_cached_extractions(db: Session, file_hashes: Iterable[str]) -> Dict[str, ExtractionRequest]:
+    """Une extraction réussie par empreinte de PDF, en une seule requête pour tout le lot."""
+    rows = db.scalars(
+        select(ExtractionRequest)
+        .where(
+            ExtractionRequest.file_hash.in_(list(file_hashes)),
+            ExtractionRequest.status.in_(_SUCCESS_STATUSES),
+            ExtractionRequest.txt_file_path.isnot(None),
+        )
+        .order_by(ExtractionRequest.id)
+    ).all()
+    cached = {}
+    for row in rows:
+        cached.setdefault(row.file_hash, row)
+    return cached
+
+
+def create_batch(
+    db: Session, user_id: int, webhook_url: str, ia_validate: bool, items: List[Tuple[str, str, str, Optional[ExtractionEstimate]]]
+) -> Tuple[ExtractionBatch, List[ExtractionRequest], List[str]]:
+    """
+    Crée le lot et ses demandes ; `items` : (id_texte, chemin du PDF reçu, empreinte, estimation). Un `id_texte`
+    existant est relancé dans ce lot, comme avec `/extract`. L'appelant commite en une fois.
+    Renvoie le lot, ses demandes et les PDF reçus devenus inutiles (cache ou doublon) à supprimer.
+    """
+    batch = ExtractionBatch(user_id=user_id, webhook_url=webhook_url, status="pending", item_count=len(items))
+    db.add(batch)
+    db.flush()
+
+    existing = {
+        req.id_texte: req
+        for req in db.scalars(
+            select(ExtractionRequest).where(ExtractionRequest.id_texte.in_([item[0] for item in items]))
+        )
+    }
+    left_batches: Set[int] = set()
+    requests = []
+    submitted_at = datetime.now(timezone.utc)
+    for id_texte, _, file_hash, estimate in items:
+        req = existing.get(id_texte)
+        if req is None:
+            req = ExtractionRequest(id_texte=id_texte)
+            db.add(req)
+        else:
+            discard_result(db, req)
+            if req.batch_id is not None:
+                left_batches.add(req.batch_id)
+        req.user_id = user_id
+        req.batch_id = batch.id
+        req.status = "pending"
+        req.webhook_url = webhook_url
+        req.file_hash = file_hash
+        req.estimated_cost = estimate.cost if estimate is not None else None
+        req.page_count = estimate.pages if estimate is not None else None
+        req.submitted_at = submitted_at
+        req.ia_validate = ia_validate
+        req.error_message = None
+        req.completed_at = None
+        requests.append(req)
+    db.flush()
+
+    cached = find_cached_extractions(db, {item[2] for item in items})
+    kept_paths: Dict[str, str] = {}  # empreinte -> PDF conservé pour l'extraction
+    unused_paths = []
+    for req, (_, path, file_hash, _) in zip(requests, items):
+        source = cached.get(file_hash)
+        hit = source is not None and apply_cached_result(db, req, source)
+        EXTRACTION_CACHE.inc("reception", "hit" if hit else "miss")
+        if hit:
+            req.file_path = None
+            unused_paths.append(path)
+        elif file_hash in kept_paths:
+            # Doublon dans le lot : même PDF, extrait une seule fois (la réservation attend l'autre demande)
+            req.file_path = kept_paths[file_hash]
+            req.page_count = None  # pages décomptées une seule fois du quota horaire
+            unused_paths.append(path)
+        else:
+            kept_paths[file_hash] = path
+            req.file_path = path
+
+    # Un lot entièrement servi depuis le cache est terminé tout de suite ; un lot dont une demande
+    # relancée est partie peut l'être aussi
+    for batch_id in [batch.id, *left_batches]:
+        complete_batch(db, batch_id)
+    return batch, requests, unused_paths
+
+
+def batch_summary(db: Session, batch_id: int) -> List[dict]:
+    """Récapitulatif des demandes du lot, tel qu'envoyé dans le webhook."""
+    items = []
+    for req in db.scalars(
+        select(ExtractionRequest).where(ExtractionRequest.batch_id == batch_id).order_by(ExtractionRequest.id)
+    ):
+        item = {"id_texte": req.id_texte}
+        if req.status in _SUCCESS_STATUSES:
+            item.update(etat="succès", url=download_url(req))
+        else:
+            item.update(etat="échec", erreur=req.error_message)
+        items.append(item)
+    return items
+
+
+def complete_batch(db: Session, batch_id: int) -> bool:
+    """
+    Termine le lot si plus aucune de ses demandes n'est active et met en file son webhook
+    récapitulatif ; l'appelant commite. Renvoie False si le lot n'est pas (ou est déjà) terminé.
+    """
+    db.flush()
+    completed = db.execute(
+        update(ExtractionBatch)
+        .where(
+            ExtractionBatch.id == batch_id,
+            ExtractionBatch.status == "pending",
+            ~exists().where(
+                ExtractionRequest.batch_id == batch_id,
+                ExtractionRequest.status.in_(ACTIVE_STATUSES),
+            ),
+        )
+        .values(status="completed", completed_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not completed:
+        return False
+    batch = db.get(ExtractionBatch, batch_id, populate_existing=True)
+    items = batch_summary(db, batch_id)
+    failed = sum(1 for item in items if item["etat"] == "échec")
+    enqueue_client_webhook(db, batch.webhook_url, {
+        "message": "Le lot d'extractions est terminé.",
+        "etat": "succès" if not failed else ("échec" if failed == len(items) else "partiel"),
+        "lot": batch_id,
+        "demandes": items,
+    })
+    return True
+
+
+def complete_batch_in_session(batch_id: int):
+    """Vérifie la complétion du lot après la fin d'une de ses demandes (session dédiée)."""
+    db = SessionLocal()
+    try:
+        if complete_batch(db, batch_id):
+            db.commit()
+            notify_webhooks()
+    finally:
+        db.close()
@@ -0,0 +1,292 @@
+"""
+Stockage des textes résultats adressé par leur contenu.
+
+Chaque texte est écrit une seule fois sous DATA_DIR/blobs/<aa>/<bb>/<sha256>.txt (avec ses
+variantes compressées) ; les demandes y renvoient par `result_hash` / `txt_file_path` et la
+table `result_blobs` compte les références. Supprimer une demande ne fait que décrémenter ce
+compteur : le ramasse-miettes (`run_blob_gc`) supprime les blobs qui ne sont plus référencés
+depuis BLOB_GC_GRACE secondes, et reprend au passage les anciens fichiers par utilisateur.
+"""
+import asyncio
+import hashlib
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import case, event, func, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models import ExtractionRequest, ResultBlob
+from app.services.text_variants import remove_variants, write_compressed_variants
+
+_RESULT_STATUSES = ["success", "success_cached"]
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(settings.DATA_DIR, "blobs", sha256[:2], sha256[2:4], f"{sha256}.txt")
+
+
+def _write_blob(path: str, data: bytes):
+    """Écrit le blob s'il n'existe pas (écriture atomique), puis ses variantes compressées."""
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    write_compressed_variants(path)
+
+
+def _insert(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def _acquire(db: Session, sha256: str, size: int, count: int = 1):
+    """Ajoute `count` références au blob, en créant sa ligne si besoin (upsert atomique)."""
+    insert = _insert(db)
+    db.execute(
+        insert(ResultBlob)
+        .values(sha256=sha256, size=size, refcount=count, released_at=None)
+        .on_conflict_do_update(
+            index_elements=[ResultBlob.sha256],
+            set_={"refcount": ResultBlob.refcount + count, "released_at": None},
+        )
+    )
+
+
+def _set_result(req: ExtractionRequest, sha256: Optional[str], path: Optional[str], filename: Optional[str]):
+    req.result_hash = sha256
+    req.txt_file_path = path
+    req.result_filename = filename
+
+
+def write_blob(text: str) -> Tuple[str, bytes]:
+    """Écrit le texte dans le stockage s'il n'y est pas déjà (fichier et variantes) ; renvoie (empreinte, octets)."""
+    data = text.encode("utf-8")
+    sha256 = hashlib.sha256(data).hexdigest()
+    _write_blob(blob_path(sha256), data)
+    return sha256, data
+
+
+def attach_blob(db: Session, req: ExtractionRequest, blob: Tuple[str, bytes], filename: str):
+    """Fait pointer `req` sur un blob écrit par `write_blob` en prenant une référence ; l'appelant commite."""
+    sha256, data = blob
+    path = blob_path(sha256)
+    release_result(db, req)
+    _acquire(db, sha256, len(data))
+    _set_result(req, sha256, path, filename)
+    # Vérifié après le commit : le ramasse-miettes a pu supprimer un blob identique entre-temps
+    db.info.setdefault("pending_blobs", {})[path] = data
+
+
+def store_result(db: Session, req: ExtractionRequest, text: str, filename: str):
+    """Range le texte dans le stockage (une seule copie par contenu) et y fait pointer `req` ; l'appelant commite."""
+    attach_blob(db, req, write_blob(text), filename)
+
+
+def share_result(db: Session, req: ExtractionRequest, source: ExtractionRequest, filename: str) -> bool:
+    """
+    Fait pointer `req` sur le texte de `source` en prenant une référence (l'appelant commite).
+    Renvoie False si ce texte n'est plus disponible (la demande doit alors être traitée).
+    """
+    if source.result_hash:
+        taken = db.execute(
+            update(ResultBlob)
+            .where(ResultBlob.sha256 == source.result_hash)
+            .values(refcount=ResultBlob.refcount + 1, released_at=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not taken:
+            return False
+        release_result(db, req)
+        _set_result(req, source.result_hash, source.txt_file_path, filename)
+        return True
+    # Ancien fichier par utilisateur : le texte rejoint le stockage partagé
+    try:
+        with open(source.txt_file_path, "r", encoding="utf-8") as f:
+            text = f.read()
+    except OSError:
+        return False
+    store_result(db, req, text, filename)
+    return True
+
+
+def release_result(db: Session, req: ExtractionRequest):
+    """Rend la référence de `req` à son blob et détache son résultat (l'appelant commite)."""
+    if not req.result_hash:
+        return
+    db.execute(
+        update(ResultBlob)
+        .where(ResultBlob.sha256 == req.result_hash)
+        .values(
+            refcount=ResultBlob.refcount - 1,
+            released_at=case((ResultBlob.refcount <= 1, datetime.now(timezone.utc)), else_=ResultBlob.released_at),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    _set_result(req, None, None, None)
+
+
+def discard_result(db: Session, req: ExtractionRequest):
+    """
+    Libère le résultat d'une demande supprimée ou relancée. Un ancien fichier par utilisateur
+    n'est effacé que si aucune autre demande n'y renvoie.
+    """
+    if req.result_hash:
+        release_result(db, req)
+        return
+    path = req.txt_file_path
+    if not path:
+        return
+    db.flush()  # les suppressions en cours de la session comptent dans la vérification
+    others = db.scalar(
+        select(func.count()).select_from(ExtractionRequest)
+        .where(ExtractionRequest.txt_file_path == path, ExtractionRequest.id != req.id)
+    )
+    _set_result(req, None, None, None)
+    if others:
+        return
+    try:
+        os.remove(path)
+        remove_variants(path)
+        logger.info(f"Fichier supprimé: {path}")
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.error(f"Erreur lors de la suppression de {path}: {e}")
+
+
+def result_download_name(req: ExtractionRequest) -> str:
+    return req.result_filename or os.path.basename(req.txt_file_path)
+
+
+@event.listens_for(Session, "after_commit")
+def _ensure_committed_blobs(session: Session):
+    for path, data in session.info.pop("pending_blobs", {}).items():
+        try:
+            _write_blob(path, data)
+        except OSError as e:
+            logger.error(f"Blob {path} non réécrit : {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_pending_blobs(session: Session):
+    session.info.pop("pending_blobs", None)
+
+
+def collect_garbage(db: Session) -> int:
+    """Supprime les blobs sans référence depuis plus de BLOB_GC_GRACE secondes ; renvoie leur nombre."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.BLOB_GC_GRACE)
+    candidates = db.scalars(
+        select(ResultBlob.sha256).where(ResultBlob.refcount <= 0, ResultBlob.released_at < cutoff)
+    ).all()
+    removed = 0
+    for sha256 in candidates:
+        # Suppression conditionnelle : une demande a pu reprendre une référence depuis la sélection
+        deleted = db.execute(
+            ResultBlob.__table__.delete().where(ResultBlob.sha256 == sha256, ResultBlob.refcount <= 0)
+        ).rowcount
+        db.commit()
+        if not deleted:
+            continue
+        path = blob_path(sha256)
+        trash = f"{path}.{uuid.uuid4().hex}.gc"
+        try:
+            os.replace(path, trash)
+        except FileNotFoundError:
+            remove_variants(path)
+            continue
+        # Un résultat identique a pu être rangé entre la suppression de la ligne et le renommage
+        if db.get(ResultBlob, sha256, populate_existing=True) is not None:
+            if not os.path.exists(path):
+                os.replace(trash, path)
+            else:
+                os.remove(trash)
+            continue
+        os.remove(trash)
+        remove_variants(path)
+        removed += 1
+    return removed
+
+
+def migrate_legacy_results(db: Session, limit: int = 100) -> int:
+    """Range dans le stockage partagé les anciens fichiers par utilisateur ; renvoie le nombre de fichiers repris."""
+    paths = db.scalars(
+        select(ExtractionRequest.txt_file_path)
+        .where(
+            ExtractionRequest.result_hash.is_(None),
+            ExtractionRequest.txt_file_path.isnot(None),
+            ExtractionRequest.status.in_(_RESULT_STATUSES),
+        )
+        .distinct()
+        .limit(limit)
+    ).all()
+    migrated = 0
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            # Fichier disparu : la demande n'a plus de résultat téléchargeable
+            db.execute(
+                update(ExtractionRequest).where(ExtractionRequest.txt_file_path == path)
+                .values(txt_file_path=None).execution_options(synchronize_session=False)
+            )
+            db.commit()
+            continue
+        sha256 = hashlib.sha256(data).hexdigest()
+        _write_blob(blob_path(sha256), data)
+        rows = db.scalars(select(ExtractionRequest).where(
+            ExtractionRequest.txt_file_path == path, ExtractionRequest.result_hash.is_(None)
+        )).all()
+        _acquire(db, sha256, len(data), count=len(rows))
+        for req in rows:
+            _set_result(req, sha256, blob_path(sha256), req.result_filename or os.path.basename(path))
+        db.commit()
+        os.remove(path)
+        remove_variants(path)
+        migrated += 1
+    return migrated
+
+
+def _gc_pass() -> tuple:
+    db = SessionLocal()
+    try:
+        migrated = 0
+        while True:
+            batch = migrate_legacy_results(db)
+            migrated += batch
+            if batch == 0:
+                break
+        return migrated, collect_garbage(db)
+    finally:
+        db.close()
+
+
+async def run_blob_gc(stop_event: asyncio.Event):
+    """Boucle du ramasse-miettes des blobs (toutes les BLOB_GC_INTERVAL secondes) jusqu'à `stop_event`."""
+    while not stop_event.is_set():
+        try:
+            migrated, removed = await asyncio.to_thread(_gc_pass)
+            if migrated or removed:
+                logger.info(f"Stockage des résultats : {migrated} ancien(s) fichier(s) repris, {removed} blob(s) supprimé(s).")
+        except Exception as e:
+            logger.error(f"Erreur du ramasse-miettes des blobs : {e}")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=settings.BLOB_GC_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
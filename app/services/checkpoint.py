@@ -0,0 +1,96 @@
+import json
+import os
+import shutil
+from typing import Dict, List
+
+from loguru import logger
+
+from app.core.config import settings
+
+
+class JobCheckpoint:
+    """
+    Points de reprise d'une demande d'extraction : un journal JSON Lines par étape
+    (`ocr` : pages OCRisées, `hf` : morceaux corrigés) sous `DATA_DIR/checkpoints/<id>/`.
+
+    Chaque résultat est ajouté dès qu'il est obtenu ; après un arrêt brutal, la demande
+    remise en file reprend là où elle s'était arrêtée. Les journaux sont liés à l'empreinte
+    du PDF : un autre fichier soumis sous la même demande repart de zéro.
+    """
+
+    def __init__(self, request_id: int, file_hash: str):
+        self.directory = os.path.join(settings.DATA_DIR, "checkpoints", str(request_id))
+        self.file_hash = file_hash
+        self._ready = set()
+
+    def _path(self, stage: str) -> str:
+        return os.path.join(self.directory, f"{stage}.jsonl")
+
+    def load(self, stage: str) -> Dict[int, dict]:
+        """Renvoie {index: entrée} des résultats déjà enregistrés pour cette étape."""
+        entries = {}
+        try:
+            with open(self._path(stage), "r", encoding="utf-8") as f:
+                header = json.loads(f.readline() or "{}")
+                if header.get("file_hash") != self.file_hash:
+                    return {}
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Dernière ligne tronquée par l'arrêt brutal : ignorée
+                        continue
+                    entries[entry["index"]] = entry
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Point de reprise illisible ({self._path(stage)}), ignoré : {e}")
+            return {}
+        if entries:
+            logger.info(f"Reprise : {len(entries)} résultat(s) '{stage}' déjà enregistré(s).")
+        return entries
+
+    def append(self, stage: str, index: int, **values):
+        """Ajoute un résultat au journal de l'étape (créé avec son en-tête si besoin)."""
+        self.extend(stage, [{"index": index, **values}])
+
+    def extend(self, stage: str, entries: List[dict]):
+        """Ajoute plusieurs résultats (`{"index": ..., ...}`) au journal de l'étape avec un seul fsync."""
+        path = self._path(stage)
+        try:
+            if stage not in self._ready:
+                self._prepare(path)
+                self._ready.add(stage)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            # Un point de reprise manquant ne fait que ralentir une éventuelle reprise
+            logger.warning(f"Écriture du point de reprise impossible ({path}) : {e}")
+
+    def _prepare(self, path: str):
+        """
+        Avant le premier ajout : journal (re)créé avec son en-tête s'il manque ou vise un autre PDF,
+        sinon ramené à sa dernière ligne complète (une ligne tronquée par un arrêt brutal
+        absorberait l'ajout suivant, perdu à la reprise).
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        if not self._valid_header(path):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"file_hash": self.file_hash}) + "\n")
+            return
+        with open(path, "rb+") as f:
+            data = f.read()
+            if not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def _valid_header(self, path: str) -> bool:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.loads(f.readline() or "{}").get("file_hash") == self.file_hash
+        except (OSError, ValueError):
+            return False
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
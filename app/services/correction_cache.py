@@ -0,0 +1,36 @@
+import hashlib
+import os
+from typing import Optional
+
+from app.core.config import settings
+from app.services.disk_cache import DiskCache
+from app.services.metrics import CallbackCounter, cache_lookups
+
+# Cache global initialisé paresseusement, partagé par tous les utilisateurs
+_correction_cache: Optional[DiskCache] = None
+
+
+def get_correction_cache() -> DiskCache:
+    global _correction_cache
+    if _correction_cache is None:
+        _correction_cache = DiskCache(
+            os.path.join(settings.DATA_DIR, "cache", "corrections"),
+            settings.CORRECTION_CACHE_MAX_MB * 1024 * 1024,
+            max_age=settings.CORRECTION_CACHE_MAX_AGE_DAYS * 86400,
+        )
+    return _correction_cache
+
+
+CallbackCounter(
+    "rpgpdf2txt_correction_cache_lookups_total", "Recherches dans le cache des morceaux corrigés", ["result"],
+    lambda: cache_lookups(_correction_cache),
+)
+
+
+def correction_cache_key(model: str, prompt_version: str, chunk: str) -> str:
+    """
+    Empreinte (modèle, version du prompt, contenu du morceau). Un même morceau
+    (mentions légales, encadrés répétés, réédition d'un PDF) n'est donc corrigé qu'une fois.
+    """
+    chunk_hash = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{model}|v{prompt_version}|{chunk_hash}".encode()).hexdigest()
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+import uuid
+from typing import Optional
+
+from loguru import logger
+
+
+class DiskCache:
+    """
+    Cache clé/valeur texte persistant sur disque, borné en taille avec éviction LRU.
+
+    Chaque entrée est un fichier `<répertoire>/<2 premiers caractères>/<clé>.txt`.
+    La date de modification sert d'horodatage d'accès : elle est rafraîchie à chaque lecture,
+    l'éviction supprime donc les entrées les moins récemment utilisées.
+    Avec `max_age` (secondes), les entrées inutilisées depuis plus longtemps sont
+    ignorées à la lecture et supprimées lors de l'éviction.
+    Les écritures sont atomiques (fichier temporaire + rename) : plusieurs processus
+    peuvent partager le même répertoire.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_age: Optional[float] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._size: Optional[int] = None
+        self._next_sweep = 0.0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.txt")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            if self.max_age and os.path.getmtime(path) < time.time() - self.max_age:
+                self.misses += 1
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                value = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except OSError as e:
+            logger.warning(f"Lecture du cache impossible ({path}) : {e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        data = value.encode("utf-8")
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Écriture du cache impossible ({path}) : {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data)
+            over_budget = self._size > self.max_bytes
+            # Purge périodique des entrées expirées, même sous le budget
+            sweep_due = bool(self.max_age) and time.time() >= self._next_sweep
+        if over_budget or sweep_due:
+            self.evict()
+
+    def _entries(self):
+        """Liste (mtime, taille, chemin) de toutes les entrées du cache."""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith(".txt"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """
+        Supprime les entrées expirées, puis les moins récemment utilisées
+        jusqu'à 90 % du budget.
+        """
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            target = int(self.max_bytes * 0.9)
+            expiry = time.time() - self.max_age if self.max_age else None
+            removed = 0
+            for mtime, size, path in entries:
+                expired = expiry is not None and mtime < expiry
+                if total <= target and not expired:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    removed += 1
+                except FileNotFoundError:
+                    continue
+            self._size = total
+            if self.max_age:
+                self._next_sweep = time.time() + min(self.max_age / 10, 3600)
+        if removed:
+            logger.info(f"Cache {self.directory} : {removed} entrée(s) évincée(s), {total // 1024} Ko restants.")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size_bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import os
+import re
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Optional
+
+import aiofiles
+import httpx
+from loguru import logger
+
+from app.core.config import settings
+
+# Taille des blocs lus depuis le réseau et écrits sur disque
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Taille maximale lue d'une page HTML de Google Drive (avertissement « fichier volumineux »)
+_DRIVE_HTML_MAX_BYTES = 1024 * 1024
+
+# Client HTTP partagé (pool de connexions), initialisé paresseusement dans la boucle courante
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+class DownloadError(Exception):
+    """Téléchargement impossible ou contenu refusé (message destiné au client de l'API)."""
+
+
+class DownloadTooLarge(DownloadError):
+    pass
+
+
+def _build_client(**kwargs) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        follow_redirects=True,
+        timeout=httpx.Timeout(settings.DOWNLOAD_TIMEOUT, connect=10.0),
+        limits=httpx.Limits(max_connections=settings.DOWNLOAD_MAX_CONNECTIONS, max_keepalive_connections=10),
+        headers={"User-Agent": f"{settings.PROJECT_NAME}/1.0"},
+        # Le client sert les téléchargements de tous les utilisateurs : il ne garde aucun cookie
+        # (ceux de Google Drive passent par l'en-tête explicite de `_download_google_drive`)
+        cookies=CookieJar(DefaultCookiePolicy(allowed_domains=[])),
+        **kwargs,
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = _build_client()
+        _client_loop = loop
+    return _client
+
+
+async def close_http_client():
+    global _client, _client_loop
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+
+def google_drive_file_id(url: str) -> Optional[str]:
+    """Identifiant du fichier d'un lien Google Drive (`/d/<id>` ou `id=<id>`), None si absent."""
+    match = re.search(r"/d/([^/]+)", url) or re.search(r"id=([^&]+)", url)
+    return match.group(1) if match else None
+
+
+async def _stream_to_file(response: httpx.Response, dest_path: str) -> str:
+    """Écrit la réponse par blocs en vérifiant la signature PDF et la taille ; renvoie le SHA-256."""
+    max_bytes = settings.DOWNLOAD_MAX_MB * 1024 * 1024
+    declared = response.headers.get("Content-Length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise DownloadTooLarge(f"File too large ({int(declared) // (1024 * 1024)} MB > {settings.DOWNLOAD_MAX_MB} MB)")
+
+    sha256_hash = hashlib.sha256()
+    total = 0
+    head = b""
+    try:
+        async with aiofiles.open(dest_path, "wb") as out:
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                # Signature vérifiée dès les premiers octets : inutile de télécharger une page HTML entière
+                if len(head) < 4:
+                    head += chunk[:4 - len(head)]
+                    if len(head) >= 4 and head != b"%PDF":
+                        raise DownloadError("URL did not return a valid PDF (private file or invalid link?)")
+                total += len(chunk)
+                if total > max_bytes:
+                    raise DownloadTooLarge(f"File too large (> {settings.DOWNLOAD_MAX_MB} MB)")
+                sha256_hash.update(chunk)
+                await out.write(chunk)
+        if head != b"%PDF":
+            raise DownloadError("URL did not return a valid PDF (private file or invalid link?)")
+    except BaseException:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+    return sha256_hash.hexdigest()
+
+
+async def _download_google_drive(client: httpx.AsyncClient, file_id: str, dest_path: str) -> str:
+    logger.info(f"Lien Google Drive détecté (ID: {file_id}), utilisation de la logique robuste...")
+    # 1. Tentative initiale pour obtenir le cookie et éventuellement le token de confirmation
+    download_url = f"https://drive.google.com/uc?export=download&id={file_id}"
+    async with client.stream("GET", download_url) as response:
+        response.raise_for_status()
+        if "text/html" not in response.headers.get("Content-Type", ""):
+            return await _stream_to_file(response, dest_path)
+
+        # 2. Vérification si Google demande une confirmation pour les gros fichiers
+        confirm_token = None
+        for key, value in response.cookies.items():
+            if key.startswith("download_warning"):
+                confirm_token = value
+                break
+        if not confirm_token:
+            body = b""
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) >= _DRIVE_HTML_MAX_BYTES:
+                    break
+            confirm_match = re.search(r"confirm=([0-9A-Za-z_]+)", body.decode("utf-8", "replace"))
+            if confirm_match:
+                confirm_token = confirm_match.group(1)
+        cookie_header = "; ".join(f"{k}={v}" for k, v in response.cookies.items())
+
+    if not confirm_token:
+        raise DownloadError("Google Drive link did not return a valid PDF (private file or invalid link?)")
+
+    logger.info(f"Token de confirmation détecté ({confirm_token}), second passage...")
+    download_url = f"https://drive.google.com/uc?export=download&id={file_id}&confirm={confirm_token}"
+    headers = {"Cookie": cookie_header} if cookie_header else None
+    async with client.stream("GET", download_url, headers=headers) as response:
+        response.raise_for_status()
+        return await _stream_to_file(response, dest_path)
+
+
+async def _download(client: httpx.AsyncClient, url: str, dest_path: str) -> str:
+    if "drive.google.com" in url:
+        file_id = google_drive_file_id(url)
+        if not file_id:
+            raise DownloadError("Invalid Google Drive link format")
+        return await _download_google_drive(client, file_id, dest_path)
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        return await _stream_to_file(response, dest_path)
+
+
+async def download_pdf(url: str, dest_path: str, client: Optional[httpx.AsyncClient] = None) -> str:
+    """
+    Télécharge un PDF (lien direct ou Google Drive) vers `dest_path` sans bloquer la boucle
+    d'événements, et renvoie son empreinte SHA-256 calculée pendant le transfert.
+    Lève `DownloadError` (ou `DownloadTooLarge`) si le contenu est refusé.
+    """
+    client = client or get_http_client()
+    try:
+        # Délai global en plus des délais par opération : un serveur qui distille les octets ne bloque pas indéfiniment
+        file_hash = await asyncio.wait_for(_download(client, url, dest_path), timeout=settings.DOWNLOAD_TOTAL_TIMEOUT)
+    except asyncio.TimeoutError as e:
+        raise DownloadError(f"Download timed out after {settings.DOWNLOAD_TOTAL_TIMEOUT} s") from e
+    except httpx.HTTPError as e:
+        raise DownloadError(f"Failed to download from URL: {e}") from e
+    logger.info(f"Téléchargement réussi: {dest_path}")
+    return file_hash
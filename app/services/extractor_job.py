@@ -3,187 +3,283 @@ from datetime import datetime, timezone
 from loguru import logger
 from sqlalchemy.orm import Session
 from app.db.database import engine, SessionLocal
-from app.db.models import ExtractionRequest, SystemConfig, User
-from app.services.pdf_extractor import extract_text_from_pdf
+from app.db.models import ExtractionRequest, SystemConfig
+from app.services.pdf_extractor import extract_pdf_async
+from app.services.checkpoint import JobCheckpoint
+from app.services.progress import ProgressReporter
 from app.services.hf_corrector import correct_text_with_hf
-from app.services.webhook import send_client_webhook
+from app.services.webhook import enqueue_client_webhook, notify_webhooks
+from app.services.job_queue import ACTIVE_STATUSES
+from app.services.blob_store import attach_blob, result_download_name, share_result, write_blob
+from app.services.metrics import EXTRACTION_CACHE, JOB_SECONDS, JOBS, PAGES, QUEUE_WAIT_SECONDS, StageTimer
 from app.core.config import settings
 from app.core.security import create_access_token
 from datetime import timedelta
+from typing import Optional
 import hashlib
 import asyncio
+import time
 
-# Sémaphore global initialisé paresseusement
-_extraction_lock = None
+def find_cached_extraction(db: Session, file_hash: str, exclude_id: Optional[int] = None) -> Optional[ExtractionRequest]:
+    """Renvoie une extraction réussie du même PDF dont le fichier texte existe encore, sinon None."""
+    query = db.query(ExtractionRequest).filter(
+        ExtractionRequest.file_hash == file_hash,
+        ExtractionRequest.status.in_(["success", "success_cached"]),
+        ExtractionRequest.txt_file_path.isnot(None),
+    )
+    if exclude_id is not None:
+        query = query.filter(ExtractionRequest.id != exclude_id)
+    cached_req = query.first()
+    if cached_req and os.path.exists(cached_req.txt_file_path):
+        return cached_req
+    return None
 
-def get_extraction_lock():
-    global _extraction_lock
-    if _extraction_lock is None:
-        _extraction_lock = asyncio.Semaphore(settings.MAX_CONCURRENT_EXTRACTIONS)
-    return _extraction_lock
+def pdf_file_in_use(db: Session, pdf_path: str, exclude_id: int) -> bool:
+    """Vrai si une autre demande active (doublon d'un lot) doit encore lire ce PDF."""
+    return db.query(ExtractionRequest.id).filter(
+        ExtractionRequest.file_path == pdf_path,
+        ExtractionRequest.status.in_(ACTIVE_STATUSES),
+        ExtractionRequest.id != exclude_id,
+    ).first() is not None
+
+def result_filename(req: ExtractionRequest, truncated: bool = False) -> str:
+    """Nom proposé au téléchargement : `<horodatage>_<id_texte>[_IA_truncated].txt`."""
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    suffix = "_IA_truncated" if truncated else ""
+    return f"{timestamp}_{req.id_texte}{suffix}.txt"
+
+def apply_cached_result(db: Session, req: ExtractionRequest, cached_req: ExtractionRequest) -> bool:
+    """
+    Marque `req` comme servie depuis le cache en partageant le texte de `cached_req` (l'appelant commite).
+    Renvoie False si ce texte n'est plus disponible : la demande doit alors être extraite.
+    """
+    truncated = result_download_name(cached_req).endswith("_IA_truncated.txt")
+    if not share_result(db, req, cached_req, result_filename(req, truncated)):
+        return False
+    req.page_count = cached_req.page_count
+    req.ocr_page_count = cached_req.ocr_page_count
+    req.status = "success_cached"
+    req.error_message = None
+    req.completed_at = datetime.now(timezone.utc)
+    return True
+
+def download_url(req: ExtractionRequest) -> str:
+    """Lien de téléchargement du résultat, signé par un jeton dédié à cette demande."""
+    # Create a single-use or long-lived download token specifically for this request
+    download_token = create_access_token(
+        data={"sub": str(req.id), "type": "download"},
+        expires_delta=timedelta(days=365)
+    )
+    return f"{settings.EXTERNAL_URL}{settings.API_V1_STR}/extract/{req.id}/download?token={download_token}"
+
+def _queue_wait(req: ExtractionRequest) -> Optional[float]:
+    """Secondes entre la soumission et la réservation (dates SQLite naïves, enregistrées en UTC)."""
+    submitted = req.submitted_at or req.created_at
+    if req.started_at is None or submitted is None:
+        return None
+    as_utc = lambda at: at if at.tzinfo else at.replace(tzinfo=timezone.utc)
+    return max(0.0, (as_utc(req.started_at) - as_utc(submitted)).total_seconds())
+
+def queue_success_webhook(db: Session, req: ExtractionRequest, text: str, from_cache: bool = False):
+    """Ajoute à la boîte d'envoi le webhook client (lien de téléchargement et extrait) ; l'appelant commite."""
+    if req.batch_id is not None:
+        return  # Demande d'un lot : un seul webhook récapitulatif à la complétion du lot
+    logger.info(f"Étape 4/4 : Notification du webhook mise en file : {req.webhook_url}")
+    excerpt = text[:500]
+    if len(text) > 500:
+        excerpt += "..."
+
+    enqueue_client_webhook(db, req.webhook_url, {
+        "message": "L'extraction est terminée (depuis le cache)." if from_cache else "L'extraction est terminée.",
+        "etat": "succès",
+        "id_texte": req.id_texte,
+        "url": download_url(req),
+        "extrait": excerpt
+    })
+
+def queue_error_webhook(db: Session, req: ExtractionRequest):
+    """Ajoute à la boîte d'envoi le webhook d'échec de la demande ; l'appelant commite."""
+    if req.batch_id is not None:
+        return
+    enqueue_client_webhook(db, req.webhook_url, {
+        "message": "L'extraction a échoué.",
+        "etat": "échec",
+        "id_texte": req.id_texte,
+        "erreur": req.error_message
+    })
 
 async def process_extraction(request_id: int):
-    # This runs in background
+    """
+    Traite une demande réservée par un worker (`app.worker`) : la demande est déjà en `processing`.
+    La concurrence est bornée par le nombre de demandes qu'un worker réserve simultanément.
+    """
     db: Session = SessionLocal()
+    req = None
+    # Une demande interrompue (arrêt du worker) est remise en file : son PDF et ses points de reprise sont conservés
+    keep_file = False
+    checkpoint = None
+    # Durée de chaque étape et issue de la demande (métriques `/metrics`)
+    stages = StageTimer()
+    job_start = time.perf_counter()
+    outcome = "error"
     try:
         req = db.query(ExtractionRequest).filter(ExtractionRequest.id == request_id).first()
         if not req:
             logger.warning(f"Demande d'extraction {request_id} non trouvée en base.")
+            outcome = None
             return
             
         logger.info(f"Début du traitement de la demande {request_id} (ID Texte: {req.id_texte})")
-        req.status = "processing"
+        progress = ProgressReporter(request_id)
+        queue_wait = _queue_wait(req)
+        if queue_wait is not None:
+            QUEUE_WAIT_SECONDS.observe(queue_wait)
         
-        # 0. Calcul du hash et vérification du cache
-        logger.info(f"Étape 0/4 : Calcul de l'empreinte du fichier '{req.file_path}'")
-        sha256_hash = hashlib.sha256()
-        with open(req.file_path, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-        file_hash = sha256_hash.hexdigest()
-        req.file_hash = file_hash
+        # 0. Calcul du hash (sauf s'il a déjà été calculé à la réception) et vérification du cache
+        if req.file_hash:
+            file_hash = req.file_hash
+        else:
+            logger.info(f"Étape 0/4 : Calcul de l'empreinte du fichier '{req.file_path}'")
+            stages.start("hashing")
+            progress.report("hashing")
+            sha256_hash = hashlib.sha256()
+            with open(req.file_path, "rb") as f:
+                for byte_block in iter(lambda: f.read(1024 * 1024), b""):
+                    sha256_hash.update(byte_block)
+            file_hash = sha256_hash.hexdigest()
+            req.file_hash = file_hash
         
-        cached_req = db.query(ExtractionRequest).filter(
-            ExtractionRequest.file_hash == file_hash,
-            ExtractionRequest.status.in_(["success", "success_cached"]),
-            ExtractionRequest.txt_file_path.isnot(None),
-            ExtractionRequest.id != request_id
-        ).first()
+        stages.start("cache")
+        cached_req = find_cached_extraction(db, file_hash, exclude_id=request_id)
 
-        if cached_req and os.path.exists(cached_req.txt_file_path):
+        if cached_req and apply_cached_result(db, req, cached_req):
+            EXTRACTION_CACHE.inc("worker", "hit")
+            outcome = "cached"
             logger.info(f"Cache hit! Réutilisation de l'extraction de la demande {cached_req.id} (Hash: {file_hash})")
-            req.txt_file_path = cached_req.txt_file_path
-            req.status = "success_cached"
-            req.completed_at = datetime.now(timezone.utc)
-            db.commit()
-            
             with open(req.txt_file_path, "r", encoding="utf-8") as f:
                 corrected_text = f.read()
             
-            # Aller directement à l'étape 4 (Webhook)
-            logger.info(f"Étape 4/4 : Envoi de la notification au webhook : {req.webhook_url}")
-            excerpt = corrected_text[:500]
-            if len(corrected_text) > 500:
-                excerpt += "..."
-                
-            download_token = create_access_token(
-                data={"sub": str(req.id), "type": "download"}, 
-                expires_delta=timedelta(days=365)
-            )
-            download_url = f"{settings.EXTERNAL_URL}{settings.API_V1_STR}/extract/{req.id}/download?token={download_token}"
-
-            await send_client_webhook(req.webhook_url, {
-                "message": "L'extraction est terminée (depuis le cache).",
-                "etat": "succès",
-                "id_texte": req.id_texte,
-                "url": download_url,
-                "extrait": excerpt
-            })
+            # Aller directement à l'étape 4 (Webhook), validé avec le changement de statut
+            queue_success_webhook(db, req, corrected_text, from_cache=True)
+            db.commit()
+            notify_webhooks()
             return
         else:
-            logger.info("Miss du cache, attente de disponibilité dans la file (1 extraction à la fois)...")
+            EXTRACTION_CACHE.inc("worker", "miss")
+            logger.info("Miss du cache, lancement de l'extraction.")
             db.commit()
             
-            # Prise du verrou global pour l'extraction afin de ne pas surcharger le serveur
-            lock = get_extraction_lock()
-            async with lock:
-                # Vérification si la tâche a été annulée par un admin pendant l'attente
-                db.refresh(req)
-                if req.status == "error":
-                    logger.info("Extraction annulée pendant l'attente (vide-file admin). Abandon.")
-                    return
-                    
-                # 1. Extraction du texte dans un thread séparé pour ne pas bloquer l'Event Loop (Tesseract très lourd)
-                logger.info(f"Étape 1/4 : Extraction du texte depuis le PDF '{req.file_path}' (Verrou Acquis)")
-                raw_text = await asyncio.to_thread(extract_text_from_pdf, req.file_path)
-                logger.info(f"Extraction terminée. Longueur brute : {len(raw_text)} caractères.")
-                
-                # 2. Correction IA (si demandée)
-                config = db.query(SystemConfig).first()
-                hf_token = config.hf_token if config else None
-                
-                corrected_text = raw_text
-                is_truncated = False
-                
-                if req.ia_validate:
-                    if hf_token and raw_text.strip():
-                        logger.info("Étape 2/4 : Correction IA demandée. Envoi à HuggingFace...")
-                        try:
-                            corrected_text, is_truncated = await correct_text_with_hf(raw_text, hf_token)
-                            logger.info(f"Correction IA terminée. Longueur finale : {len(corrected_text)} caractères.")
-                        except Exception as e:
-                            logger.error(f"Échec de la correction IA, utilisation du texte brut : {e}")
-                    else:
-                        logger.warning("Correction IA demandée mais impossible (Token HF manquant ou texte vide).")
-                        
-                # Vérification ultime avant sauvegarde des fichiers : si la tâche a été annulée pendant le traitement IA/OCR
-                db.refresh(req)
-                if req.status == "error":
-                    logger.info("Extraction annulée pendant le traitement (vide-file admin). Abandon de la sauvegarde.")
-                    return
-                    
-                # 3. Sauvegarde du résultat
-                logger.info("Étape 3/4 : Sauvegarde du fichier texte résultat...")
-                user = db.query(User).filter(User.id == req.user_id).first()
-                timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-                
-                txt_filename = f"{timestamp}_{req.id_texte}.txt"
-                if is_truncated:
-                    logger.warning("Le texte a été tronqué pour l'IA.")
-                    txt_filename = f"{timestamp}_{req.id_texte}_IA_truncated.txt"
-                    
-                txt_path = os.path.join(settings.USERS_DIR, user.directory_name, txt_filename)
+            # Vérification si la tâche a été annulée par un admin depuis sa réservation
+            db.refresh(req)
+            if req.status == "error":
+                logger.info("Extraction annulée avant son démarrage (vide-file admin). Abandon.")
+                outcome = "cancelled"
+                return
                 
-                with open(txt_path, "w", encoding="utf-8") as f:
-                    f.write(corrected_text)
+            # 1. Extraction du texte : l'OCR éventuel est réparti page par page sur le pool de processus
+            logger.info(f"Étape 1/4 : Extraction du texte depuis le PDF '{req.file_path}'")
+            # Points de reprise : une demande reprise après un arrêt brutal ne refait que le travail manquant
+            checkpoint = JobCheckpoint(request_id, file_hash)
+            stages.start("extraction")
+            progress.report("ocr")
+            extraction = await extract_pdf_async(
+                req.file_path, checkpoint, on_progress=lambda done, total: progress.report("ocr", done, total)
+            )
+            raw_text = extraction.text
+            PAGES.inc("native", amount=extraction.native_pages)
+            PAGES.inc("ocr", amount=extraction.ocr_pages)
+            logger.info(f"Extraction terminée. Longueur brute : {len(raw_text)} caractères ({extraction.native_pages} page(s) natives, {extraction.ocr_pages} OCRisée(s)).")
+            
+            # 2. Correction IA (si demandée)
+            config = db.query(SystemConfig).first()
+            hf_token = config.hf_token if config else None
+            
+            corrected_text = raw_text
+            is_truncated = False
+            
+            if req.ia_validate:
+                if hf_token and raw_text.strip():
+                    logger.info("Étape 2/4 : Correction IA demandée. Envoi à HuggingFace...")
+                    stages.start("correction")
+                    try:
+                        corrected_text, is_truncated = await correct_text_with_hf(
+                            raw_text, hf_token, checkpoint=checkpoint,
+                            on_progress=lambda done, total: progress.report("correction", done, total),
+                        )
+                        logger.info(f"Correction IA terminée. Longueur finale : {len(corrected_text)} caractères.")
+                    except Exception as e:
+                        logger.error(f"Échec de la correction IA, utilisation du texte brut : {e}")
+                else:
+                    logger.warning("Correction IA demandée mais impossible (Token HF manquant ou texte vide).")
                     
-                req.txt_file_path = txt_path
-                req.status = "success"
-                req.completed_at = datetime.now(timezone.utc)
-                db.commit()
-                logger.info(f"Fichier sauvegardé avec succès dans: {txt_path}")
+            # Vérification ultime avant sauvegarde des fichiers : si la tâche a été annulée pendant le traitement IA/OCR
+            db.refresh(req)
+            if req.status == "error":
+                logger.info("Extraction annulée pendant le traitement (vide-file admin). Abandon de la sauvegarde.")
+                outcome = "cancelled"
+                return
                 
-                # 4. Envoi du Webhook
-                logger.info(f"Étape 4/4 : Envoi de la notification au webhook : {req.webhook_url}")
-                excerpt = corrected_text[:500]
-                if len(corrected_text) > 500:
-                    excerpt += "..."
-                    
-                # Create a single-use or long-lived download token specifically for this request
-                download_token = create_access_token(
-                    data={"sub": str(req.id), "type": "download"}, 
-                    expires_delta=timedelta(days=365)
-                )
-                download_url = f"{settings.EXTERNAL_URL}{settings.API_V1_STR}/extract/{req.id}/download?token={download_token}"
+            # 3. Sauvegarde du résultat
+            logger.info("Étape 3/4 : Sauvegarde du fichier texte résultat...")
+            stages.start("saving")
+            progress.report("saving")
+            if is_truncated:
+                logger.warning("Le texte a été tronqué pour l'IA.")
+            # Stockage adressé par le contenu : un texte identique déjà produit (autre utilisateur,
+            # autre PDF) n'est pas réécrit ; les variantes gzip / zstd sont produites avec lui
+            blob = await asyncio.to_thread(write_blob, corrected_text)
+            stages.start("webhook")
+            progress.report("webhook")
 
-                await send_client_webhook(req.webhook_url, {
-                    "message": "L'extraction est terminée.",
-                    "etat": "succès",
-                    "id_texte": req.id_texte,
-                    "url": download_url,
-                    "extrait": excerpt
-                })
+            attach_blob(db, req, blob, result_filename(req, is_truncated))
+
+            req.page_count = extraction.page_count
+            req.ocr_page_count = extraction.ocr_pages
+            req.status = "success"
+            req.completed_at = datetime.now(timezone.utc)
+            # 4. Envoi du Webhook (boîte d'envoi, validée avec le statut)
+            queue_success_webhook(db, req, corrected_text)
+            db.commit()
+            outcome = "success"
+            notify_webhooks()
+            logger.info(f"Fichier sauvegardé avec succès dans: {req.txt_file_path}")
         
+    except asyncio.CancelledError:
+        keep_file = True
+        outcome = "requeued"
+        raise
     except Exception as e:
+        outcome = "error"
         logger.error(f"Error processing request {request_id}: {e}")
         req = db.query(ExtractionRequest).filter(ExtractionRequest.id == request_id).first()
         if req:
             req.status = "error"
             req.error_message = str(e)
             req.completed_at = datetime.now(timezone.utc)
+            queue_error_webhook(db, req)
             db.commit()
-            await send_client_webhook(req.webhook_url, {
-                "message": "L'extraction a échoué.",
-                "etat": "échec",
-                "id_texte": req.id_texte,
-                "erreur": str(e)
-            })
+            notify_webhooks()
     finally:
+        stages.stop()
+        if outcome is not None:
+            JOBS.inc(outcome)
+            JOB_SECONDS.observe(time.perf_counter() - job_start, outcome)
+        # Lu avant la fermeture de la session : les attributs sont expirés par le dernier commit
+        pdf_path = req.file_path if req else None
+        batch_id = req.batch_id if req else None
+        # Les doublons d'un lot partagent le PDF reçu : il n'est supprimé qu'avec la dernière demande active
+        if pdf_path and not keep_file and pdf_file_in_use(db, pdf_path, request_id):
+            pdf_path = None
         db.close()
+        if checkpoint and not keep_file:
+            checkpoint.clear()
+        if batch_id is not None and not keep_file:
+            from app.services.batches import complete_batch_in_session
+            complete_batch_in_session(batch_id)
         # Clean up temporary PDF file
-        if req and req.file_path and os.path.exists(req.file_path):
+        if not keep_file and pdf_path and os.path.exists(pdf_path):
             try:
-                os.remove(req.file_path)
-                logger.info(f"Cleaned up temporary file: {req.file_path}")
+                os.remove(pdf_path)
+                logger.info(f"Cleaned up temporary file: {pdf_path}")
             except Exception as e:
                 logger.error(f"Failed to clean up temporary file: {e}")
@@ -1,10 +1,24 @@
 from huggingface_hub import InferenceClient
 from loguru import logger
 
-from typing import Tuple
+from typing import Callable, List, Optional, Tuple
+import random
 import re
 import asyncio
 
+from app.core.config import settings
+from app.services.checkpoint import JobCheckpoint
+from app.services.correction_cache import correction_cache_key, get_correction_cache
+from app.services.metrics import HF_CHUNKS, HF_RETRIES
+
+HF_MODEL = "meta-llama/Llama-3.1-8B-Instruct"
+
+# À incrémenter si le prompt change (invalide les morceaux corrigés en cache)
+PROMPT_VERSION = "1"
+
+# Codes HTTP pour lesquels une nouvelle tentative a un sens (limitation de débit, erreurs serveur)
+_RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
 # Motifs de préambule courants que le LLM ajoute malgré les instructions
 _PREAMBLE_PATTERNS = [
     r"^Voici\s+le\s+texte\s+nettoy[ée].*?[:\n]+\s*",
@@ -22,44 +36,55 @@ def _strip_preamble(text: str) -> str:
         stripped = re.sub(pattern, "", stripped, count=1, flags=re.IGNORECASE)
     return stripped.strip()
 
-async def correct_text_with_hf(text: str, token: str) -> Tuple[str, bool]:
-    """
-    Sends the extracted text to a Hugging Face model to correct syntax and spelling errors.
-    Splits the text into chunks to bypass token limits, then stitches them back together.
-    Returns a tuple (corrected_text, is_truncated).
-    """
-    try:
-        # Using a reliable instruction-following lightweight model
-        client = InferenceClient(token=token)
-        
-        # Chunking the text by lines to respect the ~3000 chars limit per chunk
-        max_chunk_size = 3000
-        lines = text.split('\n')
-        chunks = []
-        current_chunk = ""
-        
-        for line in lines:
-            if len(current_chunk) + len(line) + 1 > max_chunk_size:
-                if current_chunk:
-                    chunks.append(current_chunk)
-                    current_chunk = line + "\n"
-                else:
-                    # A single line is longer than max_chunk_size
-                    chunks.append(line[:max_chunk_size])
-                    current_chunk = line[max_chunk_size:] + "\n"
+class TokenBucket:
+    """Limiteur de débit asynchrone : `rate` jetons par seconde, rafale de `capacity` jetons."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._updated is not None:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+def split_into_chunks(text: str, max_chunk_size: int = 3000) -> List[str]:
+    """Découpe le texte par lignes en morceaux d'environ `max_chunk_size` caractères."""
+    lines = text.split('\n')
+    chunks = []
+    current_chunk = ""
+
+    for line in lines:
+        if len(current_chunk) + len(line) + 1 > max_chunk_size:
+            if current_chunk:
+                chunks.append(current_chunk)
+                current_chunk = line + "\n"
             else:
-                current_chunk += line + "\n"
-                
-        if current_chunk.strip():
-            chunks.append(current_chunk.strip())
-
-        corrected_chunks = []
-        
-        for i, chunk in enumerate(chunks):
-            if not chunk.strip():
-                continue
-                
-            prompt = f"""<|begin_of_text|><|start_header_id|>system<|end_header_id|>
+                # A single line is longer than max_chunk_size
+                chunks.append(line[:max_chunk_size])
+                current_chunk = line[max_chunk_size:] + "\n"
+        else:
+            current_chunk += line + "\n"
+
+    if current_chunk.strip():
+        chunks.append(current_chunk.strip())
+    return chunks
+
+def _build_prompt(chunk: str, index: int, total: int) -> str:
+    return f"""<|begin_of_text|><|start_header_id|>system<|end_header_id|>
 Tu es un assistant expert spécialisé dans le nettoyage de textes extraits par OCR (reconnaissance optique de caractères).
 Ta mission est de corriger les fautes d'orthographe et les erreurs de grammaire causées par l'OCR.
 DE PLUS, tu dois IMPÉRATIVEMENT nettoyer le texte en supprimant :
@@ -72,30 +97,126 @@ Renvoie UNIQUEMENT le texte final nettoyé et corrigé.
 NE COMMENCE PAS ta réponse par une phrase comme "Voici le texte" ou "Voici la version corrigée".
 Commence DIRECTEMENT par le premier mot du texte corrigé, sans aucune introduction ni conclusion.
 <|eot_id|><|start_header_id|>user<|end_header_id|>
-Texte à nettoyer (partie {i+1}/{len(chunks)}) :
+Texte à nettoyer (partie {index+1}/{total}) :
 {chunk}<|eot_id|><|start_header_id|>assistant<|end_header_id|>"""
-            messages = [{"role": "user", "content": prompt}]
-            
-            try:
+
+def _retry_delay(error: Exception, attempt: int) -> Optional[float]:
+    """
+    Délai avant nouvelle tentative, ou None si l'erreur n'est pas transitoire.
+    Respecte l'en-tête Retry-After quand le serveur en fournit un.
+    """
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is not None and status not in _RETRYABLE_STATUSES:
+        return None
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    # Backoff exponentiel avec gigue pour éviter que les morceaux en échec ne repartent tous ensemble
+    return settings.HF_BACKOFF_BASE * (2 ** attempt) * (0.5 + random.random())
+
+async def _correct_chunk(client: InferenceClient, chunk: str, index: int, total: int,
+                         limiter: TokenBucket, in_flight: asyncio.Semaphore, cache_key: str,
+                         checkpoint: Optional[JobCheckpoint] = None) -> str:
+    """
+    Corrige un morceau avec nouvelles tentatives ; renvoie le morceau original en cas d'échec définitif.
+    Seules les corrections réussies sont mises en cache et enregistrées au point de reprise.
+    """
+    messages = [{"role": "user", "content": _build_prompt(chunk, index, total)}]
+    for attempt in range(settings.HF_MAX_RETRIES + 1):
+        await limiter.acquire()
+        try:
+            async with in_flight:
                 # Run synchronous HF client in a separate thread
                 response = await asyncio.to_thread(
                     client.chat_completion,
-                    model="meta-llama/Llama-3.1-8B-Instruct", 
-                    messages=messages, 
-                    max_tokens=1500, 
+                    model=HF_MODEL,
+                    messages=messages,
+                    max_tokens=1500,
                     temperature=0.1
                 )
-                corrected_text = response.choices[0].message.content.strip()
-                corrected_text = _strip_preamble(corrected_text)
-                corrected_chunks.append(corrected_text)
-            except Exception as e:
-                logger.error(f"Failed to correct chunk {i+1}: {e}")
+            corrected = _strip_preamble(response.choices[0].message.content.strip())
+        except Exception as e:
+            delay = _retry_delay(e, attempt)
+            if delay is None or attempt == settings.HF_MAX_RETRIES:
+                logger.error(f"Failed to correct chunk {index+1}: {e}")
+                HF_CHUNKS.inc("failed")
                 # Fallback: keep the original chunk if correction fails to avoid losing data
-                corrected_chunks.append(chunk)
-                
+                return chunk
+            logger.warning(f"Chunk {index+1} : erreur transitoire ({e}), nouvelle tentative dans {delay:.1f}s.")
+            HF_RETRIES.inc()
+            await asyncio.sleep(delay)
+            continue
+        HF_CHUNKS.inc("corrected")
+        await asyncio.to_thread(get_correction_cache().put, cache_key, corrected)
+        if checkpoint:
+            await asyncio.to_thread(checkpoint.append, "hf", index, key=cache_key, text=corrected)
+        return corrected
+    return chunk
+
+async def correct_text_with_hf(text: str, token: str, base_url: Optional[str] = None,
+                               checkpoint: Optional[JobCheckpoint] = None,
+                               on_progress: Optional[Callable[[int, int], None]] = None) -> Tuple[str, bool]:
+    """
+    Sends the extracted text to a Hugging Face model to correct syntax and spelling errors.
+    Splits the text into chunks to bypass token limits, reuses chunks already corrected
+    by a previous run (persistent cache), corrects the others concurrently
+    (bounded in-flight calls, token-bucket rate limiting, retries on 429/5xx),
+    then stitches them back together in their original order.
+    With `checkpoint`, each corrected chunk is recorded as soon as it is ready so that
+    an interrupted job resumes from the chunks already corrected.
+    `on_progress(done, total)` is called as chunks complete.
+    Returns a tuple (corrected_text, is_truncated).
+    """
+    try:
+        base_url = base_url or settings.HF_BASE_URL
+        client = InferenceClient(base_url=base_url, token=token) if base_url else InferenceClient(token=token)
+
+        chunks = [c for c in split_into_chunks(text) if c.strip()]
+        keys = [correction_cache_key(HF_MODEL, PROMPT_VERSION, c) for c in chunks]
+        cache = get_correction_cache()
+        cached = await asyncio.to_thread(lambda: [cache.get(k) for k in keys])
+        if checkpoint:
+            # Point de reprise : prévaut sur le cache, qui a pu être évincé entre-temps
+            done = await asyncio.to_thread(checkpoint.load, "hf")
+            for i, entry in done.items():
+                if i < len(keys) and entry.get("key") == keys[i]:
+                    cached[i] = entry["text"]
+        to_correct = [i for i, value in enumerate(cached) if value is None]
+
+        limiter = TokenBucket(settings.HF_RATE_PER_SECOND, settings.HF_RATE_BURST)
+        in_flight = asyncio.Semaphore(max(1, settings.HF_MAX_IN_FLIGHT))
+        logger.info(
+            f"Correction IA de {len(chunks)} morceaux : {len(chunks) - len(to_correct)} déjà corrigés, "
+            f"{len(to_correct)} à corriger ({settings.HF_MAX_IN_FLIGHT} appels simultanés max)."
+        )
+
+        done_count = len(chunks) - len(to_correct)
+        HF_CHUNKS.inc("cached", amount=done_count)
+        if on_progress:
+            on_progress(done_count, len(chunks))
+
+        async def correct(i: int) -> str:
+            nonlocal done_count
+            corrected = await _correct_chunk(client, chunks[i], i, len(chunks), limiter, in_flight, keys[i], checkpoint)
+            done_count += 1
+            if on_progress:
+                on_progress(done_count, len(chunks))
+            return corrected
+
+        # gather conserve l'ordre des morceaux quel que soit l'ordre de fin des appels
+        results = await asyncio.gather(*(correct(i) for i in to_correct))
+        corrected_chunks = list(cached)
+        for i, corrected in zip(to_correct, results):
+            corrected_chunks[i] = corrected
+        logger.info(f"Cache de correction : {cache.stats()}")
+
         # Join all corrected chunks
         final_text = "\n\n".join(corrected_chunks)
-        
+
         # is_truncated is now always False since we process everything in chunks
         return final_text, False
     except Exception as e:
@@ -0,0 +1,27 @@
+import hashlib
+import os
+
+import aiofiles
+from fastapi import UploadFile
+
+# Taille des blocs lus depuis la requête et écrits sur disque
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+async def save_upload(upload: UploadFile, dest_path: str) -> str:
+    """
+    Écrit le PDF reçu sur disque par blocs de 1 Mo sans bloquer la boucle d'événements,
+    et calcule son empreinte SHA-256 dans la même passe. Renvoie l'empreinte hexadécimale.
+    Le fichier partiel est supprimé en cas d'erreur.
+    """
+    sha256_hash = hashlib.sha256()
+    try:
+        async with aiofiles.open(dest_path, "wb") as out:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                sha256_hash.update(chunk)
+                await out.write(chunk)
+    except BaseException:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+    return sha256_hash.hexdigest()
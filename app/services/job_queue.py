@@ -0,0 +1,162 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional
+
+from loguru import logger
+from sqlalchemy import Float, case, cast, exists, func, or_, select, update
+from sqlalchemy.orm import Session, aliased
+
+from app.db.models import ExtractionRequest, User
+
+# Statuts des demandes encore dans la file (en attente ou en cours de traitement)
+ACTIVE_STATUSES = ["pending", "processing"]
+
+# Classes de priorité des utilisateurs : poids de leur part de la file (à chaque tour, un
+# utilisateur "high" est servi 4 fois quand un "normal" l'est 2 fois et un "low" 1 fois)
+PRIORITY_WEIGHTS = {"low": 1, "normal": 2, "high": 4}
+# Coût supposé d'une demande dont le PDF n'a pas pu être estimé
+UNKNOWN_JOB_COST = 100
+
+
+def _schedule():
+    """
+    Demandes actives et leurs clés d'ordonnancement. Les demandes de chaque utilisateur sont
+    rangées (en cours d'abord, puis les moins coûteuses) et sa n-ième passe au temps virtuel
+    n / poids de sa classe : la file est servie par temps virtuel croissant (part équitable
+    pondérée, un gros envoi n'affame plus les autres utilisateurs), puis par coût estimé
+    (plus courts travaux d'abord), puis par ancienneté.
+    """
+    cost = func.coalesce(ExtractionRequest.estimated_cost, UNKNOWN_JOB_COST)
+    processing_first = case((ExtractionRequest.status == "processing", 0), else_=1)
+    user_rank = func.row_number().over(
+        partition_by=ExtractionRequest.user_id,
+        order_by=(processing_first, cost, ExtractionRequest.created_at, ExtractionRequest.id),
+    )
+    weight = case(PRIORITY_WEIGHTS, value=User.priority, else_=PRIORITY_WEIGHTS["normal"])
+    return (
+        select(
+            ExtractionRequest.id,
+            ExtractionRequest.status,
+            ExtractionRequest.file_hash,
+            ExtractionRequest.created_at,
+            cost.label("cost"),
+            processing_first.label("processing_first"),
+            (cast(user_rank, Float) / weight).label("virtual_time"),
+        )
+        .join(User, User.id == ExtractionRequest.user_id)
+        .where(ExtractionRequest.status.in_(ACTIVE_STATUSES))
+        .subquery()
+    )
+
+
+def _service_order(schedule) -> tuple:
+    """Ordre de service de la file : identique pour la réservation et le calcul des positions."""
+    return (schedule.c.processing_first, schedule.c.virtual_time, schedule.c.cost, schedule.c.created_at, schedule.c.id)
+
+
+def claim_next_job(db: Session, worker_id: str) -> Optional[int]:
+    """
+    Réserve atomiquement la prochaine demande `pending` dans l'ordre de service pour ce worker.
+    L'UPDATE revérifie le statut : si deux workers visent la même ligne, un seul la passe
+    en `processing` ; l'autre obtient None, comme si la file était vide, et ne retente qu'au
+    tour suivant de sa boucle (réveil ou WORKER_POLL_INTERVAL).
+    Une demande dont le PDF (même empreinte) est déjà en cours d'extraction est sautée :
+    elle sera servie par le cache une fois l'autre terminée.
+    """
+    now = datetime.now(timezone.utc)
+    schedule = _schedule()
+    busy = aliased(ExtractionRequest)
+    candidate = (
+        select(schedule.c.id)
+        .where(
+            schedule.c.status == "pending",
+            ~exists().where(busy.file_hash == schedule.c.file_hash, busy.status == "processing"),
+        )
+        .order_by(*_service_order(schedule))
+        .limit(1)
+        .scalar_subquery()
+    )
+    claimed = db.execute(
+        update(ExtractionRequest)
+        .where(ExtractionRequest.id == candidate, ExtractionRequest.status == "pending")
+        .values(status="processing", worker_id=worker_id, started_at=now, heartbeat_at=now)
+        .returning(ExtractionRequest.id)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    db.commit()
+    return claimed
+
+
+def queue_positions(db: Session, request_ids: Iterable[int]) -> Dict[int, int]:
+    """
+    Position (à partir de 0) des demandes actives demandées dans la file globale, dans l'ordre
+    de service de `claim_next_job`, en une seule requête fenêtrée. Les demandes non actives sont
+    absentes du résultat.
+    """
+    request_ids = list(request_ids)
+    if not request_ids:
+        return {}
+    schedule = _schedule()
+    ranked = select(
+        schedule.c.id.label("id"),
+        (func.row_number().over(order_by=_service_order(schedule)) - 1).label("position"),
+    ).subquery()
+    rows = db.execute(select(ranked.c.id, ranked.c.position).where(ranked.c.id.in_(request_ids)))
+    return {request_id: position for request_id, position in rows}
+
+
+def heartbeat(db: Session, request_ids: Iterable[int], worker_id: str):
+    """Signale que ce worker traite toujours ces demandes (évite leur récupération)."""
+    request_ids = list(request_ids)
+    if not request_ids:
+        return
+    db.execute(
+        update(ExtractionRequest)
+        .where(
+            ExtractionRequest.id.in_(request_ids),
+            ExtractionRequest.status == "processing",
+            ExtractionRequest.worker_id == worker_id,
+        )
+        .values(heartbeat_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def requeue_jobs(db: Session, request_ids: Iterable[int], worker_id: str) -> int:
+    """Remet en file les demandes abandonnées par ce worker (arrêt propre)."""
+    request_ids = list(request_ids)
+    if not request_ids:
+        return 0
+    result = db.execute(
+        update(ExtractionRequest)
+        .where(
+            ExtractionRequest.id.in_(request_ids),
+            ExtractionRequest.status == "processing",
+            ExtractionRequest.worker_id == worker_id,
+        )
+        .values(status="pending", worker_id=None, heartbeat_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def recover_stale_jobs(db: Session, stale_after_seconds: int, worker_id: Optional[str] = None) -> int:
+    """
+    Remet en `pending` les demandes restées en `processing` dont le worker ne donne plus signe de vie
+    (battement de cœur trop ancien ou absent), ainsi que celles d'une précédente instance de ce même worker.
+    """
+    threshold = datetime.now(timezone.utc) - timedelta(seconds=stale_after_seconds)
+    stale = or_(ExtractionRequest.heartbeat_at.is_(None), ExtractionRequest.heartbeat_at < threshold)
+    if worker_id:
+        stale = or_(stale, ExtractionRequest.worker_id == worker_id)
+    result = db.execute(
+        update(ExtractionRequest)
+        .where(ExtractionRequest.status == "processing", stale)
+        .values(status="pending", worker_id=None, heartbeat_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    if result.rowcount:
+        logger.warning(f"{result.rowcount} demande(s) orpheline(s) remise(s) en file d'attente.")
+    return result.rowcount
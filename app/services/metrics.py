@@ -0,0 +1,340 @@
+"""
+Métriques d'exploitation au format texte Prometheus (`GET /metrics`).
+
+Compteurs et histogrammes vivent en mémoire dans chaque processus : une mise à jour coûte un
+verrou non contesté et une addition (de l'ordre de la microseconde). Chaque processus (serveur
+web, workers) écrit toutes les METRICS_FLUSH_INTERVAL secondes un instantané de ses valeurs dans
+`DATA_DIR/metrics/<processus>.json` ; `/metrics` additionne à ses propres valeurs les instantanés
+des autres processus, puis ajoute les jauges lues en base au moment de la collecte (demandes en
+attente et en cours, webhooks à livrer). Un processus supprime son instantané à l'arrêt ; celui
+d'un processus disparu sans le faire (arrêt brutal) est écarté et supprimé à la collecte.
+"""
+import asyncio
+import atexit
+import bisect
+import glob
+import json
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+
+# Bornes (s) des histogrammes de durée : de l'étape la plus courte au gros scan OCRisé
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+_registry: Dict[str, "Metric"] = {}
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def snapshot(self) -> list:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Compteur monotone ; `inc(*valeurs_des_labels, amount=1)`."""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+
+class CallbackCounter(Metric):
+    """Compteur tenu ailleurs (statistiques d'un cache) : `read()` renvoie {valeurs des labels: total}."""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str], read: Callable[[], Dict[tuple, float]]):
+        super().__init__(name, help, labels)
+        self._read = read
+
+    def snapshot(self) -> list:
+        return [[list(key), value] for key, value in self._read().items()]
+
+
+def cache_lookups(cache) -> Dict[tuple, float]:
+    """Succès et échecs d'un cache qui tient ses propres compteurs (`hits`, `misses`) ; rien s'il n'existe pas encore."""
+    if cache is None:
+        return {}
+    return {("hit",): cache.hits, ("miss",): cache.misses}
+
+
+class Histogram(Metric):
+    """Histogramme à bornes fixes ; `observe(valeur, *valeurs_des_labels)`."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DURATION_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # valeurs des labels -> [effectif par intervalle (dernier : +Inf), somme]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(key), list(counts), total] for key, (counts, total) in self._values.items()]
+
+
+class StageTimer:
+    """Chronomètre les étapes successives d'une demande : chaque durée va dans `STAGE_SECONDS`."""
+    __slots__ = ("_stage", "_start")
+
+    def __init__(self):
+        self._stage: Optional[str] = None
+        self._start = 0.0
+
+    def start(self, stage: str):
+        now = time.perf_counter()
+        if self._stage is not None:
+            STAGE_SECONDS.observe(now - self._start, self._stage)
+        self._stage, self._start = stage, now
+
+    def stop(self):
+        if self._stage is not None:
+            STAGE_SECONDS.observe(time.perf_counter() - self._start, self._stage)
+            self._stage = None
+
+
+# --- Métriques du pipeline d'extraction ---
+
+STAGE_SECONDS = Histogram(
+    "rpgpdf2txt_stage_duration_seconds", "Durée des étapes d'une extraction", ["stage"],
+)
+JOB_SECONDS = Histogram(
+    "rpgpdf2txt_job_duration_seconds", "Durée de traitement d'une demande par un worker", ["outcome"],
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "rpgpdf2txt_queue_wait_seconds", "Attente entre la soumission d'une demande et sa réservation",
+)
+JOBS = Counter("rpgpdf2txt_jobs_total", "Demandes traitées par les workers, par issue", ["outcome"])
+EXTRACTION_CACHE = Counter(
+    "rpgpdf2txt_extraction_cache_total", "Recherches d'une extraction identique (réception ou worker)", ["at", "result"],
+)
+PAGES = Counter("rpgpdf2txt_pages_total", "Pages extraites, par source du texte", ["source"])
+HF_CHUNKS = Counter("rpgpdf2txt_hf_chunks_total", "Morceaux soumis à la correction IA, par issue", ["result"])
+HF_RETRIES = Counter("rpgpdf2txt_hf_retries_total", "Nouvelles tentatives d'appel HuggingFace")
+WEBHOOKS = Counter("rpgpdf2txt_webhook_deliveries_total", "Tentatives de livraison de webhooks, par issue", ["result"])
+PROGRESS_WRITES = Counter("rpgpdf2txt_progress_writes_total", "Écritures d'avancement en base")
+
+
+# --- Instantanés par processus ---
+
+# Clé de l'instantané qui identifie son processus (hôte, pid) ; ce n'est pas une métrique
+PROCESS_KEY = "_process"
+# Au-delà de ce nombre d'intervalles sans réécriture, l'instantané d'un autre hôte est périmé
+STALE_FLUSH_INTERVALS = 3
+
+_process_name: Optional[str] = None
+_cleanup_registered = False
+
+
+def set_process_name(name: str):
+    """Nomme l'instantané du processus courant (identifiant du worker ; défaut : web-<hôte>-<pid>)."""
+    global _process_name
+    _process_name = name
+
+
+def _snapshot_path() -> str:
+    name = _process_name or f"web-{socket.gethostname()}-{os.getpid()}"
+    return os.path.join(settings.DATA_DIR, "metrics", f"{name}.json")
+
+
+def snapshot() -> dict:
+    return {name: metric.snapshot() for name, metric in _registry.items()}
+
+
+def write_snapshot():
+    """Écrit l'instantané du processus (remplacement atomique) ; il sera supprimé à la sortie."""
+    global _cleanup_registered
+    path = _snapshot_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({**snapshot(), PROCESS_KEY: {"host": socket.gethostname(), "pid": os.getpid()}}, f)
+    os.replace(tmp_path, path)
+    if not _cleanup_registered:
+        atexit.register(remove_snapshot)
+        _cleanup_registered = True
+
+
+def remove_snapshot():
+    """Supprime l'instantané du processus : ses valeurs ne doivent plus être additionnées."""
+    try:
+        os.remove(_snapshot_path())
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Instantané des métriques non supprimé : {e}")
+
+
+async def run_metrics_flush(stop_event: asyncio.Event):
+    """Écrit l'instantané toutes les METRICS_FLUSH_INTERVAL secondes, puis le supprime à l'arrêt."""
+    while not stop_event.is_set():
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=settings.METRICS_FLUSH_INTERVAL)
+            break
+        except asyncio.TimeoutError:
+            pass
+        try:
+            await asyncio.to_thread(write_snapshot)
+        except Exception as e:
+            logger.warning(f"Instantané des métriques non écrit : {e}")
+    await asyncio.to_thread(remove_snapshot)
+
+
+def _process_gone(path: str, process: Optional[dict]) -> bool:
+    """
+    Vrai si l'instantané appartient à un processus disparu : pid absent sur cet hôte ; pour un
+    autre hôte (ou un instantané sans identité), fichier non réécrit depuis plusieurs intervalles.
+    """
+    if process and process.get("host") == socket.gethostname():
+        try:
+            os.kill(process["pid"], 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pass  # processus d'un autre utilisateur : il existe
+        return False
+    try:
+        age = time.time() - os.path.getmtime(path)
+    except OSError:
+        return True
+    return age > STALE_FLUSH_INTERVALS * settings.METRICS_FLUSH_INTERVAL
+
+
+def _merged() -> Dict[str, dict]:
+    """Valeurs du processus courant additionnées à celles des instantanés des autres processus."""
+    own_path = _snapshot_path()
+    snapshots = [snapshot()]
+    for path in glob.glob(os.path.join(settings.DATA_DIR, "metrics", "*.json")):
+        if path == own_path:
+            continue
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if _process_gone(path, data.pop(PROCESS_KEY, None)):
+            logger.info(f"Instantané de métriques d'un processus arrêté supprimé : {os.path.basename(path)}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        snapshots.append(data)
+    merged: Dict[str, dict] = {name: {} for name in _registry}
+    for data in snapshots:
+        for name, samples in data.items():
+            metric = _registry.get(name)
+            if metric is None:
+                continue
+            values = merged[name]
+            for sample in samples:
+                key = tuple(sample[0])
+                if metric.kind == "counter":
+                    values[key] = values.get(key, 0) + sample[1]
+                    continue
+                counts, total = sample[1], sample[2]
+                if len(counts) != len(metric.buckets) + 1:
+                    continue  # instantané d'une version aux bornes différentes
+                current = values.setdefault(key, [[0] * len(counts), 0.0])
+                current[0] = [a + b for a, b in zip(current[0], counts)]
+                current[1] += total
+    return merged
+
+
+# --- Rendu ---
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def collect_gauges(db: Session) -> List[Tuple[str, str, Sequence[str], List[Tuple[tuple, float]]]]:
+    """Jauges lues en base à la collecte : (nom, aide, labels, [(valeurs des labels, valeur)])."""
+    from app.db.models import ExtractionRequest, WebhookDelivery
+
+    jobs = dict(db.execute(
+        select(ExtractionRequest.status, func.count())
+        .where(ExtractionRequest.status.in_(["pending", "processing"]))
+        .group_by(ExtractionRequest.status)
+    ).all())
+    outbox = dict(db.execute(
+        select(WebhookDelivery.status, func.count())
+        .where(WebhookDelivery.status.in_(["pending", "sending"]))
+        .group_by(WebhookDelivery.status)
+    ).all())
+    return [
+        ("rpgpdf2txt_queue_depth", "Demandes en attente d'un worker", (), [((), jobs.get("pending", 0))]),
+        ("rpgpdf2txt_jobs_in_flight", "Demandes en cours de traitement", (), [((), jobs.get("processing", 0))]),
+        ("rpgpdf2txt_webhook_outbox", "Webhooks à livrer, par statut", ("status",),
+         [((status,), outbox.get(status, 0)) for status in ("pending", "sending")]),
+    ]
+
+
+def render(gauges: Sequence[tuple] = ()) -> str:
+    """Texte d'exposition Prometheus (version 0.0.4) de toutes les métriques."""
+    lines = []
+    for name, values in _merged().items():
+        metric = _registry[name]
+        lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for key, value in sorted(values.items()):
+            if metric.kind == "counter":
+                lines.append(f"{name}{_labels(metric.labels, key)} {_number(value)}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip([*metric.buckets, "+Inf"], counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == "+Inf" else f'le="{_number(bound)}"'
+                lines.append(f"{name}_bucket{_labels(metric.labels, key, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(metric.labels, key)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(metric.labels, key)} {cumulative}")
+    for name, help, labels, samples in gauges:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        for key, value in samples:
+            lines.append(f"{name}{_labels(labels, key)} {_number(value)}")
+    return "\n".join(lines) + "\n"
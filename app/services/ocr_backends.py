@@ -0,0 +1,104 @@
+"""
+Moteurs OCR interchangeables derrière `ocr_engine.ocr_image`.
+
+`pytesseract` lance un processus `tesseract` par page : l'image est écrite dans un fichier
+temporaire, puis le modèle `fra` est rechargé à chaque appel. `tesserocr` (dépendance optionnelle)
+garde un moteur Tesseract initialisé une fois par processus du pool OCR et lui passe les pixels
+en mémoire. OCR_BACKEND choisit le moteur : `auto` (tesserocr s'il est installé et s'initialise,
+pytesseract sinon), `tesserocr` ou `pytesseract`.
+"""
+import atexit
+import threading
+
+import pytesseract
+from loguru import logger
+from PIL import Image
+
+from app.core.config import settings
+
+try:
+    import tesserocr
+except ImportError:  # Dépendance optionnelle : repli sur pytesseract
+    tesserocr = None
+
+OCR_LANG = "fra"
+
+
+class PytesseractBackend:
+    """Un processus `tesseract` par image, avec repli sur la langue par défaut de Tesseract."""
+    name = "pytesseract"
+
+    def image_to_string(self, img: Image.Image) -> str:
+        # Note: tesseract-ocr-fra doit être installé sur le système
+        try:
+            return pytesseract.image_to_string(img, lang=OCR_LANG)
+        except Exception as e:
+            logger.warning(f"French OCR failed, falling back to default: {e}")
+            return pytesseract.image_to_string(img)
+
+    def close(self):
+        pass
+
+
+class TesserocrBackend:
+    """Moteur Tesseract chargé une fois dans le processus ; l'image lui est passée en mémoire."""
+    name = "tesserocr"
+
+    def __init__(self):
+        try:
+            self._api = tesserocr.PyTessBaseAPI(lang=OCR_LANG)
+        except RuntimeError as e:
+            logger.warning(f"Modèle OCR '{OCR_LANG}' indisponible pour tesserocr, langue par défaut : {e}")
+            self._api = tesserocr.PyTessBaseAPI()
+        # Un moteur Tesseract ne se partage pas entre threads
+        self._lock = threading.Lock()
+
+    def image_to_string(self, img: Image.Image) -> str:
+        # Les pages rastérisées sont en niveaux de gris : pixels bruts, sans encodage intermédiaire
+        if img.mode not in ("L", "RGB"):
+            img = img.convert("RGB")
+        bytes_per_pixel = 1 if img.mode == "L" else 3
+        with self._lock:
+            try:
+                self._api.SetImageBytes(img.tobytes(), img.width, img.height,
+                                        bytes_per_pixel, img.width * bytes_per_pixel)
+                return self._api.GetUTF8Text()
+            finally:
+                # Libère les résultats de la page, le modèle reste chargé
+                self._api.Clear()
+
+    def close(self):
+        self._api.End()
+
+
+def create_backend(name: str):
+    """Instancie le moteur demandé ; tesserocr absent ou inutilisable se replie sur pytesseract."""
+    if name not in ("auto", "tesserocr", "pytesseract"):
+        raise ValueError(f"OCR_BACKEND inconnu : {name!r} (auto, tesserocr ou pytesseract)")
+    if name != "pytesseract":
+        if tesserocr is None:
+            if name == "tesserocr":
+                logger.error("OCR_BACKEND=tesserocr mais le module tesserocr n'est pas installé, repli sur pytesseract.")
+        else:
+            try:
+                return TesserocrBackend()
+            except Exception as e:
+                logger.error(f"Initialisation de tesserocr échouée, repli sur pytesseract : {e}")
+    return PytesseractBackend()
+
+
+# Moteur global initialisé paresseusement (un par processus du pool OCR)
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_ocr_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend = create_backend(settings.OCR_BACKEND)
+                atexit.register(backend.close)
+                logger.info(f"Moteur OCR : {backend.name}")
+                _backend = backend
+    return _backend
@@ -0,0 +1,126 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional
+
+import fitz  # PyMuPDF
+from loguru import logger
+
+from app.core.config import settings
+from app.services.ocr_backends import get_ocr_backend
+from app.services.rasterizer import render_page_from_path
+
+# Pool de processus global initialisé paresseusement (un par processus d'extraction)
+_ocr_pool: Optional[ProcessPoolExecutor] = None
+_ocr_pool_lock = threading.Lock()
+
+# Facteur multiplicatif appliqué à la taille brute d'une page (niveaux de gris, 1 octet/pixel) pour tenir compte
+# des copies internes faites par Tesseract (binarisation, niveaux de gris, etc.)
+_TESSERACT_MEMORY_FACTOR = 4
+
+
+def get_ocr_pool() -> ProcessPoolExecutor:
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            # "spawn" évite de dupliquer les threads et la boucle asyncio du processus parent
+            _ocr_pool = ProcessPoolExecutor(
+                max_workers=max(1, settings.OCR_WORKERS),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info(f"Pool OCR démarré avec {max(1, settings.OCR_WORKERS)} processus.")
+        return _ocr_pool
+
+
+def shutdown_ocr_pool(pool: Optional[ProcessPoolExecutor] = None):
+    """
+    Arrête le pool OCR (appelé à l'arrêt de l'application).
+    Avec `pool`, ne l'arrête que s'il est encore le pool courant : un pool cassé peut déjà
+    avoir été remplacé par une demande concurrente, dont le nouveau pool doit survivre.
+    """
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None or (pool is not None and _ocr_pool is not pool):
+            return
+        current, _ocr_pool = _ocr_pool, None
+    current.shutdown(wait=False, cancel_futures=True)
+
+
+def ocr_image(img) -> str:
+    """OCR d'une image PIL en français par le moteur du processus (voir `ocr_backends`)."""
+    return get_ocr_backend().image_to_string(img)
+
+
+def _ocr_page(pdf_path: str, page_index: int, dpi: int) -> str:
+    """
+    Tâche exécutée dans un processus du pool : rasterise une seule page puis l'OCRise.
+    Seul le texte transite entre les processus, jamais l'image.
+    """
+    img = render_page_from_path(pdf_path, page_index, dpi)
+    try:
+        return ocr_image(img)
+    finally:
+        img.close()
+
+
+def estimate_pages_in_flight(pdf_path: str, dpi: int) -> int:
+    """
+    Calcule le nombre maximal de pages OCR simultanées qui tient dans OCR_MEMORY_BUDGET_MB,
+    à partir de la taille de la plus grande page du document.
+    """
+    workers = max(1, settings.OCR_WORKERS)
+    try:
+        with fitz.open(pdf_path) as doc:
+            largest = max((page.rect.width * page.rect.height for page in doc), default=0)
+    except Exception as e:
+        logger.warning(f"Impossible de mesurer les pages de '{pdf_path}', budget OCR minimal : {e}")
+        return 1
+
+    page_bytes = largest / (72 * 72) * dpi * dpi * _TESSERACT_MEMORY_FACTOR
+    if page_bytes <= 0:
+        return workers
+    budget = settings.OCR_MEMORY_BUDGET_MB * 1024 * 1024
+    return max(1, min(workers, int(budget // page_bytes)))
+
+
+async def ocr_pdf_pages(pdf_path: str, page_indexes: List[int], dpi: Optional[int] = None,
+                        on_page: Optional[Callable[[int, str], None]] = None) -> List[str]:
+    """
+    OCR des pages demandées réparti sur le pool de processus.
+    Le nombre de pages en vol est borné par le budget mémoire et les résultats
+    sont renvoyés dans l'ordre de `page_indexes`. `on_page(index, texte)` est appelé
+    dès qu'une page est OCRisée avec succès (points de reprise).
+    Une page en échec ou la perte du pool fait échouer l'ensemble : les pages restantes
+    sont annulées et aucun texte partiel n'est renvoyé.
+    """
+    dpi = dpi or settings.OCR_DPI
+    loop = asyncio.get_running_loop()
+    pool = get_ocr_pool()
+    in_flight = await asyncio.to_thread(estimate_pages_in_flight, pdf_path, dpi)
+    window = asyncio.Semaphore(in_flight)
+    logger.info(f"OCR parallèle de {len(page_indexes)} pages ({in_flight} page(s) en vol max, {dpi} DPI).")
+
+    async def run(page_index: int) -> str:
+        async with window:
+            try:
+                text = await loop.run_in_executor(pool, _ocr_page, pdf_path, page_index, dpi)
+            except BrokenProcessPool:
+                # Un processus a été tué (OOM...) : le pool est inutilisable, on le recrée au prochain appel
+                shutdown_ocr_pool(pool)
+                raise
+            except Exception as e:
+                raise RuntimeError(f"OCR de la page {page_index + 1} échoué : {e}") from e
+        if on_page is not None:
+            on_page(page_index, text)
+        return text
+
+    tasks = [asyncio.ensure_future(run(i)) for i in page_indexes]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
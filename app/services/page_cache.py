@@ -0,0 +1,47 @@
+import hashlib
+import os
+from typing import Optional
+
+import fitz  # PyMuPDF
+
+from app.core.config import settings
+from app.services.disk_cache import DiskCache
+from app.services.metrics import CallbackCounter, cache_lookups
+
+# À incrémenter si le rendu ou l'OCR changent (invalide toutes les entrées existantes)
+OCR_CACHE_VERSION = "1"
+
+# Cache global initialisé paresseusement, partagé par tous les utilisateurs
+_page_cache: Optional[DiskCache] = None
+
+
+def get_page_cache() -> DiskCache:
+    global _page_cache
+    if _page_cache is None:
+        _page_cache = DiskCache(
+            os.path.join(settings.DATA_DIR, "cache", "pages"),
+            settings.PAGE_CACHE_MAX_MB * 1024 * 1024,
+        )
+    return _page_cache
+
+
+CallbackCounter(
+    "rpgpdf2txt_page_cache_lookups_total", "Recherches dans le cache des pages OCRisées", ["result"],
+    lambda: cache_lookups(_page_cache),
+)
+
+
+def page_cache_key(doc: fitz.Document, page: fitz.Page, dpi: int) -> str:
+    """
+    Empreinte du contenu d'une page : flux de contenu, images référencées, géométrie
+    et paramètres d'OCR. Deux pages identiques dans deux PDF différents (errata,
+    réédition, supplément) partagent donc la même clé.
+    """
+    h = hashlib.sha256()
+    h.update(f"v{OCR_CACHE_VERSION}|{dpi}|fra|{page.rotation}|{tuple(page.rect)}".encode())
+    h.update(page.read_contents())
+    # Le flux de contenu d'un scan se résume à "dessiner /Im0" : il faut hacher l'image elle-même
+    for image in page.get_images(full=True):
+        xref = image[0]
+        h.update(hashlib.sha256(doc.xref_stream_raw(xref) or b"").digest())
+    return h.hexdigest()
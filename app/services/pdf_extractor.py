@@ -1,53 +1,235 @@
 import fitz  # PyMuPDF
-from pdf2image import convert_from_path
-import pytesseract
 from loguru import logger
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
 import os
+import asyncio
+
+from app.core.config import settings
+from app.services.checkpoint import JobCheckpoint
+from app.services.ocr_engine import ocr_image, ocr_pdf_pages
+from app.services.page_cache import get_page_cache, page_cache_key
+from app.services.rasterizer import iter_page_images
+
+# Seuils du classifieur page par page
+MIN_PAGE_CHARS = 40            # En dessous, la couche texte est considérée comme absente
+MIN_CHARS_PER_SQ_INCH = 0.5    # Densité de texte minimale d'une page "texte" (A4 ≈ 97 pouces²)
+MIN_IMAGE_COVERAGE = 0.3       # Part de la page couverte par des images pour soupçonner un scan
+
+# Estimation du coût d'une extraction (ordonnancement de la file, plus courts travaux d'abord)
+COST_SAMPLE_PAGES = 8          # Pages classées pour estimer la part du document à OCRiser
+OCR_PAGE_COST = 20             # Une page OCRisée coûte environ autant que 20 pages natives
+IA_COST_FACTOR = 3             # La correction IA triple environ la durée d'une demande
+
+@dataclass
+class ExtractionResult:
+    """Résultat d'une extraction : texte fusionné dans l'ordre des pages et statistiques."""
+    text: str
+    page_count: int = 0
+    native_pages: int = 0
+    ocr_pages: int = 0
+    ocr_page_indexes: List[int] = field(default_factory=list)
+    cached_pages: int = 0
+
+@dataclass
+class ExtractionEstimate:
+    """Estimation d'une extraction avant sa mise en file (admission et ordonnancement)."""
+    pages: int
+    ocr_pages: int
+    cost: int  # Coût relatif en « pages natives »
+
+def _image_coverage(page: fitz.Page) -> float:
+    """Fraction de la surface de la page couverte par des images (bornée à 1)."""
+    page_rect = page.rect
+    page_area = page_rect.width * page_rect.height
+    if page_area <= 0:
+        return 0.0
+    covered = 0.0
+    for info in page.get_image_info():
+        bbox = fitz.Rect(info["bbox"]) & page_rect
+        if not bbox.is_empty:
+            covered += bbox.width * bbox.height
+    return min(1.0, covered / page_area)
+
+def page_needs_ocr(page: fitz.Page, text: str) -> bool:
+    """
+    Classifieur page par page : une page est OCRisée si elle est largement couverte
+    d'images et que sa couche texte est absente, sans police, ou trop clairsemée.
+    Une page sans image ni texte (page blanche) n'est jamais OCRisée.
+    """
+    coverage = _image_coverage(page)
+    if coverage < MIN_IMAGE_COVERAGE:
+        return False
+
+    chars = len(text.strip())
+    if chars < MIN_PAGE_CHARS or not page.get_fonts():
+        return True
+
+    area_sq_inch = (page.rect.width * page.rect.height) / (72 * 72)
+    return area_sq_inch > 0 and chars / area_sq_inch < MIN_CHARS_PER_SQ_INCH
+
+def estimate_extraction(pdf_path: str, ia_validate: bool = False) -> Optional[ExtractionEstimate]:
+    """
+    Coût relatif d'une extraction en « pages natives » : le nombre de pages, la part à OCRiser
+    (estimée sur un échantillon réparti dans le document) comptant OCR_PAGE_COST fois, le tout
+    multiplié par IA_COST_FACTOR si la correction IA est demandée.
+    Renvoie None si le PDF ne peut pas être lu (l'extraction signalera l'erreur).
+    """
+    try:
+        with fitz.open(pdf_path) as doc:
+            page_count = doc.page_count
+            if page_count == 0:
+                return ExtractionEstimate(pages=0, ocr_pages=0, cost=0)
+            sample = range(0, page_count, max(1, page_count // COST_SAMPLE_PAGES))[:COST_SAMPLE_PAGES]
+            ocr_sampled = sum(1 for i in sample if page_needs_ocr(doc[i], doc[i].get_text("text")))
+    except Exception as e:
+        logger.warning(f"Coût d'extraction non estimé pour '{pdf_path}' : {e}")
+        return None
+    ocr_pages = round(page_count * ocr_sampled / len(sample))
+    cost = page_count + ocr_pages * (OCR_PAGE_COST - 1)
+    if ia_validate:
+        cost *= IA_COST_FACTOR
+    return ExtractionEstimate(pages=page_count, ocr_pages=ocr_pages, cost=cost)
+
+def _analyze_pages(pdf_path: str) -> tuple[List[str], dict, dict]:
+    """
+    Lit la couche texte de chaque page et consulte le cache de pages pour celles à OCRiser.
+    Retourne (textes natifs, {index: texte OCR en cache}, {index: clé de cache} des pages restant à OCRiser).
+    """
+    texts = []
+    cached = {}
+    to_ocr = {}
+    cache = get_page_cache()
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            text = page.get_text("text")
+            texts.append(text)
+            if page_needs_ocr(page, text):
+                key = page_cache_key(doc, page, settings.OCR_DPI)
+                cached_text = cache.get(key)
+                if cached_text is not None:
+                    cached[page.number] = cached_text
+                else:
+                    to_ocr[page.number] = key
+    if cached:
+        logger.info(f"Cache de pages : {len(cached)} page(s) OCR réutilisée(s).")
+    return texts, cached, to_ocr
+
+def _store_pages(ocr_texts: dict, keys: dict):
+    """Enregistre les pages fraîchement OCRisées dans le cache de pages."""
+    cache = get_page_cache()
+    for page_index, text in ocr_texts.items():
+        # Une page vide peut venir d'un échec OCR : on ne la fige pas dans le cache
+        if text.strip():
+            cache.put(keys[page_index], text)
+
+def _merge_pages(texts: List[str], ocr_texts: dict, cached_pages: int = 0) -> ExtractionResult:
+    """Remplace le texte natif des pages OCRisées et fusionne le tout dans l'ordre des pages."""
+    merged = [ocr_texts.get(i, text) for i, text in enumerate(texts)]
+    ocr_indexes = sorted(ocr_texts)
+    return ExtractionResult(
+        text="\n".join(merged).strip(),
+        page_count=len(texts),
+        native_pages=len(texts) - len(ocr_indexes),
+        ocr_pages=len(ocr_indexes),
+        ocr_page_indexes=ocr_indexes,
+        cached_pages=cached_pages,
+    )
+
+def extract_pdf(pdf_path: str) -> ExtractionResult:
+    """
+    Extraction hybride séquentielle : couche texte PyMuPDF pour les pages qui en ont une,
+    OCR (pytesseract, une page rastérisée à la fois) uniquement pour les pages image.
+    """
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError(f"File not found: {pdf_path}")
+
+    texts, cached, to_ocr = _analyze_pages(pdf_path)
+    ocr_texts = {}
+    if to_ocr:
+        logger.info(f"{len(to_ocr)}/{len(texts)} pages sans couche texte exploitable, OCR en cours.")
+        try:
+            for page_index, img in iter_page_images(pdf_path, settings.OCR_DPI, sorted(to_ocr)):
+                try:
+                    ocr_texts[page_index] = ocr_image(img)
+                except Exception as e:
+                    # Comme la variante asynchrone : pas de résultat amputé des pages en échec
+                    raise RuntimeError(f"OCR de la page {page_index + 1} échoué : {e}") from e
+        finally:
+            # Les pages déjà OCRisées servent à la prochaine tentative
+            _store_pages(ocr_texts, to_ocr)
+
+    return _merge_pages(texts, {**cached, **ocr_texts}, len(cached))
 
 def extract_text_from_pdf(pdf_path: str) -> str:
     """
-    Extracts text using PyMuPDF. If the text is too short (maybe it's a scan),
-    falls back to OCR using pdf2image and pytesseract.
+    Extracts text page by page: PyMuPDF text layer where present, OCR only for
+    image-only pages (scans, illustrated pages).
+    """
+    return extract_pdf(pdf_path).text
+
+async def extract_pdf_async(pdf_path: str, checkpoint: Optional[JobCheckpoint] = None,
+                            on_progress: Optional[Callable[[int, int], None]] = None) -> ExtractionResult:
+    """
+    Variante asynchrone de `extract_pdf` utilisée par le pipeline d'extraction :
+    la couche texte est lue dans un thread, seules les pages image sont réparties
+    sur le pool de processus de `ocr_engine`.
+    Avec `checkpoint`, chaque page OCRisée est enregistrée dès qu'elle est prête et
+    les pages déjà enregistrées par une exécution interrompue ne sont pas refaites.
+    `on_progress(pages OCRisées, pages à OCRiser)` suit l'avancement de l'OCR.
     """
     if not os.path.exists(pdf_path):
         raise FileNotFoundError(f"File not found: {pdf_path}")
-        
-    text = ""
-    try:
-        # Try PyMuPDF first
-        doc = fitz.open(pdf_path)
-        for page in doc:
-            text += page.get_text("text") + "\n"
-        doc.close()
-        
-        # If we got meaningful text, return it
-        if len(text.strip()) > 100:
-            logger.info("Successfully extracted text using PyMuPDF.")
-            return text.strip()
-            
-        logger.info("Extracted text is too short, assuming scanned document. Falling back to OCR.")
-    except Exception as e:
-        logger.warning(f"PyMuPDF failed, falling back to OCR: {e}")
-        
-    # Fallback to OCR
-    try:
-        images = convert_from_path(pdf_path)
-        ocr_text = ""
-        for i, img in enumerate(images):
-            # Using French language if available, fallback to eng
-            # Note: tesseract-ocr-fra needs to be installed on the system
-            # If 'fra' fails due to missing language pack, it will default to English or fail.
-            try:
-                page_text = pytesseract.image_to_string(img, lang="fra")
-            except Exception as e:
-                logger.warning(f"French OCR failed, falling back to default: {e}")
-                page_text = pytesseract.image_to_string(img) # fallback default
-                
-            ocr_text += page_text + "\n"
-            
-        logger.info("Successfully extracted text using OCR.")
-        return ocr_text.strip()
-    except Exception as e:
-        logger.error(f"OCR Extraction failed: {e}")
-        # Return whatever we got from PyMuPDF, even if short/empty
-        return text.strip()
+
+    texts, cached, to_ocr = await asyncio.to_thread(_analyze_pages, pdf_path)
+    ocr_texts = {}
+    if checkpoint and to_ocr:
+        done = await asyncio.to_thread(checkpoint.load, "ocr")
+        ocr_texts = {i: entry["text"] for i, entry in done.items() if i in to_ocr}
+    remaining = sorted(i for i in to_ocr if i not in ocr_texts)
+    if remaining:
+        logger.info(f"{len(remaining)}/{len(texts)} pages sans couche texte exploitable, OCR en cours.")
+        cache = get_page_cache()
+        done_count = len(to_ocr) - len(remaining)
+        if on_progress:
+            on_progress(done_count, len(to_ocr))
+        # Pages OCRisées en attente d'enregistrement ; un seul enregistreur à la fois, hors de la boucle
+        unsaved = []
+        saver: Optional[asyncio.Future] = None
+
+        def save(batch: list):
+            if checkpoint:
+                checkpoint.extend("ocr", [{"index": i, "text": text} for i, text in batch])
+            for page_index, text in batch:
+                if text.strip():
+                    cache.put(to_ocr[page_index], text)
+
+        async def save_pending():
+            while unsaved:
+                batch = unsaved[:]
+                unsaved.clear()
+                await asyncio.to_thread(save, batch)
+
+        def on_page(page_index: int, text: str):
+            nonlocal done_count, saver
+            # Enregistrement au fil de l'eau : un arrêt brutal ne perd que les pages en vol
+            unsaved.append((page_index, text))
+            if saver is None or saver.done():
+                saver = asyncio.ensure_future(save_pending())
+            done_count += 1
+            if on_progress:
+                on_progress(done_count, len(to_ocr))
+
+        # Un échec d'OCR fait échouer la demande : un texte amputé de pages serait mis en cache
+        # par empreinte du PDF et resservi à tous les doublons
+        try:
+            pages = await ocr_pdf_pages(pdf_path, remaining, on_page=on_page)
+        finally:
+            # Les pages déjà OCRisées sont enregistrées même en cas d'échec ou d'interruption (reprise)
+            if saver is not None:
+                await saver
+        ocr_texts.update(zip(remaining, pages))
+
+    result = _merge_pages(texts, {**cached, **ocr_texts}, len(cached))
+    logger.info(f"Extraction terminée : {result.native_pages} page(s) natives, {result.ocr_pages} page(s) OCRisées dont {result.cached_pages} depuis le cache.")
+    return result
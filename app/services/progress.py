@@ -0,0 +1,171 @@
+"""
+Avancement des demandes d'extraction.
+
+Côté worker, `ProgressReporter` écrit l'étape en cours (et l'élément courant / total)
+dans la demande, en espaçant les écritures. Côté API, `ProgressBroker` lit la base une
+seule fois par intervalle pour tous les abonnés et ne leur transmet que les demandes
+dont l'avancement a changé : la charge ne dépend pas du nombre de clients connectés.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Set
+
+from loguru import logger
+from sqlalchemy import or_, update
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models import ExtractionRequest
+from app.services.job_queue import queue_positions
+from app.services.metrics import PROGRESS_WRITES
+
+# Statuts pour lesquels la demande est encore suivie
+_ACTIVE_STATUSES = ["pending", "processing"]
+
+
+class ProgressReporter:
+    """
+    Publie l'avancement d'une demande ; les écritures sont espacées d'au moins PROGRESS_MIN_INTERVAL.
+    Appelé depuis la boucle d'événements, l'écriture part dans un thread (seule la dernière valeur
+    est écrite si plusieurs s'accumulent) ; hors boucle, elle est faite sur place.
+    """
+
+    def __init__(self, request_id: int):
+        self.request_id = request_id
+        self._stage: Optional[str] = None
+        self._last_write = 0.0
+        self._latest: Optional[tuple] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    def report(self, stage: str, current: Optional[int] = None, total: Optional[int] = None):
+        now = time.monotonic()
+        finished = current is not None and current == total
+        # Changement d'étape et fin d'étape toujours publiés ; sinon au plus une écriture par intervalle
+        if stage == self._stage and not finished and now - self._last_write < settings.PROGRESS_MIN_INTERVAL:
+            return
+        self._stage = stage
+        self._last_write = now
+        values = (stage, current, total, datetime.now(timezone.utc))
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(values)
+            return
+        self._latest = values
+        if self._writer is None or self._writer.done():
+            self._writer = loop.create_task(self._flush())
+
+    async def _flush(self):
+        while self._latest is not None:
+            values, self._latest = self._latest, None
+            await asyncio.to_thread(self._write, values)
+
+    def _write(self, values: tuple):
+        stage, current, total, at = values
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(ExtractionRequest)
+                .where(ExtractionRequest.id == self.request_id, ExtractionRequest.status == "processing")
+                .values(progress_stage=stage, progress_current=current, progress_total=total, progress_at=at)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            PROGRESS_WRITES.inc()
+        except Exception as e:
+            # L'avancement est informatif : une écriture manquée ne doit pas faire échouer l'extraction
+            logger.warning(f"Avancement de la demande {self.request_id} non enregistré : {e}")
+        finally:
+            db.close()
+
+
+def progress_event(req: ExtractionRequest, queue_position: Optional[int] = None) -> dict:
+    return {
+        "id": req.id,
+        "id_texte": req.id_texte,
+        "status": req.status,
+        "stage": req.progress_stage if req.status == "processing" else None,
+        "current": req.progress_current if req.status == "processing" else None,
+        "total": req.progress_total if req.status == "processing" else None,
+        "queue_position": queue_position if req.status == "pending" else None,
+    }
+
+
+class ProgressBroker:
+    """Diffuse les changements d'avancement aux abonnés (une file asyncio par connexion SSE)."""
+
+    def __init__(self):
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self._last: Dict[int, tuple] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1000)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def _poll(self, user_ids: list, since: datetime) -> list:
+        """
+        Demandes actives ou terminées depuis `since` des utilisateurs abonnés, avec la position
+        dans la file de celles en attente (une requête pour les demandes, une pour les positions).
+        """
+        db = SessionLocal()
+        try:
+            rows = db.query(ExtractionRequest).filter(
+                ExtractionRequest.user_id.in_(user_ids),
+                or_(
+                    ExtractionRequest.status.in_(_ACTIVE_STATUSES),
+                    ExtractionRequest.completed_at >= since,
+                ),
+            ).all()
+            positions = queue_positions(db, [r.id for r in rows if r.status == "pending"])
+            return [(r.user_id, progress_event(r, positions.get(r.id))) for r in rows]
+        finally:
+            db.close()
+
+    async def _run(self):
+        # Marge pour ne pas manquer une fin de traitement survenue pendant la lecture précédente
+        since = datetime.now(timezone.utc) - timedelta(seconds=settings.PROGRESS_POLL_INTERVAL)
+        while self._subscribers:
+            tick = datetime.now(timezone.utc)
+            try:
+                rows = await asyncio.to_thread(self._poll, list(self._subscribers), since)
+            except Exception as e:
+                logger.error(f"Lecture de l'avancement impossible : {e}")
+                rows = []
+            since = tick - timedelta(seconds=settings.PROGRESS_POLL_INTERVAL)
+            for user_id, event in rows:
+                state = (event["status"], event["stage"], event["current"], event["total"], event["queue_position"])
+                if self._last.get(event["id"]) == state:
+                    continue
+                self._last[event["id"]] = state
+                for queue in list(self._subscribers.get(user_id, ())):
+                    if not queue.full():
+                        queue.put_nowait(event)
+            # Les demandes terminées ne sont plus suivies : la mémoire reste bornée
+            seen = {event["id"] for _, event in rows}
+            for request_id, state in list(self._last.items()):
+                if state[0] not in _ACTIVE_STATUSES and request_id not in seen:
+                    del self._last[request_id]
+            await asyncio.sleep(settings.PROGRESS_POLL_INTERVAL)
+
+
+# Diffuseur global du processus web, initialisé paresseusement
+_broker: Optional[ProgressBroker] = None
+
+
+def get_progress_broker() -> ProgressBroker:
+    global _broker
+    if _broker is None:
+        _broker = ProgressBroker()
+    return _broker
@@ -0,0 +1,75 @@
+import os
+import threading
+from typing import Iterable, Iterator, Optional, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+# Document ouvert conservé par processus pour éviter de réanalyser le PDF à chaque page.
+# Il est refermé après OPEN_DOC_IDLE_SECONDS sans rendu : le PDF temporaire d'une demande
+# terminée est supprimé, et un descripteur resté ouvert garderait son espace disque alloué.
+OPEN_DOC_IDLE_SECONDS = 5.0
+_open_doc: Optional[Tuple[tuple, fitz.Document]] = None
+_open_doc_lock = threading.Lock()
+_close_timer: Optional[threading.Timer] = None
+
+
+def render_page(doc: fitz.Document, page_index: int, dpi: int) -> Image.Image:
+    """
+    Rastérise une page en niveaux de gris (Tesseract binarise de toute façon),
+    ce qui divise par trois la mémoire par rapport à du RGB.
+    Le pixmap PyMuPDF est libéré dès que l'image PIL est construite.
+    """
+    pix = doc[page_index].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    try:
+        return Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    finally:
+        del pix
+
+
+def iter_page_images(pdf_path: str, dpi: int, page_indexes: Optional[Iterable[int]] = None) -> Iterator[Tuple[int, Image.Image]]:
+    """
+    Générateur produisant (index, image) une page à la fois.
+    L'image précédente est fermée dès que le consommateur demande la suivante :
+    la mémoire crête reste celle d'une seule page quelle que soit la taille du document.
+    """
+    with fitz.open(pdf_path) as doc:
+        indexes = range(doc.page_count) if page_indexes is None else page_indexes
+        for page_index in indexes:
+            img = render_page(doc, page_index, dpi)
+            try:
+                yield page_index, img
+            finally:
+                img.close()
+
+
+def close_open_document():
+    """Referme le document conservé par ce processus (fin d'inactivité)."""
+    global _open_doc
+    with _open_doc_lock:
+        if _open_doc is not None:
+            _open_doc[1].close()
+            _open_doc = None
+
+
+def render_page_from_path(pdf_path: str, page_index: int, dpi: int) -> Image.Image:
+    """
+    Rastérise une page d'un fichier en réutilisant le document déjà ouvert par ce processus
+    (les workers OCR traitent en général plusieurs pages du même PDF à la suite).
+    """
+    global _open_doc, _close_timer
+    with _open_doc_lock:
+        if _close_timer is not None:
+            _close_timer.cancel()
+        stat = os.stat(pdf_path)
+        key = (pdf_path, stat.st_mtime_ns, stat.st_size)
+        if _open_doc is None or _open_doc[0] != key:
+            if _open_doc is not None:
+                _open_doc[1].close()
+            _open_doc = (key, fitz.open(pdf_path))
+        try:
+            return render_page(_open_doc[1], page_index, dpi)
+        finally:
+            _close_timer = threading.Timer(OPEN_DOC_IDLE_SECONDS, close_open_document)
+            _close_timer.daemon = True
+            _close_timer.start()
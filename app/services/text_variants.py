@@ -0,0 +1,119 @@
+"""
+Variantes précompressées des fichiers texte résultats.
+
+À côté de chaque `<fichier>.txt` sont écrits `<fichier>.txt.gz` et, si le module optionnel
+`zstandard` est installé, `<fichier>.txt.zst`. Le téléchargement choisit la variante selon
+l'en-tête `Accept-Encoding` : le texte est compressé une seule fois, pas à chaque envoi.
+"""
+import gzip
+import os
+import shutil
+import uuid
+from typing import Dict, Optional
+
+from loguru import logger
+
+try:
+    import zstandard
+except ImportError:  # dépendance optionnelle : seule la variante gzip est produite
+    zstandard = None
+
+# Ordre de préférence à qualité (q) égale
+_SUFFIXES = {"zstd": ".zst", "gzip": ".gz"}
+ZSTD_LEVEL = 19
+
+
+def available_encodings() -> tuple:
+    return tuple(e for e in _SUFFIXES if e != "zstd" or zstandard is not None)
+
+
+def variant_path(txt_path: str, encoding: str) -> str:
+    return txt_path + _SUFFIXES[encoding]
+
+
+def _compress(txt_path: str, encoding: str):
+    dest = variant_path(txt_path, encoding)
+    tmp_path = f"{dest}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(txt_path, "rb") as src:
+            if encoding == "gzip":
+                # mtime=0 : même texte, mêmes octets (variante reproductible)
+                with gzip.GzipFile(tmp_path, "wb", compresslevel=9, mtime=0) as out:
+                    shutil.copyfileobj(src, out)
+            else:
+                with open(tmp_path, "wb") as out:
+                    zstandard.ZstdCompressor(level=ZSTD_LEVEL).copy_stream(src, out)
+        os.replace(tmp_path, dest)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def fresh_variant(txt_path: str, encoding: str) -> Optional[str]:
+    """Chemin de la variante si elle existe et n'est pas plus ancienne que le texte, sinon None."""
+    path = variant_path(txt_path, encoding)
+    try:
+        if os.path.getmtime(path) >= os.path.getmtime(txt_path):
+            return path
+    except OSError:
+        pass
+    return None
+
+
+def write_compressed_variants(txt_path: str):
+    """Écrit (ou réécrit si périmées) les variantes compressées de `txt_path` ; un échec n'est pas bloquant."""
+    for encoding in available_encodings():
+        if fresh_variant(txt_path, encoding):
+            continue
+        try:
+            _compress(txt_path, encoding)
+        except OSError as e:
+            logger.warning(f"Variante {encoding} de '{txt_path}' non écrite : {e}")
+
+
+def remove_variants(txt_path: str):
+    for encoding in _SUFFIXES:
+        try:
+            os.remove(variant_path(txt_path, encoding))
+        except FileNotFoundError:
+            pass
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """`gzip;q=0.8, zstd` -> {"gzip": 0.8, "zstd": 1.0} (codages en minuscules)."""
+    accepted = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(header: Optional[str]) -> Optional[str]:
+    """Codage préféré par le client parmi ceux disponibles, ou None (texte brut)."""
+    accepted = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for encoding in available_encodings():
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparaison faible de `If-None-Match` (liste d'ETags ou `*`) avec l'ETag de la représentation."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in tags
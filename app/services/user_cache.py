@@ -0,0 +1,136 @@
+"""
+Cache mémoire des utilisateurs authentifiés, indexé par jeton (JWT ou jeton d'API).
+
+Un client qui interroge l'API toutes les secondes ne coûte plus une requête SQL par appel :
+le jeton est résolu en un accès dictionnaire. Les entrées expirent après USER_CACHE_TTL
+secondes (ou à l'expiration du JWT si elle est plus proche) et le cache est borné à
+USER_CACHE_MAX_ENTRIES entrées (éviction LRU). Toute modification ou suppression d'un
+`User` via l'ORM invalide ses entrées ; une modification faite par un autre processus
+n'est vue qu'à l'expiration de l'entrée.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import User
+from app.services.metrics import CallbackCounter, cache_lookups
+
+
+class UserCache:
+    """Cache LRU à durée de vie limitée : clé de jeton -> `User` détaché de toute session."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._keys_by_user: Dict[int, Set[Hashable]] = {}
+        # Les invalidations arrivent aussi des routes synchrones (threads du pool de FastAPI)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[User]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, user = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return user
+
+    def put(self, key: Hashable, user: User, expires_at: Optional[float] = None):
+        """Mémorise `user` ; `expires_at` (horodatage epoch, ex. `exp` du JWT) raccourcit la durée de vie."""
+        lifetime = self.ttl
+        if expires_at is not None:
+            lifetime = min(lifetime, expires_at - time.time())
+        if lifetime <= 0:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + lifetime, user)
+            self._keys_by_user.setdefault(user.id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_id = entry[1].id
+        keys = self._keys_by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user_id]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+        }
+
+
+# Cache global du processus web, initialisé paresseusement
+_user_cache: Optional[UserCache] = None
+
+
+def get_user_cache() -> UserCache:
+    global _user_cache
+    if _user_cache is None:
+        _user_cache = UserCache(settings.USER_CACHE_MAX_ENTRIES, settings.USER_CACHE_TTL)
+    return _user_cache
+
+
+CallbackCounter(
+    "rpgpdf2txt_user_cache_lookups_total", "Résolutions de jeton par le cache des utilisateurs", ["result"],
+    lambda: cache_lookups(_user_cache),
+)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target: User):
+    # Invalidation immédiate, puis de nouveau au commit : une lecture concurrente faite entre
+    # le flush et le commit a pu remettre en cache l'ancienne version
+    get_user_cache().invalidate_user(target.id)
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_user_ids", set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session: Session):
+    for user_id in session.info.pop("changed_user_ids", ()):
+        get_user_cache().invalidate_user(user_id)
@@ -1,41 +1,255 @@
+"""
+Livraison des webhooks (clients et Discord) via une boîte d'envoi persistante.
+
+Les appelants enregistrent les notifications dans la table `webhook_deliveries`
+(`enqueue_client_webhook`, `enqueue_discord_notification`) au sein de leur propre
+transaction. Le dispatcher (`run_webhook_dispatcher`, lancé par le serveur web et par
+les workers) réserve atomiquement les livraisons dues, les envoie avec un client HTTP
+partagé, borne le nombre d'envois simultanés par hôte, regroupe les messages Discord
+destinés au même salon et reprogramme les échecs avec un backoff exponentiel.
+"""
+import asyncio
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
 import httpx
 from loguru import logger
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models import WebhookDelivery
+from app.services.metrics import WEBHOOKS
+
+# Limite de Discord pour le champ `content` d'un message
+DISCORD_MAX_CONTENT = 2000
+
+# Client HTTP partagé (pool de connexions), initialisé paresseusement dans la boucle courante
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+# Événement de réveil du dispatcher du processus courant (None si aucun dispatcher actif)
+_wakeup: Optional[asyncio.Event] = None
+
+
+def is_discord_url(url: str) -> bool:
+    return "discord.com/api/webhooks" in url
+
+
+def _format_for_discord(payload: dict) -> dict:
+    # Auto-format payload if the user provided a Discord webhook URL as their client webhook
+    payload_str = json.dumps(payload, indent=2, ensure_ascii=False)
+    if len(payload_str) > 1800:
+        payload_str = payload_str[:1800] + "\n...[Texte tronqué pour Discord]..."
+    return {"content": f"**Nouvelle extraction terminée**\n```json\n{payload_str}\n```"}
+
 
-async def send_discord_notification(webhook_url: str, message: str):
+def _enqueue(db: Session, url: str, payload: dict):
+    db.add(WebhookDelivery(
+        url=url,
+        payload=json.dumps(payload, ensure_ascii=False),
+        status="pending",
+        attempts=0,
+        next_attempt_at=datetime.now(timezone.utc),
+    ))
+
+
+def enqueue_client_webhook(db: Session, webhook_url: str, payload: dict):
+    """Ajoute une notification client à la boîte d'envoi (validée par le commit de l'appelant)."""
     if not webhook_url:
-        logger.warning("Discord webhook URL not configured. Skipping notification.")
         return
-    
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                webhook_url,
-                json={"content": message}
-            )
-            response.raise_for_status()
-            logger.info("Discord notification sent successfully.")
-    except Exception as e:
-        logger.error(f"Failed to send Discord notification: {e}")
-
-async def send_client_webhook(webhook_url: str, payload: dict):
+    _enqueue(db, webhook_url, _format_for_discord(payload) if is_discord_url(webhook_url) else payload)
+
+
+def enqueue_discord_notification(db: Session, webhook_url: str, message: str):
+    """Ajoute un message Discord d'administration à la boîte d'envoi (validé par le commit de l'appelant)."""
     if not webhook_url:
+        logger.warning("Discord webhook URL not configured. Skipping notification.")
         return
-        
-    # Auto-format payload if the user provided a Discord webhook URL as their client webhook
-    if "discord.com/api/webhooks" in webhook_url:
-        import json
-        payload_str = json.dumps(payload, indent=2)
-        if len(payload_str) > 1800:
-            payload_str = payload_str[:1800] + "\n...[Texte tronqué pour Discord]..."
-        payload = {"content": f"**Nouvelle extraction terminée**\n```json\n{payload_str}\n```"}
-        
+    _enqueue(db, webhook_url, {"content": message})
+
+
+def notify_webhooks():
+    """Réveille le dispatcher du processus courant après un commit contenant des livraisons."""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def get_webhook_client() -> httpx.AsyncClient:
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.WEBHOOK_TIMEOUT),
+            limits=httpx.Limits(max_connections=settings.WEBHOOK_MAX_CONNECTIONS, max_keepalive_connections=20),
+        )
+        _client_loop = loop
+    return _client
+
+
+def claim_due_deliveries(db: Session, limit: int) -> List[WebhookDelivery]:
+    """
+    Réserve atomiquement les livraisons dues (`pending` dont l'échéance est passée) ainsi que
+    celles restées en `sending` trop longtemps (dispatcher arrêté brutalement).
+    """
+    now = datetime.now(timezone.utc)
+    stale = now - timedelta(seconds=settings.WEBHOOK_STALE_AFTER)
+    due = or_(
+        (WebhookDelivery.status == "pending") & (WebhookDelivery.next_attempt_at <= now),
+        (WebhookDelivery.status == "sending") & (WebhookDelivery.claimed_at < stale),
+    )
+    candidates = (
+        select(WebhookDelivery.id)
+        .where(due)
+        .order_by(WebhookDelivery.next_attempt_at.asc(), WebhookDelivery.id.asc())
+        .limit(limit)
+    )
+    # La condition est revérifiée dans l'UPDATE : deux dispatchers ne réservent jamais la même ligne
+    claimed_ids = db.execute(
+        update(WebhookDelivery)
+        .where(WebhookDelivery.id.in_(candidates), due)
+        .values(status="sending", claimed_at=now)
+        .returning(WebhookDelivery.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    if not claimed_ids:
+        return []
+    deliveries = db.query(WebhookDelivery).filter(WebhookDelivery.id.in_(claimed_ids)).order_by(WebhookDelivery.id).all()
+    db.expunge_all()
+    return deliveries
+
+
+def _retry_delay(attempts: int, response: Optional[httpx.Response]) -> float:
+    if response is not None and response.headers.get("retry-after"):
+        try:
+            return float(response.headers["retry-after"])
+        except ValueError:
+            pass
+    return min(settings.WEBHOOK_BACKOFF_BASE * (2 ** (attempts - 1)), settings.WEBHOOK_BACKOFF_MAX)
+
+
+def record_results(db: Session, results: Dict[int, Optional[tuple]]):
+    """
+    Enregistre l'issue des envois : None = livré, sinon (erreur, réponse, définitif).
+    Les échecs transitoires sont reprogrammés avec un backoff exponentiel.
+    """
+    now = datetime.now(timezone.utc)
+    deliveries = db.query(WebhookDelivery).filter(WebhookDelivery.id.in_(list(results))).all()
+    for delivery in deliveries:
+        outcome = results[delivery.id]
+        delivery.claimed_at = None
+        if outcome is None:
+            WEBHOOKS.inc("delivered")
+            delivery.status = "delivered"
+            delivery.delivered_at = now
+            delivery.last_error = None
+            continue
+        error, response, permanent = outcome
+        delivery.attempts = (delivery.attempts or 0) + 1
+        delivery.last_error = error
+        if permanent or delivery.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+            WEBHOOKS.inc("failed")
+            delivery.status = "failed"
+            logger.error(f"Webhook {delivery.id} vers {delivery.url} abandonné après {delivery.attempts} tentative(s) : {error}")
+        else:
+            WEBHOOKS.inc("retry")
+            delivery.status = "pending"
+            delivery.next_attempt_at = now + timedelta(seconds=_retry_delay(delivery.attempts, response))
+            logger.warning(f"Webhook {delivery.id} vers {delivery.url} en échec ({error}), tentative {delivery.attempts}/{settings.WEBHOOK_MAX_ATTEMPTS}.")
+    db.commit()
+
+
+def _batch_discord(deliveries: List[WebhookDelivery]) -> List[tuple]:
+    """
+    Regroupe les messages destinés au même salon Discord en messages d'au plus 2000 caractères.
+    Renvoie une liste de (url, payload, ids des livraisons couvertes).
+    """
+    sends = []
+    by_url: Dict[str, List[WebhookDelivery]] = defaultdict(list)
+    for delivery in deliveries:
+        payload = json.loads(delivery.payload)
+        if is_discord_url(delivery.url) and set(payload) == {"content"}:
+            by_url[delivery.url].append(delivery)
+        else:
+            sends.append((delivery.url, payload, [delivery.id]))
+
+    for url, group in by_url.items():
+        content, ids = "", []
+        for delivery in group:
+            message = json.loads(delivery.payload)["content"][:DISCORD_MAX_CONTENT]
+            if ids and len(content) + 2 + len(message) > DISCORD_MAX_CONTENT:
+                sends.append((url, {"content": content}, ids))
+                content, ids = "", []
+            content = f"{content}\n\n{message}" if ids else message
+            ids.append(delivery.id)
+        if ids:
+            sends.append((url, {"content": content}, ids))
+    return sends
+
+
+async def _post(client: httpx.AsyncClient, url: str, payload: dict, host_limits: Dict[str, asyncio.Semaphore]) -> Optional[tuple]:
+    host = urlsplit(url).netloc
+    async with host_limits[host]:
+        try:
+            response = await client.post(url, json=payload)
+        except httpx.HTTPError as e:
+            return (f"{type(e).__name__}: {e}", None, False)
+    if response.is_success:
+        logger.info(f"Webhook sent successfully to {url}")
+        return None
+    # 4xx (hors 408/429) : le destinataire refuse la requête, inutile d'insister
+    permanent = 400 <= response.status_code < 500 and response.status_code not in (408, 429)
+    return (f"HTTP {response.status_code}", response, permanent)
+
+
+async def deliver_batch(deliveries: List[WebhookDelivery], client: Optional[httpx.AsyncClient] = None) -> Dict[int, Optional[tuple]]:
+    """Envoie un lot de livraisons réservées ; renvoie l'issue de chacune (voir `record_results`)."""
+    client = client or get_webhook_client()
+    host_limits: Dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(settings.WEBHOOK_PER_HOST_CONCURRENCY))
+    sends = _batch_discord(deliveries)
+    outcomes = await asyncio.gather(*(_post(client, url, payload, host_limits) for url, payload, _ in sends))
+    results = {}
+    for (_, _, ids), outcome in zip(sends, outcomes):
+        for delivery_id in ids:
+            results[delivery_id] = outcome
+    return results
+
+
+def _with_session(fn, *args):
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+
+async def run_webhook_dispatcher(stop_event: asyncio.Event):
+    """Boucle de livraison : traite les livraisons dues par lots jusqu'à `stop_event`."""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    wakeup = _wakeup
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                webhook_url,
-                json=payload
-            )
-            response.raise_for_status()
-            logger.info(f"Client webhook sent successfully to {webhook_url}")
-    except Exception as e:
-        logger.error(f"Failed to send client webhook to {webhook_url}: {e}")
+        while not stop_event.is_set():
+            wakeup.clear()
+            try:
+                deliveries = await asyncio.to_thread(_with_session, claim_due_deliveries, settings.WEBHOOK_BATCH_SIZE)
+                if deliveries:
+                    results = await deliver_batch(deliveries)
+                    await asyncio.to_thread(_with_session, record_results, results)
+                    # Lot complet : il reste probablement des livraisons dues
+                    if len(deliveries) == settings.WEBHOOK_BATCH_SIZE:
+                        continue
+            except Exception as e:
+                logger.error(f"Erreur du dispatcher de webhooks : {e}")
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=settings.WEBHOOK_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        _wakeup = None
+        if _client is not None and _client_loop is asyncio.get_running_loop():
+            await _client.aclose()
@@ -93,6 +93,11 @@ async function loadUsers() {
                 <td>${user.email}</td>
                 <td><span class="badge bg-info">${user.role}</span></td>
                 <td>${statusBadge}</td>
+                <td>
+                    <select class="form-select form-select-sm bg-dark text-light border-secondary" style="width: 110px;" onchange="setUserPriority(${user.id}, this.value)">
+                        ${['low', 'normal', 'high'].map(p => `<option value="${p}" ${user.priority === p ? 'selected' : ''}>${PRIORITY_LABELS[p]}</option>`).join('')}
+                    </select>
+                </td>
                 <td><input type="text" class="form-control form-control-sm bg-dark text-muted border-secondary" value="${user.api_token || '-'}" readonly style="width: 150px;"></td>
                 <td><code>${user.directory_name || '-'}</code></td>
                 <td>${actionBtn}</td>
@@ -104,6 +109,30 @@ async function loadUsers() {
     }
 }
 
+// Classes de priorité dans la file d'extraction (part équitable pondérée)
+const PRIORITY_LABELS = { low: 'Basse', normal: 'Normale', high: 'Haute' };
+
+async function setUserPriority(userId, priority) {
+    try {
+        const response = await fetch(`${APP_PREFIX}/api/v1/admin/users/${userId}/priority`, {
+            method: 'POST',
+            headers: {
+                'Authorization': `Bearer ${token}`,
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ priority })
+        });
+
+        if (!response.ok) {
+            const data = await response.json();
+            alert('Erreur: ' + (data.detail || 'Échec du changement de priorité'));
+            loadUsers();
+        }
+    } catch (err) {
+        console.error('Échec du changement de priorité', err);
+    }
+}
+
 async function validateUser(userId) {
     try {
         const response = await fetch(`${APP_PREFIX}/api/v1/admin/users/${userId}/validate`, {
@@ -6,10 +6,28 @@ if (!token) {
     window.location.href = `${APP_PREFIX}/login`;
 }
 
-// Intervalle de polling (null = inactif)
+// Intervalle de polling (null = inactif), utilisé seulement si le navigateur ne supporte pas EventSource
 let pollingInterval = null;
 const POLL_DELAY_MS = 5000;
 
+// Flux SSE de l'avancement des demandes (null = fermé)
+let eventSource = null;
+let reloadTimer = null;
+
+// Pagination de l'historique : taille d'une page et curseur de la page suivante (null = fin)
+const PAGE_SIZE = 100;
+const MAX_PAGE_SIZE = 500;
+let nextCursor = null;
+let loadedCount = 0;
+
+const STAGE_LABELS = {
+    hashing: 'Empreinte',
+    ocr: 'OCR',
+    correction: 'Correction IA',
+    saving: 'Sauvegarde',
+    webhook: 'Notification'
+};
+
 function stopPolling() {
     if (pollingInterval) {
         clearInterval(pollingInterval);
@@ -18,6 +36,44 @@ function stopPolling() {
     updatePollingIndicator(false);
 }
 
+function formatProgress(stage, current, total) {
+    if (!stage) return 'En cours';
+    const label = STAGE_LABELS[stage] || stage;
+    return (total !== null && total !== undefined) ? `${label} ${current}/${total}` : label;
+}
+
+// Recharge la liste une seule fois pour une rafale d'événements (changement de statut)
+function scheduleReload() {
+    if (reloadTimer) return;
+    reloadTimer = setTimeout(() => {
+        reloadTimer = null;
+        loadRequests();
+    }, 300);
+}
+
+function startStream() {
+    if (eventSource) return;
+    eventSource = new EventSource(`${APP_PREFIX}/api/v1/user/requests/stream?token=${encodeURIComponent(token)}`);
+    eventSource.addEventListener('open', () => updatePollingIndicator(true));
+    eventSource.addEventListener('error', () => updatePollingIndicator(false));
+    eventSource.addEventListener('progress', (e) => {
+        const event = JSON.parse(e.data);
+        const row = document.querySelector(`#requestsTableBody tr[data-request-id="${event.id}"]`);
+        if (!row || row.dataset.status !== event.status) {
+            scheduleReload();
+            return;
+        }
+        const progress = row.querySelector('.job-progress');
+        if (progress) {
+            progress.textContent = formatProgress(event.stage, event.current, event.total);
+        }
+        const position = row.querySelector('.job-queue-position');
+        if (position && event.queue_position !== null && event.queue_position !== undefined) {
+            position.textContent = event.queue_position + 1;
+        }
+    });
+}
+
 function updatePollingIndicator(active) {
     const indicator = document.getElementById('pollingIndicator');
     if (indicator) {
@@ -25,105 +81,83 @@ function updatePollingIndicator(active) {
     }
 }
 
-async function loadRequests() {
-    try {
-        const response = await fetch(`${APP_PREFIX}/api/v1/user/requests`, {
-            headers: {
-                'Authorization': `Bearer ${token}`
-            }
-        });
+function updateLoadMoreButton() {
+    const button = document.getElementById('loadMoreBtn');
+    if (button) {
+        button.style.display = nextCursor ? 'inline-block' : 'none';
+    }
+}
 
-        if (response.status === 401) {
-            window.location.href = `${APP_PREFIX}/login`;
-            return;
+// Récupère une page de l'historique ; renvoie null si la session a expiré
+async function fetchRequestsPage(limit, cursor) {
+    const params = new URLSearchParams({ limit });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`${APP_PREFIX}/api/v1/user/requests?${params}`, {
+        headers: {
+            'Authorization': `Bearer ${token}`
         }
+    });
 
-        const requests = await response.json();
+    if (response.status === 401) {
+        window.location.href = `${APP_PREFIX}/login`;
+        return null;
+    }
+
+    nextCursor = response.headers.get('X-Next-Cursor');
+    updateLoadMoreButton();
+    return await response.json();
+}
+
+async function loadMoreRequests() {
+    if (!nextCursor) return;
+    try {
+        const requests = await fetchRequestsPage(PAGE_SIZE, nextCursor);
+        if (!requests) return;
+        const tbody = document.getElementById('requestsTableBody');
+        requests.forEach(req => tbody.appendChild(renderRequestRow(req)));
+        loadedCount += requests.length;
+        initTooltips();
+    } catch (err) {
+        console.error('Échec du chargement des demandes', err);
+    }
+}
+
+function initTooltips() {
+    // Initialisation des tooltips fraîchement ajoutés au DOM
+    var tooltipTriggerList = [].slice.call(document.querySelectorAll('#requestsTableBody [data-bs-toggle="tooltip"]'));
+    tooltipTriggerList.forEach(function (tooltipTriggerEl) {
+        bootstrap.Tooltip.getOrCreateInstance(tooltipTriggerEl);
+    });
+}
+
+async function loadRequests() {
+    try {
+        // Un rechargement conserve le nombre de lignes déjà affichées
+        const requests = await fetchRequestsPage(Math.min(Math.max(PAGE_SIZE, loadedCount), MAX_PAGE_SIZE), null);
+        if (!requests) return;
+        loadedCount = requests.length;
         const tbody = document.getElementById('requestsTableBody');
         tbody.innerHTML = '';
 
         if (requests.length === 0) {
             tbody.innerHTML = '<tr><td colspan="5" class="text-center py-3">Aucune demande d\'extraction trouvée</td></tr>';
-            stopPolling();
+            if (window.EventSource) {
+                startStream();
+            } else {
+                stopPolling();
+            }
             return;
         }
 
         const hasActiveJobs = requests.some(r => r.status === 'pending' || r.status === 'processing');
 
-        requests.forEach((req, index) => {
-            const tr = document.createElement('tr');
-            let statusBadge = '';
-            let actionBtn = '';
-            let idColumnHtml = req.id; // Par défaut, on affiche juste l'ID métier
-
-            switch (req.status) {
-                case 'success':
-                    statusBadge = '<span class="badge bg-success">Terminé</span>';
-                    actionBtn = `
-                        <div class="btn-group">
-                            <a href="${APP_PREFIX}/api/v1/extract/${req.id}/download?token=${token}" target="_blank" class="btn btn-sm btn-outline-success" title="Télécharger"><i class="bi bi-download"></i> .txt</a>
-                            <button onclick="deleteRequest(${req.id}, '${req.id_texte}')" class="btn btn-sm btn-outline-danger" title="Supprimer"><i class="bi bi-trash"></i></button>
-                        </div>
-                    `;
-                    break;
-                case 'success_cached':
-                    statusBadge = '<span class="badge bg-secondary">Caché</span>';
-                    actionBtn = `
-                        <div class="btn-group">
-                            <a href="${APP_PREFIX}/api/v1/extract/${req.id}/download?token=${token}" target="_blank" class="btn btn-sm btn-outline-secondary" title="Télécharger"><i class="bi bi-download"></i> .txt</a>
-                            <button onclick="deleteRequest(${req.id}, '${req.id_texte}')" class="btn btn-sm btn-outline-danger" title="Supprimer"><i class="bi bi-trash"></i></button>
-                        </div>
-                    `;
-                    if (req.file_hash) {
-                        idColumnHtml = `
-                            <span class="badge border border-secondary text-secondary" style="cursor: help;"
-                                  data-bs-toggle="tooltip" 
-                                  data-bs-placement="top" 
-                                  title="${req.file_hash}">
-                                <i class="bi bi-hdd-network"></i> Caché
-                            </span>
-                         `;
-                    }
-                    break;
-                case 'pending':
-                    statusBadge = '<span class="badge bg-warning text-dark">En attente</span>';
-                    actionBtn = `<button onclick="deleteRequest(${req.id}, '${req.id_texte}')" class="btn btn-sm btn-outline-danger" title="Supprimer"><i class="bi bi-trash"></i></button>`;
-                    if (req.queue_position !== undefined && req.queue_position !== null) {
-                        idColumnHtml = `<span class="badge bg-warning text-dark"><i class="bi bi-hourglass-split"></i> Attente : ${req.queue_position + 1}</span>`;
-                    }
-                    break;
-                case 'processing':
-                    statusBadge = '<span class="badge bg-info text-dark"><span class="spinner-border spinner-border-sm me-1"></span>En cours</span>';
-                    actionBtn = `<span class="text-muted small">Extraction...</span>`;
-                    if (req.queue_position !== undefined && req.queue_position !== null) {
-                        idColumnHtml = `<span class="badge bg-info text-dark"><i class="bi bi-gear-wide-connected"></i> En cours (0)</span>`;
-                    }
-                    break;
-                case 'error':
-                    statusBadge = '<span class="badge bg-danger">Erreur</span>';
-                    actionBtn = `<button onclick="deleteRequest(${req.id}, '${req.id_texte}')" class="btn btn-sm btn-outline-danger" title="Supprimer"><i class="bi bi-trash"></i></button>`;
-                    break;
-            }
-
-            const date = req.created_at ? new Date(req.created_at).toLocaleString() : '-';
-
-            tr.innerHTML = `
-                <td>${idColumnHtml}</td>
-                <td><strong>${req.id_texte}</strong></td>
-                <td>${statusBadge}</td>
-                <td class="small text-muted">${date}</td>
-                <td>${actionBtn}</td>
-            `;
-            tbody.appendChild(tr);
-        });
-
-        // Initialisation des tooltips fraîchement ajoutés au DOM
-        var tooltipTriggerList = [].slice.call(document.querySelectorAll('#requestsTableBody [data-bs-toggle="tooltip"]'));
-        var tooltipList = tooltipTriggerList.map(function (tooltipTriggerEl) {
-            return new bootstrap.Tooltip(tooltipTriggerEl);
-        });
+        requests.forEach(req => tbody.appendChild(renderRequestRow(req)));
+        initTooltips();
 
-        if (hasActiveJobs && !pollingInterval) {
+        if (window.EventSource) {
+            // Les mises à jour arrivent par le flux SSE : plus de rechargement périodique
+            startStream();
+        } else if (hasActiveJobs && !pollingInterval) {
             pollingInterval = setInterval(loadRequests, POLL_DELAY_MS);
             updatePollingIndicator(true);
         } else if (!hasActiveJobs && pollingInterval) {
@@ -134,6 +168,75 @@ async function loadRequests() {
     }
 }
 
+function renderRequestRow(req) {
+    const tr = document.createElement('tr');
+    let statusBadge = '';
+    let actionBtn = '';
+    let idColumnHtml = req.id; // Par défaut, on affiche juste l'ID métier
+
+    switch (req.status) {
+        case 'success':
+            statusBadge = '<span class="badge bg-success">Terminé</span>';
+            actionBtn = `
+                <div class="btn-group">
+                    <a href="${APP_PREFIX}/api/v1/extract/${req.id}/download?token=${token}" target="_blank" class="btn btn-sm btn-outline-success" title="Télécharger"><i class="bi bi-download"></i> .txt</a>
+                    <button onclick="deleteRequest(${req.id}, '${req.id_texte}')" class="btn btn-sm btn-outline-danger" title="Supprimer"><i class="bi bi-trash"></i></button>
+                </div>
+            `;
+            break;
+        case 'success_cached':
+            statusBadge = '<span class="badge bg-secondary">Caché</span>';
+            actionBtn = `
+                <div class="btn-group">
+                    <a href="${APP_PREFIX}/api/v1/extract/${req.id}/download?token=${token}" target="_blank" class="btn btn-sm btn-outline-secondary" title="Télécharger"><i class="bi bi-download"></i> .txt</a>
+                    <button onclick="deleteRequest(${req.id}, '${req.id_texte}')" class="btn btn-sm btn-outline-danger" title="Supprimer"><i class="bi bi-trash"></i></button>
+                </div>
+            `;
+            if (req.file_hash) {
+                idColumnHtml = `
+                    <span class="badge border border-secondary text-secondary" style="cursor: help;"
+                          data-bs-toggle="tooltip" 
+                          data-bs-placement="top" 
+                          title="${req.file_hash}">
+                        <i class="bi bi-hdd-network"></i> Caché
+                    </span>
+                 `;
+            }
+            break;
+        case 'pending':
+            statusBadge = '<span class="badge bg-warning text-dark">En attente</span>';
+            actionBtn = `<button onclick="deleteRequest(${req.id}, '${req.id_texte}')" class="btn btn-sm btn-outline-danger" title="Supprimer"><i class="bi bi-trash"></i></button>`;
+            if (req.queue_position !== undefined && req.queue_position !== null) {
+                idColumnHtml = `<span class="badge bg-warning text-dark"><i class="bi bi-hourglass-split"></i> Attente : <span class="job-queue-position">${req.queue_position + 1}</span></span>`;
+            }
+            break;
+        case 'processing':
+            statusBadge = `<span class="badge bg-info text-dark"><span class="spinner-border spinner-border-sm me-1"></span><span class="job-progress">${formatProgress(req.progress_stage, req.progress_current, req.progress_total)}</span></span>`;
+            actionBtn = `<span class="text-muted small">Extraction...</span>`;
+            if (req.queue_position !== undefined && req.queue_position !== null) {
+                idColumnHtml = `<span class="badge bg-info text-dark"><i class="bi bi-gear-wide-connected"></i> En cours (0)</span>`;
+            }
+            break;
+        case 'error':
+            statusBadge = '<span class="badge bg-danger">Erreur</span>';
+            actionBtn = `<button onclick="deleteRequest(${req.id}, '${req.id_texte}')" class="btn btn-sm btn-outline-danger" title="Supprimer"><i class="bi bi-trash"></i></button>`;
+            break;
+    }
+
+    const date = req.created_at ? new Date(req.created_at).toLocaleString() : '-';
+    tr.dataset.requestId = req.id;
+    tr.dataset.status = req.status;
+
+    tr.innerHTML = `
+        <td>${idColumnHtml}</td>
+        <td><strong>${req.id_texte}</strong></td>
+        <td>${statusBadge}</td>
+        <td class="small text-muted">${date}</td>
+        <td>${actionBtn}</td>
+    `;
+    return tr;
+}
+
 async function deleteRequest(requestId, idTexte) {
     if (!confirm(`Êtes-vous sûr de vouloir supprimer l'extraction "${idTexte}" ?\nCette action supprimera également le fichier généré.`)) {
         return;
@@ -0,0 +1,201 @@
+"""
+Worker d'extraction adossé à la file d'attente persistante (table `extraction_requests`).
+
+Usage :
+    python -m app.worker [--concurrency N] [--worker-id ID]
+
+En mode `embedded` (défaut), le serveur web lance lui-même ces processus via
+`run_worker_processes` ; en mode `inline`, `run_worker` tourne directement dans sa boucle.
+
+Chaque worker réserve atomiquement les demandes `pending`, les traite et signale
+régulièrement qu'il est vivant. Plusieurs workers (processus ou machines partageant
+la même base) peuvent tourner en parallèle. Les demandes restées en `processing`
+après un arrêt brutal sont remises en file au démarrage ou dès que leur battement
+de cœur est trop ancien.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import sys
+from typing import Dict, Optional
+
+from loguru import logger
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.services import job_queue
+from app.services.extractor_job import process_extraction
+
+# Événement de réveil du worker embarqué dans le processus courant (None si aucun worker actif)
+_wakeup: Optional[asyncio.Event] = None
+
+
+def notify_new_job():
+    """Réveille le worker du processus courant sans attendre le prochain sondage de la base."""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def default_worker_id() -> str:
+    return settings.WORKER_ID or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _with_session(fn, *args):
+    """Exécute une opération de file d'attente dans une session dédiée (appelée depuis un thread)."""
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+
+async def run_worker(stop_event: asyncio.Event, worker_id: Optional[str] = None, concurrency: Optional[int] = None):
+    """Boucle principale : réserve des demandes tant qu'il reste de la capacité, jusqu'à `stop_event`."""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    wakeup = _wakeup
+    # Seul un identifiant passé explicitement (`--worker-id`, stable entre deux lancements) permet de
+    # reprendre ses propres demandes : WORKER_ID vient de l'environnement, que plusieurs workers peuvent
+    # partager, et chacun remettrait alors en file les demandes en cours des autres
+    explicit_id = worker_id
+    worker_id = worker_id or default_worker_id()
+    concurrency = max(1, concurrency or settings.MAX_CONCURRENT_EXTRACTIONS)
+    loop = asyncio.get_running_loop()
+    active: Dict[int, asyncio.Task] = {}
+
+    logger.info(f"Worker '{worker_id}' démarré (capacité : {concurrency} demande(s) simultanée(s)).")
+    # Au démarrage : reprise des demandes orphelines, y compris celles d'une instance précédente de ce worker
+    await asyncio.to_thread(
+        _with_session, job_queue.recover_stale_jobs, settings.WORKER_STALE_AFTER, explicit_id
+    )
+    last_heartbeat = last_recovery = loop.time()
+
+    def on_done(job_id: int):
+        active.pop(job_id, None)
+        wakeup.set()
+
+    try:
+        while not stop_event.is_set():
+            wakeup.clear()
+            now = loop.time()
+            if active and now - last_heartbeat >= settings.WORKER_HEARTBEAT_INTERVAL:
+                await asyncio.to_thread(_with_session, job_queue.heartbeat, list(active), worker_id)
+                last_heartbeat = now
+            if now - last_recovery >= settings.WORKER_STALE_AFTER / 2:
+                await asyncio.to_thread(_with_session, job_queue.recover_stale_jobs, settings.WORKER_STALE_AFTER)
+                last_recovery = now
+
+            while len(active) < concurrency and not stop_event.is_set():
+                job_id = await asyncio.to_thread(_with_session, job_queue.claim_next_job, worker_id)
+                if job_id is None:
+                    break
+                logger.info(f"Worker '{worker_id}' : demande {job_id} réservée.")
+                task = asyncio.create_task(process_extraction(job_id))
+                active[job_id] = task
+                task.add_done_callback(lambda _t, j=job_id: on_done(j))
+
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=settings.WORKER_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        _wakeup = None
+        if active:
+            # Arrêt : on interrompt les traitements en cours et on les rend à la file pour un autre worker
+            pending_ids = list(active)
+            for task in active.values():
+                task.cancel()
+            await asyncio.gather(*active.values(), return_exceptions=True)
+            requeued = await asyncio.to_thread(_with_session, job_queue.requeue_jobs, pending_ids, worker_id)
+            logger.info(f"Worker '{worker_id}' arrêté : {requeued} demande(s) remise(s) en file.")
+        else:
+            logger.info(f"Worker '{worker_id}' arrêté.")
+
+
+async def _supervise_process(stop_event: asyncio.Event, slot: int):
+    """Lance un worker `python -m app.worker` et le relance s'il s'arrête de façon inattendue."""
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-w{slot}"
+    while not stop_event.is_set():
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "app.worker", "--worker-id", worker_id,
+        )
+        logger.info(f"Processus worker '{worker_id}' lancé (PID {proc.pid}).")
+        stop_wait = asyncio.create_task(stop_event.wait())
+        proc_wait = asyncio.create_task(proc.wait())
+        await asyncio.wait({stop_wait, proc_wait}, return_when=asyncio.FIRST_COMPLETED)
+
+        if proc_wait.done():
+            stop_wait.cancel()
+            if not stop_event.is_set():
+                # Les demandes du worker mort seront reprises par le suivant (même identifiant)
+                logger.error(f"Processus worker '{worker_id}' terminé (code {proc.returncode}), relance dans 5 s.")
+                await asyncio.sleep(5)
+            continue
+
+        # Arrêt demandé : SIGTERM laisse le worker remettre ses demandes en file
+        proc.terminate()
+        try:
+            await asyncio.wait_for(proc_wait, timeout=20)
+        except asyncio.TimeoutError:
+            logger.warning(f"Processus worker '{worker_id}' ne répond pas, arrêt forcé.")
+            proc.kill()
+            await proc_wait
+
+
+async def run_worker_processes(stop_event: asyncio.Event, count: Optional[int] = None):
+    """
+    Mode `embedded` : le serveur web supervise des processus worker dédiés.
+    OCR, PyMuPDF et correction IA tournent ainsi hors du processus qui sert les requêtes HTTP ;
+    statut et résultats remontent par la base de données.
+    """
+    count = max(1, count or settings.EXTRACTION_WORKER_PROCESSES)
+    await asyncio.gather(*(_supervise_process(stop_event, slot) for slot in range(count)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker d'extraction RPGPDF2Text")
+    parser.add_argument("--concurrency", type=int, default=None, help="Demandes traitées simultanément (défaut : MAX_CONCURRENT_EXTRACTIONS)")
+    parser.add_argument("--worker-id", default=None, help="Identifiant stable et propre à ce worker, qui reprend au démarrage ses demandes restées en cours (défaut : WORKER_ID ou <hostname>-<pid>)")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stdout, format="<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>")
+    os.makedirs(f"{settings.DATA_DIR}/logs", exist_ok=True)
+    logger.add(f"{settings.DATA_DIR}/logs/worker.log", rotation="10 MB", retention="10 days", level="INFO")
+
+    # Même initialisation que le serveur web (tables et répertoires)
+    from app.db.database import engine, Base
+    from app.db import models  # noqa: F401
+    for d in [settings.USERS_DIR, settings.TEMP_DIR, f"{settings.DATA_DIR}/db"]:
+        os.makedirs(d, exist_ok=True)
+    Base.metadata.create_all(bind=engine)
+
+    async def runner():
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, lambda: (stop_event.set(), notify_new_job()))
+        # Les webhooks produits par ce worker sont livrés sur place, sans attendre le serveur web
+        from app.services.webhook import run_webhook_dispatcher, notify_webhooks
+        dispatcher = asyncio.create_task(run_webhook_dispatcher(stop_event))
+        # Métriques du worker : instantané relu par GET /metrics côté serveur web
+        from app.services.metrics import run_metrics_flush, set_process_name
+        set_process_name(args.worker_id or default_worker_id())
+        metrics_flush = asyncio.create_task(run_metrics_flush(stop_event))
+        try:
+            await run_worker(stop_event, worker_id=args.worker_id, concurrency=args.concurrency)
+        finally:
+            stop_event.set()
+            notify_webhooks()
+            await dispatcher
+            await metrics_flush
+            from app.services.ocr_engine import shutdown_ocr_pool
+            shutdown_ocr_pool()
+
+    asyncio.run(runner())
+
+
+if __name__ == "__main__":
+    main()
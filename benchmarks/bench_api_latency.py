@@ -0,0 +1,177 @@
+"""
+Benchmark : latence de l'API pendant une extraction lourde.
+
+Lance un serveur uvicorn réel pour chaque mode de worker (`inline` : extraction dans le
+processus web ; `embedded` : processus worker dédié), mesure la latence de
+`GET /api/v1/user/requests` au repos puis pendant une extraction, et affiche les
+percentiles en JSON.
+
+Usage :
+    python benchmarks/bench_api_latency.py [--pages 3000] [--requests 300] [--scanned] [--output resultats.json]
+
+`--scanned` génère des pages image (nécessite Tesseract) au lieu de pages texte.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+import httpx
+
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def build_pdf(path: str, pages: int, scanned: bool, seed: str):
+    """Génère un livre de règles synthétique (texte dense ou pages scannées)."""
+    paragraph = f"{seed} — Le paladin lance 3d6 contre la classe d'armure du gobelin. " * 25
+    doc = fitz.open()
+    scan = None
+    if scanned:
+        src = fitz.open()
+        src.new_page().insert_textbox(fitz.Rect(40, 40, 560, 800), paragraph)
+        scan = src[0].get_pixmap(dpi=150)
+    for _ in range(pages):
+        page = doc.new_page()
+        if scan is not None:
+            page.insert_image(page.rect, pixmap=scan)
+        else:
+            page.insert_textbox(fitz.Rect(40, 40, 560, 800), paragraph)
+    doc.save(path)
+
+
+def percentiles(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 2),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 2),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 2),
+        "max_ms": round(samples[-1] * 1000, 2),
+    }
+
+
+def measure(client: httpx.Client, url: str, headers: dict, count: int) -> list:
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        client.get(url, headers=headers).raise_for_status()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_mode(mode: str, workdir: str, env: dict, args) -> dict:
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=PROJECT_DIR, env={**env, "EXTRACTION_WORKER_MODE": mode},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    headers = {"token": "bench-token"}
+    try:
+        with httpx.Client(timeout=30) as client:
+            for _ in range(100):
+                try:
+                    client.get(f"{base}/login")
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.2)
+            _bootstrap_user()
+            # Laisse le temps aux processus worker de démarrer avant la mesure au repos
+            time.sleep(3)
+            url = f"{base}/api/v1/user/requests"
+            idle = measure(client, url, headers, args.requests)
+
+            pdf_path = os.path.join(workdir, f"{mode}.pdf")
+            build_pdf(pdf_path, args.pages, args.scanned, seed=mode)
+            with open(pdf_path, "rb") as f:
+                resp = client.post(
+                    f"{base}/api/v1/extract", headers=headers,
+                    data={"id_texte": f"bench_{mode}", "webhook_url": "http://127.0.0.1:9/hook"},
+                    files={"pdf_file": ("bench.pdf", f, "application/pdf")},
+                )
+            resp.raise_for_status()
+            request_id = resp.json()["request_id"]
+
+            def job_status():
+                jobs = client.get(url, headers=headers).json()
+                return next(j["status"] for j in jobs if j["id"] == request_id)
+
+            while job_status() == "pending":
+                time.sleep(0.05)
+            busy = measure(client, url, headers, args.requests)
+            still_running = job_status() == "processing"
+            while job_status() == "processing":
+                time.sleep(0.2)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    return {"idle": percentiles(idle), "during_extraction": percentiles(busy), "job_outlasted_measure": still_running}
+
+
+def _bootstrap_user():
+    """Crée (une seule fois) l'utilisateur du benchmark, authentifié par token d'API."""
+    from app.db.database import SessionLocal
+    from app.db.models import User
+    from app.core.config import settings
+
+    db = SessionLocal()
+    try:
+        if not db.query(User).filter(User.api_token == "bench-token").first():
+            db.add(User(email="bench@exemple.fr", hashed_password="x", role="user", is_validated=True,
+                        directory_name="bench_at_exemple_fr", api_token="bench-token"))
+            db.commit()
+        os.makedirs(os.path.join(settings.USERS_DIR, "bench_at_exemple_fr"), exist_ok=True)
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=3000)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--scanned", action="store_true")
+    parser.add_argument("--modes", default="inline,embedded")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="rpgpdf2txt_bench_")
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        "DATA_DIR": f"{workdir}/data",
+        "USERS_DIR": f"{workdir}/data/users",
+        "TEMP_DIR": f"{workdir}/data/temp",
+        "APP_PREFIX": "",
+    }
+    # Le processus de benchmark partage la même base que le serveur pour créer l'utilisateur
+    os.environ.update(env)
+    os.chdir(PROJECT_DIR)
+    sys.path.insert(0, PROJECT_DIR)
+
+    results = {"pages": args.pages, "scanned": args.scanned, "modes": {}}
+    for mode in args.modes.split(","):
+        results["modes"][mode] = run_mode(mode, workdir, env, args)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Benchmark : débit des routes chaudes de l'API sous charge concurrente.
+
+Remplit une base SQLite temporaire (un utilisateur, un historique et une file d'attente),
+lance un serveur uvicorn réel (workers d'extraction désactivés) puis envoie pendant
+`--duration` secondes, avec `--concurrency` clients simultanés, un mélange de
+`GET /auth/me`, `GET /user/requests` et `GET /extract/{id}/download`. Affiche les
+requêtes par seconde et les percentiles de latence en JSON.
+
+`--compare-ref <ref git>` mesure aussi l'arbre de ce commit (extrait dans un worktree
+temporaire) sur une copie de la même base, pour comparer avant / après.
+
+Usage :
+    python benchmarks/bench_api_throughput.py [--concurrency 64] [--duration 15] [--compare-ref HEAD~1] [--output resultats.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+API_TOKEN = "bench-api-token"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 2),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 2),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 2),
+        "max_ms": round(samples[-1] * 1000, 2),
+    }
+
+
+def seed(workdir: str, history: int, queued: int) -> int:
+    """Crée la base de référence ; renvoie l'identifiant d'une demande téléchargeable."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'seed.db')}"
+    sys.path.insert(0, PROJECT_DIR)
+    from app.db.database import Base, engine
+    from app.db.models import ExtractionRequest, User
+
+    Base.metadata.create_all(bind=engine)
+    txt_path = os.path.join(workdir, "livre.txt")
+    with open(txt_path, "w", encoding="utf-8") as f:
+        f.write("Le paladin lance 3d6 contre la classe d'armure du gobelin.\n" * 2000)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [{
+            "id": 1, "email": "bench@exemple.fr", "hashed_password": "x", "is_validated": True,
+            "role": "user", "api_token": API_TOKEN,
+        }])
+        conn.execute(ExtractionRequest.__table__.insert(), [
+            {"id_texte": f"livre_{i}", "user_id": 1, "webhook_url": "http://hook", "status": "success",
+             "txt_file_path": txt_path, "created_at": start + timedelta(seconds=i)}
+            for i in range(history)
+        ])
+        conn.execute(ExtractionRequest.__table__.insert(), [
+            {"id_texte": f"file_{i}", "user_id": 1, "webhook_url": "http://hook", "status": "pending",
+             "created_at": start + timedelta(seconds=history + i)}
+            for i in range(queued)
+        ])
+    engine.dispose()
+    return 1
+
+
+async def load(base: str, concurrency: int, duration: float, download_id: int, jwt: str) -> dict:
+    headers = {"token": API_TOKEN}
+    targets = [
+        ("me", "/auth/me", headers),
+        ("requests", "/user/requests", headers),
+        ("download", f"/extract/{download_id}/download", {"Authorization": f"Bearer {jwt}"}),
+    ]
+    samples = {name: [] for name, _, _ in targets}
+    errors = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=60) as client:
+        async def user(index: int):
+            nonlocal errors
+            i = index
+            while time.perf_counter() < deadline:
+                name, path, hdrs = targets[i % len(targets)]
+                i += 1
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path, headers=hdrs)
+                    response.raise_for_status()
+                    samples[name].append(time.perf_counter() - start)
+                except httpx.HTTPError:
+                    errors += 1
+
+        await asyncio.gather(*(user(i) for i in range(concurrency)))
+
+    total = sum(len(s) for s in samples.values())
+    return {
+        "requests_per_second": round(total / duration, 1),
+        "errors": errors,
+        "all": percentiles([x for s in samples.values() for x in s]),
+        **{name: percentiles(s) for name, s in samples.items() if s},
+    }
+
+
+def run_tree(label: str, tree: str, workdir: str, args, download_id: int) -> dict:
+    db_path = os.path.join(workdir, f"{label}.db")
+    shutil.copy(os.path.join(workdir, "seed.db"), db_path)
+    port = _free_port()
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "DATA_DIR": os.path.join(workdir, f"data_{label}"),
+        "APP_PREFIX": "",
+        "EXTRACTION_WORKER_MODE": "external",
+        "PYTHONPATH": tree,
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=tree, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}/api/v1"
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"{base}/auth/me", headers={"token": API_TOKEN}, timeout=1)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        sys.path.insert(0, PROJECT_DIR)
+        from app.core.security import create_access_token
+
+        jwt = create_access_token({"sub": "bench@exemple.fr"})
+        return asyncio.run(load(base, args.concurrency, args.duration, download_id, jwt))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--history", type=int, default=100)
+    parser.add_argument("--queued", type=int, default=20)
+    parser.add_argument("--compare-ref", help="commit git à mesurer en plus de l'arbre courant")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_api_throughput_")
+    download_id = seed(workdir, args.history, args.queued)
+
+    results = {"concurrency": args.concurrency, "duration_s": args.duration, "trees": {}}
+    if args.compare_ref:
+        worktree = os.path.join(workdir, "ref")
+        subprocess.run(["git", "worktree", "add", "--detach", worktree, args.compare_ref],
+                       cwd=PROJECT_DIR, check=True, stdout=subprocess.DEVNULL)
+        try:
+            results["trees"][args.compare_ref] = run_tree("ref", worktree, workdir, args, download_id)
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=PROJECT_DIR, check=False)
+    results["trees"]["working tree"] = run_tree("current", PROJECT_DIR, workdir, args, download_id)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Benchmark : écritures et lectures concurrentes sur `extraction_requests`.
+
+N processus écrivains mettent à jour l'avancement et le statut de demandes (comme les
+workers d'extraction) pendant que M processus lecteurs lisent l'historique paginé et les
+positions dans la file (comme l'API). Deux configurations sont comparées, chacune sur sa
+propre base SQLite :
+  - `legacy` : moteur historique (journal rollback, timeout pysqlite par défaut) ;
+  - `tuned`  : `app.db.database.build_engine` (WAL, synchronous=NORMAL, busy timeout, mmap).
+
+Usage :
+    python benchmarks/bench_db_concurrency.py [--writers 4] [--readers 8] [--duration 10] [--rows 20000] [--output resultats.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def percentiles(samples: list) -> dict:
+    if not samples:
+        return {"count": 0}
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 2),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 2),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 2),
+        "max_ms": round(samples[-1] * 1000, 2),
+    }
+
+
+def _engine(mode: str, url: str):
+    sys.path.insert(0, PROJECT_DIR)
+    from sqlalchemy import create_engine
+
+    from app.db.database import build_engine
+
+    if mode == "legacy":
+        return create_engine(url, connect_args={"check_same_thread": False})
+    return build_engine(url)
+
+
+def seed(mode: str, url: str, rows: int):
+    from app.db.database import Base
+    from app.db.models import ExtractionRequest, User
+
+    engine = _engine(mode, url)
+    Base.metadata.create_all(bind=engine)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"id": i, "email": f"joueur{i}@exemple.fr", "hashed_password": "x", "is_validated": True, "role": "user"}
+            for i in range(1, 11)
+        ])
+        conn.execute(ExtractionRequest.__table__.insert(), [
+            {"id_texte": f"livre_{i}", "user_id": 1 + i % 10, "webhook_url": "http://hook",
+             "status": "pending" if i % 10 == 0 else "success", "created_at": start + timedelta(seconds=i)}
+            for i in range(rows)
+        ])
+    engine.dispose()
+
+
+def writer(mode: str, url: str, rows: int, deadline: float, out: multiprocessing.Queue):
+    from sqlalchemy import update
+    from sqlalchemy.orm import sessionmaker
+
+    from app.db.models import ExtractionRequest
+
+    Session = sessionmaker(bind=_engine(mode, url))
+    latencies, errors = [], 0
+    while time.time() < deadline:
+        request_id = random.randint(1, rows)
+        start = time.perf_counter()
+        db = Session()
+        try:
+            db.execute(
+                update(ExtractionRequest)
+                .where(ExtractionRequest.id == request_id)
+                .values(progress_stage="ocr", progress_current=random.randint(0, 500), progress_total=500,
+                        progress_at=datetime.now(timezone.utc))
+            )
+            db.commit()
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            db.rollback()
+            errors += 1
+        finally:
+            db.close()
+    out.put(("write", latencies, errors))
+
+
+def reader(mode: str, url: str, deadline: float, out: multiprocessing.Queue):
+    from sqlalchemy.orm import sessionmaker
+
+    from app.db.models import ExtractionRequest
+    from app.services.job_queue import ACTIVE_STATUSES, queue_positions
+
+    Session = sessionmaker(bind=_engine(mode, url))
+    latencies, errors = [], 0
+    while time.time() < deadline:
+        start = time.perf_counter()
+        db = Session()
+        try:
+            page = (
+                db.query(ExtractionRequest)
+                .filter(ExtractionRequest.user_id == random.randint(1, 10))
+                .order_by(ExtractionRequest.id.desc())
+                .limit(100)
+                .all()
+            )
+            queue_positions(db, [r.id for r in page if r.status in ACTIVE_STATUSES])
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            errors += 1
+        finally:
+            db.close()
+    out.put(("read", latencies, errors))
+
+
+def run_mode(mode: str, workdir: str, args) -> dict:
+    url = f"sqlite:///{os.path.join(workdir, f'{mode}.db')}"
+    seed(mode, url, args.rows)
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    deadline = time.time() + 3 + args.duration  # marge pour le démarrage des processus
+    procs = [ctx.Process(target=writer, args=(mode, url, args.rows, deadline, out)) for _ in range(args.writers)]
+    procs += [ctx.Process(target=reader, args=(mode, url, deadline, out)) for _ in range(args.readers)]
+    for p in procs:
+        p.start()
+    results = {"write": ([], 0), "read": ([], 0)}
+    for _ in procs:
+        kind, latencies, errors = out.get()
+        results[kind] = (results[kind][0] + latencies, results[kind][1] + errors)
+    for p in procs:
+        p.join()
+    return {
+        kind: {**percentiles(latencies), "errors": errors, "per_second": round(len(latencies) / args.duration, 1)}
+        for kind, (latencies, errors) in results.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_db_")
+    # Les processus enfants importent l'application : elle ne doit pas toucher à la base par défaut
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'app.db')}"
+    os.environ["DATA_DIR"] = os.path.join(workdir, "data")
+    sys.path.insert(0, PROJECT_DIR)
+
+    results = {
+        "writers": args.writers,
+        "readers": args.readers,
+        "duration_s": args.duration,
+        "rows": args.rows,
+        "modes": {mode: run_mode(mode, workdir, args) for mode in ("legacy", "tuned")},
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
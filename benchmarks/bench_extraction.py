@@ -0,0 +1,384 @@
+"""
+Benchmark : suite d'extraction sur un corpus synthétique de PDF de JDR.
+
+Génère avec PyMuPDF un corpus de PDF à couche texte, scannés (pages image sans couche texte)
+et mixtes, pour chaque nombre de pages de `--pages`, puis mesure dans des processus séparés
+(caches disque vides à chaque fois) :
+
+- `extract` : `extract_text_from_pdf` sur chaque PDF ;
+- `chunker` : `correct_text_with_hf` sur le texte source de chaque PDF, avec un client
+  HuggingFace factice (message renvoyé en écho après `--hf-latency` secondes) ;
+- `pipeline` : `process_extraction` complet (correction IA factice comprise) sur une base
+  SQLite temporaire, avec la durée de chaque étape d'avancement (hashing, ocr, correction,
+  saving, webhook).
+
+Chaque mesure donne les secondes et les pages par seconde ; chaque phase son pic de RSS
+(processus principal et processus OCR). Avec `--repeat`, chaque phase est relancée et la
+médiane est retenue. Sans Tesseract, les PDF scannés et mixtes sont ignorés.
+
+Comparaison entre commits : `--compare-ref <ref git>` mesure aussi l'arbre de ce commit
+(extrait dans un worktree temporaire) sur le même corpus ; `--baseline <résultats.json>`
+compare à une exécution enregistrée avec `--output`. Les mesures plus lentes de plus de
+`--threshold` (10 % par défaut) sont listées dans `regressions` ; `--fail-on-regression`
+termine alors avec le code 1.
+
+Usage :
+    python benchmarks/bench_extraction.py [--pages 4,24] [--kinds text,scanned,mixed] [--repeat 3]
+        [--compare-ref HEAD~1] [--baseline avant.json] [--output resultats.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PHASES = ["extract", "chunker", "pipeline"]
+
+PARAGRAPHS = [
+    "Le paladin lance 3d6 contre la classe d'armure du gobelin et ajoute son bonus de Force.",
+    "GOBELIN — Humanoïde de petite taille. CA 15, PV 7 (2d6), Vitesse 9 m. FOR 8 DEX 14 CON 10.",
+    "Sort de niveau 3 : Boule de feu. Portée 45 mètres, chaque créature dans une sphère de 6 mètres "
+    "effectue un jet de sauvegarde de Dextérité ; elle subit 8d6 dégâts de feu en cas d'échec.",
+    "Le maître du jeu décrit la salle : des torches vacillent, un coffre piégé repose contre le mur nord.",
+    "Table des rencontres aléatoires (1d8) : 1-3 loups, 4-5 bandits, 6-7 patrouille, 8 dragon vert.",
+]
+
+
+def page_text(doc_name: str, index: int) -> str:
+    """Texte d'une page, unique par document et par page (le cache de pages indexe le contenu)."""
+    lines = [f"{doc_name.upper()} — CHAPITRE {index + 1}"]
+    for i in range(12):
+        lines.append(f"{PARAGRAPHS[(index + i) % len(PARAGRAPHS)]} ({doc_name}, p. {index + 1}, § {i + 1})")
+    return "\n\n".join(lines)
+
+
+def build_pdf(directory: str, kind: str, pages: int) -> dict:
+    """Génère un PDF du corpus et son texte source ; les pages scannées sont des images sans couche texte."""
+    name = f"{kind}_{pages}p"
+    doc = fitz.open()
+    texts = []
+    for index in range(pages):
+        text = page_text(name, index)
+        texts.append(text)
+        scanned = kind == "scanned" or (kind == "mixed" and index % 3 == 2)
+        page = doc.new_page()
+        if scanned:
+            src = fitz.open()
+            src.new_page().insert_textbox(fitz.Rect(40, 40, 560, 800), text, fontsize=10)
+            page.insert_image(page.rect, pixmap=src[0].get_pixmap(dpi=150, colorspace=fitz.csGRAY))
+            src.close()
+        else:
+            page.insert_textbox(fitz.Rect(40, 40, 560, 800), text, fontsize=10)
+    path = os.path.join(directory, f"{name}.pdf")
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+    with open(os.path.join(directory, f"{name}.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(texts))
+    return {"name": name, "kind": kind, "pages": pages, "bytes": os.path.getsize(path)}
+
+
+# --- Mesures, exécutées dans un processus enfant (`--phase`) avec l'arbre à mesurer sur PYTHONPATH ---
+
+class _StubCompletion:
+    def __init__(self, content: str):
+        message = type("Message", (), {"content": content})()
+        self.choices = [type("Choice", (), {"message": message})()]
+
+
+def _stub_client(latency: float):
+    class StubInferenceClient:
+        """Client HuggingFace factice : renvoie le message reçu après `latency` secondes."""
+
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def chat_completion(self, model, messages, **kwargs):
+            time.sleep(latency)
+            return _StubCompletion(messages[-1]["content"])
+
+    return StubInferenceClient
+
+
+def _peak_rss() -> dict:
+    # ru_maxrss est en Ko sous Linux ; côté enfants, c'est le plus gros processus OCR terminé
+    return {
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_rss_children_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+def _measure(corpus: list, run) -> dict:
+    docs = {}
+    for entry in corpus:
+        start = time.perf_counter()
+        details = run(entry) or {}
+        seconds = time.perf_counter() - start
+        docs[entry["name"]] = {
+            "seconds": round(seconds, 4),
+            "pages_per_second": round(entry["pages"] / seconds, 2) if seconds else None,
+            **details,
+        }
+    return docs
+
+
+def phase_extract(corpus: list, corpus_dir: str, args) -> dict:
+    from app.services.pdf_extractor import extract_text_from_pdf
+
+    def run(entry):
+        text = extract_text_from_pdf(os.path.join(corpus_dir, f"{entry['name']}.pdf"))
+        return {"chars": len(text)}
+
+    return _measure(corpus, run)
+
+
+def phase_chunker(corpus: list, corpus_dir: str, args) -> dict:
+    from app.services import hf_corrector
+
+    hf_corrector.InferenceClient = _stub_client(args.hf_latency)
+
+    def run(entry):
+        with open(os.path.join(corpus_dir, f"{entry['name']}.txt"), encoding="utf-8") as f:
+            text = f.read()
+        asyncio.run(hf_corrector.correct_text_with_hf(text, "bench-token"))
+        return {"chunks": len(hf_corrector.split_into_chunks(text))}
+
+    return _measure(corpus, run)
+
+
+def phase_pipeline(corpus: list, corpus_dir: str, args) -> dict:
+    from app.db.database import Base, SessionLocal, engine
+    from app.db.models import ExtractionRequest, SystemConfig, User
+    from app.services import extractor_job, hf_corrector
+
+    hf_corrector.InferenceClient = _stub_client(args.hf_latency)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add(User(id=1, email="bench@exemple.fr", hashed_password="x", is_validated=True))
+    db.add(SystemConfig(id=1, is_configured=True, hf_token="bench-token"))
+    db.commit()
+
+    # Horodatage de chaque changement d'étape publié par le pipeline
+    stages = []
+    reporter = getattr(extractor_job, "ProgressReporter", None)
+    if reporter is not None:
+        class TimedReporter(reporter):
+            def report(self, stage, current=None, total=None):
+                if not stages or stages[-1][0] != stage:
+                    stages.append((stage, time.perf_counter()))
+                super().report(stage, current, total)
+
+        extractor_job.ProgressReporter = TimedReporter
+
+    def run(entry):
+        # Le pipeline supprime le PDF traité : il travaille sur une copie
+        pdf_path = os.path.join(os.environ["TEMP_DIR"], f"{entry['name']}.pdf")
+        shutil.copy(os.path.join(corpus_dir, f"{entry['name']}.pdf"), pdf_path)
+        req = ExtractionRequest(
+            id_texte=entry["name"], user_id=1, webhook_url="http://127.0.0.1:9/bench",
+            status="processing", file_path=pdf_path, ia_validate=True,
+        )
+        db.add(req)
+        db.commit()
+        stages.clear()
+        start = time.perf_counter()
+        asyncio.run(extractor_job.process_extraction(req.id))
+        end = time.perf_counter()
+        db.refresh(req)
+        marks = stages + [(None, end)]
+        return {
+            "status": req.status,
+            "stages": {stage: round(marks[i + 1][1] - at, 4) for i, (stage, at) in enumerate(stages)},
+            "setup_seconds": round((stages[0][1] if stages else end) - start, 4),
+        }
+
+    try:
+        return _measure(corpus, run)
+    finally:
+        db.close()
+        from app.services.ocr_engine import shutdown_ocr_pool
+        shutdown_ocr_pool()
+
+
+def run_phase(args):
+    with open(os.path.join(args.corpus_dir, "corpus.json")) as f:
+        corpus = json.load(f)
+    phase = {"extract": phase_extract, "chunker": phase_chunker, "pipeline": phase_pipeline}[args.phase]
+    docs = phase(corpus, args.corpus_dir, args)
+    print(json.dumps({"docs": docs, **_peak_rss()}))
+
+
+# --- Orchestration ---
+
+def tesseract_version():
+    try:
+        output = subprocess.run(["tesseract", "--version"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return (output.stdout or output.stderr).splitlines()[0]
+
+
+def git_commit(tree: str, ref: str = "HEAD") -> dict:
+    sha = subprocess.run(["git", "rev-parse", ref], cwd=tree, capture_output=True, text=True).stdout.strip()
+    dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                cwd=tree, capture_output=True, text=True).stdout.strip())
+    return {"commit": sha or None, "dirty": dirty}
+
+
+def run_tree(tree: str, corpus: list, corpus_dir: str, workdir: str, args) -> dict:
+    """Lance chaque phase `--repeat` fois dans un processus neuf et garde la médiane par PDF."""
+    results = {}
+    for phase in PHASES:
+        runs = []
+        for _ in range(args.repeat):
+            run_dir = tempfile.mkdtemp(dir=workdir)
+            env = {
+                **os.environ,
+                "PYTHONPATH": tree,
+                "DATABASE_URL": f"sqlite:///{os.path.join(run_dir, 'bench.db')}",
+                "DATA_DIR": os.path.join(run_dir, "data"),
+                "USERS_DIR": os.path.join(run_dir, "data", "users"),
+                "TEMP_DIR": os.path.join(run_dir, "data", "temp"),
+                "HF_RATE_PER_SECOND": str(args.hf_rate),
+                "HF_RATE_BURST": str(max(1, int(args.hf_rate))),
+            }
+            os.makedirs(env["TEMP_DIR"], exist_ok=True)
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--phase", phase, "--corpus-dir", corpus_dir,
+                 "--hf-latency", str(args.hf_latency)],
+                cwd=tree, env=env, capture_output=True, text=True,
+            )
+            shutil.rmtree(run_dir, ignore_errors=True)
+            if output.returncode != 0:
+                raise RuntimeError(f"Phase {phase} en échec :\n{output.stderr[-2000:]}")
+            runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+        docs = {}
+        for entry in corpus:
+            samples = [run["docs"][entry["name"]] for run in runs]
+            seconds = statistics.median(s["seconds"] for s in samples)
+            docs[entry["name"]] = {
+                **samples[0],
+                "seconds": round(seconds, 4),
+                "pages_per_second": round(entry["pages"] / seconds, 2) if seconds else None,
+            }
+            if "stages" in samples[0]:
+                docs[entry["name"]]["stages"] = {
+                    stage: round(statistics.median(s["stages"].get(stage, 0.0) for s in samples), 4)
+                    for stage in samples[0]["stages"]
+                }
+        total_pages = sum(entry["pages"] for entry in corpus)
+        total_seconds = sum(doc["seconds"] for doc in docs.values())
+        results[phase] = {
+            "pages_per_second": round(total_pages / total_seconds, 2) if total_seconds else None,
+            "seconds": round(total_seconds, 4),
+            "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+            "peak_rss_children_mb": max(run["peak_rss_children_mb"] for run in runs),
+            "docs": docs,
+        }
+    return results
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> tuple:
+    """Rapport courant / référence des durées (> 1 : plus lent) et liste des régressions."""
+    ratios, regressions = {}, []
+    for phase, result in current.items():
+        reference = baseline.get(phase)
+        if not reference:
+            continue
+        for name, doc in result["docs"].items():
+            before = reference["docs"].get(name, {}).get("seconds")
+            if not before or doc["seconds"] is None:
+                continue
+            ratio = round(doc["seconds"] / before, 3)
+            ratios[f"{phase}/{name}"] = ratio
+            if ratio > 1 + threshold:
+                regressions.append({"measure": f"{phase}/{name}", "before_s": before, "after_s": doc["seconds"], "ratio": ratio})
+    return ratios, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default="4,24", help="nombres de pages des PDF générés, séparés par des virgules")
+    parser.add_argument("--kinds", default="text,scanned,mixed")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--hf-latency", type=float, default=0.05, help="latence (s) du client HuggingFace factice")
+    parser.add_argument("--hf-rate", type=float, default=1000.0, help="HF_RATE_PER_SECOND pendant la mesure")
+    parser.add_argument("--compare-ref", help="commit git à mesurer en plus de l'arbre courant")
+    parser.add_argument("--baseline", help="résultats JSON d'une exécution précédente à comparer")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--output")
+    parser.add_argument("--phase", choices=PHASES, help=argparse.SUPPRESS)
+    parser.add_argument("--corpus-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        run_phase(args)
+        return
+
+    tesseract = tesseract_version()
+    kinds = [k for k in args.kinds.split(",") if k]
+    skipped = [] if tesseract else [k for k in kinds if k != "text"]
+    workdir = tempfile.mkdtemp(prefix="bench_extraction_")
+    corpus_dir = os.path.join(workdir, "corpus")
+    os.makedirs(corpus_dir)
+    corpus = [
+        build_pdf(corpus_dir, kind, int(pages))
+        for kind in kinds if kind not in skipped
+        for pages in args.pages.split(",")
+    ]
+    with open(os.path.join(corpus_dir, "corpus.json"), "w") as f:
+        json.dump(corpus, f)
+
+    results = {
+        "tesseract": tesseract,
+        "skipped_kinds": skipped,
+        "repeat": args.repeat,
+        "hf_latency_s": args.hf_latency,
+        "corpus": corpus,
+        "trees": {},
+    }
+    try:
+        if args.compare_ref:
+            worktree = os.path.join(workdir, "ref")
+            subprocess.run(["git", "worktree", "add", "--detach", worktree, args.compare_ref],
+                           cwd=PROJECT_DIR, check=True, stdout=subprocess.DEVNULL)
+            try:
+                results["trees"][args.compare_ref] = {
+                    **git_commit(worktree), **run_tree(worktree, corpus, corpus_dir, workdir, args),
+                }
+            finally:
+                subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=PROJECT_DIR, check=False)
+        current = run_tree(PROJECT_DIR, corpus, corpus_dir, workdir, args)
+        results["trees"]["working tree"] = {**git_commit(PROJECT_DIR), **current}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    reference = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            reference = json.load(f)["trees"]["working tree"]
+    elif args.compare_ref:
+        reference = results["trees"][args.compare_ref]
+    if reference is not None:
+        ratios, regressions = compare(reference, current, args.threshold)
+        results["comparison"] = {"against": reference.get("commit"), "ratios": ratios, "regressions": regressions}
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.fail_on_regression and results.get("comparison", {}).get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
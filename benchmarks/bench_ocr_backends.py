@@ -0,0 +1,187 @@
+"""
+Benchmark : moteurs OCR (pytesseract, un processus `tesseract` par page, contre tesserocr,
+un moteur Tesseract persistant par processus).
+
+Génère avec PyMuPDF un PDF scanné de `--pages` pages (images sans couche texte, texte unique
+par page), puis mesure pour chaque moteur disponible :
+
+- `sequential` : OCR des pages déjà rastérisées, une à une dans le processus courant (coût
+  propre du moteur : lancement de `tesseract`, fichier temporaire, chargement du modèle) ;
+  l'initialisation du moteur est comptée à part (`init_seconds`) ;
+- `pool` (avec `--workers` > 0) : `ocr_pdf_pages` sur le pool de processus OCR, comme en
+  production (rastérisation comprise).
+
+Chaque mesure donne les secondes, les pages par seconde et la similarité du texte reconnu avec
+le texte source (0 à 1), pour vérifier que les moteurs lisent aussi bien. Un moteur absent
+(module tesserocr non installé, binaire tesseract introuvable) est listé dans `unavailable`.
+
+Usage :
+    python benchmarks/bench_ocr_backends.py [--pages 12] [--dpi 200] [--workers 4]
+        [--backends pytesseract,tesserocr] [--output resultats.json]
+"""
+import argparse
+import asyncio
+import difflib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, PROJECT_DIR)
+
+from app.core.config import settings  # noqa: E402
+from app.services import ocr_backends, ocr_engine  # noqa: E402
+from app.services.rasterizer import iter_page_images  # noqa: E402
+
+PARAGRAPHS = [
+    "Le paladin lance 3d6 contre la classe d'armure du gobelin et ajoute son bonus de Force.",
+    "GOBELIN — Humanoïde de petite taille. CA 15, PV 7 (2d6), Vitesse 9 m. FOR 8 DEX 14 CON 10.",
+    "Sort de niveau 3 : Boule de feu. Portée 45 mètres, chaque créature dans une sphère de 6 mètres "
+    "effectue un jet de sauvegarde de Dextérité ; elle subit 8d6 dégâts de feu en cas d'échec.",
+    "Le maître du jeu décrit la salle : des torches vacillent, un coffre piégé repose contre le mur nord.",
+    "Table des rencontres aléatoires (1d8) : 1-3 loups, 4-5 bandits, 6-7 patrouille, 8 dragon vert.",
+]
+
+
+def page_text(index: int) -> str:
+    lines = [f"CHAPITRE {index + 1}"]
+    for i in range(12):
+        lines.append(f"{PARAGRAPHS[(index + i) % len(PARAGRAPHS)]} (p. {index + 1}, § {i + 1})")
+    return "\n\n".join(lines)
+
+
+def build_scanned_pdf(path: str, pages: int) -> list:
+    """PDF dont chaque page est une image sans couche texte ; renvoie le texte source des pages."""
+    doc = fitz.open()
+    texts = []
+    for index in range(pages):
+        text = page_text(index)
+        texts.append(text)
+        src = fitz.open()
+        src.new_page().insert_textbox(fitz.Rect(40, 40, 560, 800), text, fontsize=10)
+        page = doc.new_page()
+        page.insert_image(page.rect, pixmap=src[0].get_pixmap(dpi=150, colorspace=fitz.csGRAY))
+        src.close()
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+    return texts
+
+
+def similarity(expected: list, recognised: list) -> float:
+    """Similarité moyenne (difflib) entre texte source et texte reconnu, espaces normalisés."""
+    ratios = [
+        difflib.SequenceMatcher(None, " ".join(a.split()), " ".join(b.split())).ratio()
+        for a, b in zip(expected, recognised)
+    ]
+    return round(sum(ratios) / len(ratios), 4) if ratios else 0.0
+
+
+def availability() -> dict:
+    """Moteurs utilisables ici : None si disponible, sinon la raison."""
+    reasons = {}
+    try:
+        ocr_backends.pytesseract.get_tesseract_version()
+        reasons["pytesseract"] = None
+    except Exception as e:
+        reasons["pytesseract"] = f"binaire tesseract introuvable : {e}"
+    if ocr_backends.tesserocr is None:
+        reasons["tesserocr"] = "module tesserocr non installé (extra `tesserocr`)"
+    else:
+        try:
+            ocr_backends.TesserocrBackend().close()
+            reasons["tesserocr"] = None
+        except Exception as e:
+            reasons["tesserocr"] = f"initialisation impossible : {e}"
+    return reasons
+
+
+def bench_sequential(name: str, pdf_path: str, texts: list, dpi: int) -> dict:
+    images = [img.copy() for _, img in iter_page_images(pdf_path, dpi)]
+    start = time.perf_counter()
+    backend = {"pytesseract": ocr_backends.PytesseractBackend, "tesserocr": ocr_backends.TesserocrBackend}[name]()
+    init_seconds = time.perf_counter() - start
+    try:
+        start = time.perf_counter()
+        recognised = [backend.image_to_string(img) for img in images]
+        seconds = time.perf_counter() - start
+    finally:
+        backend.close()
+        for img in images:
+            img.close()
+    return {
+        "init_seconds": round(init_seconds, 4),
+        "seconds": round(seconds, 4),
+        "pages_per_second": round(len(images) / seconds, 2) if seconds else None,
+        "similarity": similarity(texts, recognised),
+    }
+
+
+def bench_pool(name: str, pdf_path: str, texts: list, dpi: int, workers: int) -> dict:
+    # Les processus du pool (spawn) relisent la configuration dans l'environnement
+    os.environ["OCR_BACKEND"] = name
+    os.environ["OCR_WORKERS"] = str(workers)
+    settings.OCR_BACKEND = name
+    settings.OCR_WORKERS = workers
+    try:
+        # Démarrage du pool hors mesure : seul le régime établi (moteurs chargés) est comparé
+        asyncio.run(ocr_engine.ocr_pdf_pages(pdf_path, list(range(min(workers, len(texts)))), dpi))
+        start = time.perf_counter()
+        recognised = asyncio.run(ocr_engine.ocr_pdf_pages(pdf_path, list(range(len(texts))), dpi))
+        seconds = time.perf_counter() - start
+    finally:
+        ocr_engine.shutdown_ocr_pool()
+    return {
+        "workers": workers,
+        "seconds": round(seconds, 4),
+        "pages_per_second": round(len(texts) / seconds, 2) if seconds else None,
+        "similarity": similarity(texts, recognised),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=12)
+    parser.add_argument("--dpi", type=int, default=settings.OCR_DPI)
+    parser.add_argument("--workers", type=int, default=0, help="taille du pool OCR pour la mesure `pool` (0 : pas de mesure)")
+    parser.add_argument("--backends", default="pytesseract,tesserocr")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    reasons = availability()
+    backends = [b for b in args.backends.split(",") if b]
+    results = {
+        "pages": args.pages,
+        "dpi": args.dpi,
+        "unavailable": {b: reasons.get(b, "moteur inconnu") for b in backends if reasons.get(b, "moteur inconnu")},
+        "backends": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="bench_ocr_") as workdir:
+        pdf_path = os.path.join(workdir, "scanned.pdf")
+        texts = build_scanned_pdf(pdf_path, args.pages)
+        for name in backends:
+            if name in results["unavailable"]:
+                continue
+            measures = {"sequential": bench_sequential(name, pdf_path, texts, args.dpi)}
+            if args.workers > 0:
+                measures["pool"] = bench_pool(name, pdf_path, texts, args.dpi, args.workers)
+            results["backends"][name] = measures
+
+    measured = results["backends"]
+    if "pytesseract" in measured and "tesserocr" in measured:
+        results["speedup"] = {
+            mode: round(measured["pytesseract"][mode]["seconds"] / measured["tesserocr"][mode]["seconds"], 2)
+            for mode in measured["tesserocr"] if measured["tesserocr"][mode]["seconds"]
+        }
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
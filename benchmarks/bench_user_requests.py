@@ -0,0 +1,139 @@
+"""
+Benchmark : latence de `GET /api/v1/user/requests` sur une grosse base.
+
+Remplit une base SQLite temporaire avec un historique volumineux (par défaut 100 000
+demandes terminées pour l'utilisateur mesuré) et une file d'attente chargée (10 000
+demandes actives réparties entre plusieurs utilisateurs), puis mesure la première page
+et une page profonde de l'historique, ainsi que l'ancien calcul (liste complète des
+demandes actives puis `list.index`) pour comparaison. Résultats en JSON.
+
+Usage :
+    python benchmarks/bench_user_requests.py [--history 100000] [--queued 10000] [--requests 50] [--output resultats.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def percentiles(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 2),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 2),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 2),
+        "max_ms": round(samples[-1] * 1000, 2),
+    }
+
+
+def seed(engine, history: int, queued: int):
+    """Insère l'historique de l'utilisateur 1 et une file partagée entre 20 utilisateurs."""
+    from app.db.models import ExtractionRequest, User
+
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    users = [{"id": i, "email": f"joueur{i}@exemple.fr", "hashed_password": "x", "is_validated": True, "role": "user"}
+             for i in range(1, 21)]
+    rows = [
+        {"id_texte": f"livre_{i}", "user_id": 1, "webhook_url": "http://hook", "status": "success",
+         "created_at": start + timedelta(seconds=i), "completed_at": start + timedelta(seconds=i + 60)}
+        for i in range(history)
+    ]
+    # Les demandes actives sont postérieures à l'historique ; une sur vingt appartient à l'utilisateur mesuré
+    rows += [
+        {"id_texte": f"file_{i}", "user_id": 1 + i % 20, "webhook_url": "http://hook",
+         "status": "processing" if i < 4 else "pending", "created_at": start + timedelta(seconds=history + i)}
+        for i in range(queued)
+    ]
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), users)
+        for offset in range(0, len(rows), 10000):
+            conn.execute(ExtractionRequest.__table__.insert(), rows[offset:offset + 10000])
+
+
+def legacy_positions(db, user_id: int) -> dict:
+    """Ancien calcul : toutes les demandes actives et tout l'historique chargés à chaque appel."""
+    from app.db.models import ExtractionRequest
+
+    active_ids = [r[0] for r in db.query(ExtractionRequest.id).filter(
+        ExtractionRequest.status.in_(["pending", "processing"])
+    ).order_by(ExtractionRequest.created_at.asc()).all()]
+    requests = db.query(ExtractionRequest).filter(
+        ExtractionRequest.user_id == user_id
+    ).order_by(ExtractionRequest.created_at.desc()).all()
+    return {r.id: active_ids.index(r.id) for r in requests if r.id in active_ids}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", type=int, default=100000)
+    parser.add_argument("--queued", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_user_requests_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["DATA_DIR"] = os.path.join(workdir, "data")
+    sys.path.insert(0, PROJECT_DIR)
+
+    from fastapi.testclient import TestClient
+
+    from app.core.config import settings
+    from app.core.security import create_access_token
+    from app.db.database import Base, SessionLocal, engine
+    from app.main import app
+
+    Base.metadata.create_all(bind=engine)
+    seed(engine, args.history, args.queued)
+
+    # Pas de `with` : le cycle de vie (workers, dispatcher) n'est pas démarré
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'joueur1@exemple.fr'})}"}
+    url = f"{settings.APP_PREFIX}{settings.API_V1_STR}/user/requests"
+
+    def measure(params: dict) -> list:
+        samples = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            client.get(url, params=params, headers=headers).raise_for_status()
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    first = client.get(url, headers=headers)
+    first.raise_for_status()
+    deep_cursor = args.history // 2
+
+    legacy = []
+    db = SessionLocal()
+    try:
+        for _ in range(max(1, args.requests // 10)):
+            start = time.perf_counter()
+            legacy_positions(db, 1)
+            legacy.append(time.perf_counter() - start)
+    finally:
+        db.close()
+
+    results = {
+        "history": args.history,
+        "queued": args.queued,
+        "first_page": percentiles(measure({})),
+        "deep_page": percentiles(measure({"cursor": deep_cursor})),
+        "legacy_positions_only": percentiles(legacy),
+        "first_page_rows": len(first.json()),
+        "next_cursor": first.headers.get("X-Next-Cursor"),
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
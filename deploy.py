@@ -48,6 +48,11 @@ def load_config() -> dict:
     return deploy
 
 
+def uv_sync_command(config: dict) -> str:
+    """`uv sync` avec les extras de deploy.yaml (`extras: [postgresql]`) : un `uv sync` nu les désinstallerait."""
+    return " ".join(["uv sync", *(f"--extra {extra}" for extra in config.get("extras") or [])])
+
+
 def get_credentials() -> tuple:
     """Récupère les identifiants SSH depuis les variables d'environnement."""
     login = os.environ.get("REMOTE_LOGIN")
@@ -192,6 +197,35 @@ def _setup_ssh(config: dict, login: str, pwd: str):
     return ssh, sftp, run_sudo
 
 
+# Colonnes ajoutées au schéma après la création initiale des tables : (table, colonne, type SQL)
+SCHEMA_COLUMN_MIGRATIONS = [
+    ("extraction_requests", "page_count", "INTEGER"),
+    ("extraction_requests", "ocr_page_count", "INTEGER"),
+    ("extraction_requests", "worker_id", "VARCHAR"),
+    ("extraction_requests", "started_at", "DATETIME"),
+    ("extraction_requests", "heartbeat_at", "DATETIME"),
+    ("extraction_requests", "progress_stage", "VARCHAR"),
+    ("extraction_requests", "progress_current", "INTEGER"),
+    ("extraction_requests", "progress_total", "INTEGER"),
+    ("extraction_requests", "progress_at", "DATETIME"),
+    ("extraction_requests", "result_hash", "VARCHAR"),
+    ("extraction_requests", "result_filename", "VARCHAR"),
+    ("extraction_requests", "batch_id", "INTEGER"),
+    ("extraction_requests", "estimated_cost", "INTEGER"),
+    ("users", "priority", "VARCHAR DEFAULT 'normal'"),
+    ("extraction_requests", "submitted_at", "DATETIME"),
+]
+
+# Index ajoutés après coup (create_all ne les crée pas sur une table existante)
+SCHEMA_INDEX_MIGRATIONS = [
+    ("ix_extraction_requests_status_created", "extraction_requests", "status, created_at"),
+    ("ix_extraction_requests_user_id_id", "extraction_requests", "user_id, id"),
+    ("ix_extraction_requests_result_hash", "extraction_requests", "result_hash"),
+    ("ix_extraction_requests_batch_id", "extraction_requests", "batch_id"),
+    ("ix_extraction_requests_submitted_at", "extraction_requests", "submitted_at"),
+]
+
+
 def _run_db_migrations(ssh, target_dir: str):
     """Exécute les migrations de base de données nécessaires sur le serveur."""
     db_path = f"{target_dir}/data/db/rpgpdf2text.db"
@@ -239,6 +273,32 @@ except Exception as e:
     
     # Supprimer le script temporaire
     _ssh_exec(ssh, f"rm {remote_script_path}")
+
+    # 3. Ajout des colonnes et index manquants (create_all ne modifie pas les tables existantes)
+    logger.info("  🧱 Vérification des colonnes et index ajoutés au schéma...")
+    py_columns = f"""
+import sqlite3
+migrations = {SCHEMA_COLUMN_MIGRATIONS!r}
+indexes = {SCHEMA_INDEX_MIGRATIONS!r}
+try:
+    conn = sqlite3.connect("{db_path}")
+    cur = conn.cursor()
+    for table, column, ddl in migrations:
+        cur.execute(f"PRAGMA table_info({{table}})")
+        if column not in [row[1] for row in cur.fetchall()]:
+            cur.execute(f"ALTER TABLE {{table}} ADD COLUMN {{column}} {{ddl}}")
+            print(f"Added {{table}}.{{column}}")
+    for name, table, columns in indexes:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {{name}} ON {{table}} ({{columns}})")
+    conn.commit()
+    conn.close()
+except Exception as e:
+    print(f"Migration error: {{e}}")
+    exit(1)
+"""
+    _ssh_exec(ssh, f"cat << 'EOF' > {remote_script_path}\n{py_columns}\nEOF")
+    _ssh_exec(ssh, f"python3 {remote_script_path}", show_output=True)
+    _ssh_exec(ssh, f"rm {remote_script_path}")
     
     logger.info("  ✅ Migrations terminées.")
 
@@ -312,7 +372,7 @@ def deploy_remote(config: dict, login: str, pwd: str):
 
         # Installer les dépendances sur le serveur
         logger.info("📦 Mise à jour des dépendances sur le serveur...")
-        _ssh_exec(ssh, f"cd {target_dir} && export PATH=$PATH:$HOME/.local/bin:$HOME/.cargo/bin && uv sync", show_output=True)
+        _ssh_exec(ssh, f"cd {target_dir} && export PATH=$PATH:$HOME/.local/bin:$HOME/.cargo/bin && {uv_sync_command(config)}", show_output=True)
 
         logger.info("⚙️  Application des configurations globales (Nginx/Systemd)...")
         # Config Nginx
@@ -358,7 +418,7 @@ def update_remote(config: dict, login: str, pwd: str):
             
         # Installer les dépendances sur le serveur
         logger.info("📦 Vérification des dépendances sur le serveur...")
-        _ssh_exec(ssh, f"cd {target_dir} && export PATH=$PATH:$HOME/.local/bin:$HOME/.cargo/bin && uv sync", show_output=True)
+        _ssh_exec(ssh, f"cd {target_dir} && export PATH=$PATH:$HOME/.local/bin:$HOME/.cargo/bin && {uv_sync_command(config)}", show_output=True)
 
         # Exécuter les migrations DB
         _run_db_migrations(ssh, target_dir)
@@ -0,0 +1,109 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.db.database import Base
+from app.db.models import ExtractionRequest, User
+from app.routes import api_routes
+from app.services import admission
+from app.services.pdf_extractor import ExtractionEstimate
+
+
+@pytest.fixture
+def controller(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "ADMISSION_MAX_ACTIVE_JOBS", 3)
+    monkeypatch.setattr(settings, "ADMISSION_PAGES_PER_HOUR", 100)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_QUEUED_COST", 1000)
+    monkeypatch.setattr(settings, "ADMISSION_MIN_FREE_DISK_MB", 0)
+    monkeypatch.setattr(admission, "_admission", None)
+    return admission.get_admission()
+
+
+def _estimate(pages):
+    return ExtractionEstimate(pages=pages, ocr_pages=0, cost=pages)
+
+
+def test_quotas_are_per_user(controller):
+    controller.admit(1, [_estimate(10), _estimate(10)])
+    with pytest.raises(admission.AdmissionRejected) as exc:
+        controller.admit(1, [_estimate(1), _estimate(1)])
+    assert exc.value.retry_after == settings.ADMISSION_RETRY_AFTER
+    # Un autre utilisateur n'est pas pénalisé par le premier
+    controller.admit(2, [_estimate(10)])
+
+
+def test_pages_quota_retry_after_and_oversized_submission(controller, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(admission.time, "time", lambda: now)
+    controller.admit(1, [_estimate(60)])
+    now += 600
+    controller.admit(1, [_estimate(30)])
+
+    with pytest.raises(admission.AdmissionRejected) as exc:
+        controller.admit(1, [_estimate(20)])
+    # Les 60 premières pages sortent de la fenêtre 50 minutes plus tard
+    assert exc.value.retry_after == 3000
+    with pytest.raises(admission.AdmissionRejected) as exc:
+        controller.admit(2, [_estimate(150)])
+    assert exc.value.retry_after is None
+
+
+def test_batch_larger_than_the_active_cap_is_never_retried(controller):
+    # Aucune demande active : seul le lot dépasse le plafond de 3, Retry-After n'aurait pas de sens
+    with pytest.raises(admission.AdmissionRejected) as exc:
+        controller.admit(1, [_estimate(1)] * 4)
+    assert exc.value.retry_after is None
+    assert controller.stats()["active_jobs"] == 0
+
+
+def test_oversized_batch_is_refused_before_any_download(controller, monkeypatch):
+    downloads = []
+    monkeypatch.setattr(api_routes, "download_pdf", lambda url, path: downloads.append(url))
+    items = [{"id_texte": f"manuel_{i}", "pdf_url": f"http://pdf/{i}"} for i in range(4)]
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(api_routes.extract_batch(
+            webhook_url="http://hook", items=json.dumps(items), ia_validate=False, pdf_files=None,
+            db=None, current_user=User(id=1, email="mj@exemple.fr"),
+        ))
+    assert exc.value.status_code == 413
+    assert downloads == []
+
+
+def test_saturated_queue_rejects_everyone(controller):
+    controller.load({}, [], queued_cost=1000)
+    with pytest.raises(admission.AdmissionRejected):
+        controller.check(42)
+
+
+def test_state_is_reloaded_from_database(controller, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'admission.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add(User(id=1, email="mj@exemple.fr", hashed_password="x", is_validated=True))
+    now = datetime.now(timezone.utc)
+    for i, (status, pages, age) in enumerate([
+        ("pending", 40, 5), ("processing", 40, 10), ("success", 40, 90), ("success_cached", 40, 5),
+    ]):
+        db.add(ExtractionRequest(
+            id_texte=f"manuel_{i}", user_id=1, webhook_url="http://hook", status=status,
+            page_count=pages, estimated_cost=pages, submitted_at=now - timedelta(minutes=age),
+        ))
+    db.commit()
+
+    admission.load_admission_state(db)
+    db.close()
+
+    assert controller.stats()["active_jobs"] == 2
+    assert controller.stats()["queued_cost"] == 40
+    # 80 pages soumises dans l'heure (la demande servie depuis le cache ne compte pas)
+    controller.admit(1, [_estimate(20)])
+    with pytest.raises(admission.AdmissionRejected):
+        controller.admit(1, [_estimate(1)])
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.db.database import Base
+from app.db.models import ExtractionRequest, User, WebhookDelivery
+from app.services import batches
+from app.services.pdf_extractor import ExtractionEstimate
+
+ESTIMATE = ExtractionEstimate(pages=10, ocr_pages=0, cost=10)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DATA_DIR", str(tmp_path / "data"))
+    engine = create_engine(f"sqlite:///{tmp_path / 'batches.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine, autoflush=False)()
+    session.add(User(id=1, email="mj@exemple.fr", hashed_password="x", is_validated=True))
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_batch_dedupes_and_sends_one_summary_webhook(db):
+    batch, requests, unused = batches.create_batch(db, 1, "http://hook/lot", False, [
+        ("lot_a", "/tmp/a.pdf", "h1", ESTIMATE),
+        ("lot_b", "/tmp/b.pdf", "h2", ESTIMATE),
+        ("lot_a_bis", "/tmp/a_bis.pdf", "h1", ESTIMATE),
+    ])
+    db.commit()
+
+    # Le doublon réutilise le PDF déjà reçu, le sien est à supprimer
+    assert [r.file_path for r in requests] == ["/tmp/a.pdf", "/tmp/b.pdf", "/tmp/a.pdf"]
+    assert unused == ["/tmp/a_bis.pdf"]
+    assert batch.status == "pending"
+
+    for req, status in zip(requests, ["success", "error", "success"]):
+        req.status = status
+        assert db.query(WebhookDelivery).count() == 0
+        batches.complete_batch(db, batch.id)
+        db.commit()
+
+    deliveries = db.query(WebhookDelivery).all()
+    assert len(deliveries) == 1
+    payload = json.loads(deliveries[0].payload)
+    assert payload["etat"] == "partiel"
+    assert [item["etat"] for item in payload["demandes"]] == ["succès", "échec", "succès"]
+    assert not batches.complete_batch(db, batch.id)
+
+
+def test_resubmitted_id_texte_moves_to_new_batch(db):
+    first, _, _ = batches.create_batch(db, 1, "http://hook/1", False, [("lot_a", "/tmp/a.pdf", "h1", ESTIMATE)])
+    db.commit()
+    second, requests, _ = batches.create_batch(db, 1, "http://hook/2", False, [("lot_a", "/tmp/a2.pdf", "h1", ESTIMATE)])
+    db.commit()
+
+    assert db.query(ExtractionRequest).count() == 1
+    assert requests[0].batch_id == second.id
+    # Le premier lot, vidé de sa seule demande, est terminé
+    db.refresh(first)
+    assert first.status == "completed"
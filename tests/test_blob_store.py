@@ -0,0 +1,80 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.db.database import Base
+from app.db.models import ExtractionRequest, ResultBlob, User
+from app.services import blob_store
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DATA_DIR", str(tmp_path / "data"))
+    engine = create_engine(f"sqlite:///{tmp_path / 'blobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([
+        User(id=1, email="mj@exemple.fr", hashed_password="x", is_validated=True),
+        User(id=2, email="joueur@exemple.fr", hashed_password="x", is_validated=True),
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+
+def _add_request(db, id_texte, user_id):
+    req = ExtractionRequest(id_texte=id_texte, user_id=user_id, webhook_url="http://hook", status="success")
+    db.add(req)
+    db.commit()
+    return req
+
+
+def test_identical_results_share_one_blob(db):
+    first = _add_request(db, "manuel_mj", 1)
+    second = _add_request(db, "manuel_joueur", 2)
+    blob_store.store_result(db, first, "Le dragon dort.", "a.txt")
+    blob_store.store_result(db, second, "Le dragon dort.", "b.txt")
+    db.commit()
+
+    assert first.txt_file_path == second.txt_file_path
+    assert db.get(ResultBlob, first.result_hash).refcount == 2
+
+    # Supprimer une demande ne casse pas le téléchargement de l'autre
+    blob_store.discard_result(db, first)
+    db.delete(first)
+    db.commit()
+    assert os.path.exists(second.txt_file_path)
+    assert db.get(ResultBlob, second.result_hash).refcount == 1
+
+
+def test_gc_removes_only_unreferenced_blobs_after_grace(db, monkeypatch):
+    req = _add_request(db, "manuel_mj", 1)
+    blob_store.store_result(db, req, "Le dragon dort.", "a.txt")
+    db.commit()
+    path, sha256 = req.txt_file_path, req.result_hash
+
+    monkeypatch.setattr(settings, "BLOB_GC_GRACE", 0.0)
+    assert blob_store.collect_garbage(db) == 0
+    blob_store.release_result(db, req)
+    db.commit()
+    assert blob_store.collect_garbage(db) == 1
+    assert not os.path.exists(path)
+    assert db.get(ResultBlob, sha256) is None
+
+
+def test_legacy_files_are_migrated_and_deduplicated(db, tmp_path):
+    legacy = tmp_path / "ancien.txt"
+    legacy.write_text("Le dragon dort.", encoding="utf-8")
+    for id_texte in ("v1", "v2"):
+        req = _add_request(db, id_texte, 1)
+        req.txt_file_path = str(legacy)
+    db.commit()
+
+    assert blob_store.migrate_legacy_results(db) == 1
+    rows = db.query(ExtractionRequest).all()
+    assert {r.result_filename for r in rows} == {"ancien.txt"}
+    assert db.get(ResultBlob, rows[0].result_hash).refcount == 2
+    assert not legacy.exists()
@@ -0,0 +1,34 @@
+from app.core.config import settings
+from app.services.checkpoint import JobCheckpoint
+
+
+def test_checkpoint_resumes_and_ignores_torn_or_foreign_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DATA_DIR", str(tmp_path))
+    checkpoint = JobCheckpoint(42, "hash-a")
+    checkpoint.append("ocr", 0, text="Page un")
+    checkpoint.append("ocr", 3, text="Page quatre")
+    # Arrêt brutal pendant l'écriture d'une ligne
+    with open(checkpoint._path("ocr"), "a", encoding="utf-8") as f:
+        f.write('{"index": 4, "te')
+
+    resumed = JobCheckpoint(42, "hash-a").load("ocr")
+    assert {i: e["text"] for i, e in resumed.items()} == {0: "Page un", 3: "Page quatre"}
+
+    # Autre PDF soumis sous la même demande : on repart de zéro
+    assert JobCheckpoint(42, "hash-b").load("ocr") == {}
+
+    checkpoint.clear()
+    assert JobCheckpoint(42, "hash-a").load("ocr") == {}
+
+
+def test_append_after_a_torn_line_is_kept_on_resume(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DATA_DIR", str(tmp_path))
+    JobCheckpoint(7, "hash-a").append("ocr", 0, text="Page un")
+    with open(JobCheckpoint(7, "hash-a")._path("ocr"), "a", encoding="utf-8") as f:
+        f.write('{"index": 1, "te')
+
+    # Reprise : le journal rouvert est ramené à sa dernière ligne complète avant l'ajout
+    JobCheckpoint(7, "hash-a").extend("ocr", [{"index": 1, "text": "Page deux"}, {"index": 2, "text": "Page trois"}])
+
+    resumed = JobCheckpoint(7, "hash-a").load("ocr")
+    assert {i: e["text"] for i, e in resumed.items()} == {0: "Page un", 1: "Page deux", 2: "Page trois"}
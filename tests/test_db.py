@@ -4,3 +4,33 @@ with engine.connect() as con:
     rs = con.execute(text("PRAGMA table_info(extraction_requests);"))
     for row in rs:
         print(row)
+
+
+def test_sqlite_engine_uses_wal(tmp_path):
+    from app.db.database import build_engine
+
+    wal_engine = build_engine(f"sqlite:///{tmp_path / 'wal.db'}")
+    with wal_engine.connect() as con:
+        assert con.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert con.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert con.execute(text("PRAGMA busy_timeout")).scalar() > 0
+    wal_engine.dispose()
+
+
+def test_async_url_uses_async_driver():
+    from app.db.database import async_database_url
+
+    assert async_database_url("sqlite:///./data/db/x.db").drivername == "sqlite+aiosqlite"
+    assert async_database_url("postgresql+psycopg2://u:p@h/db").drivername == "postgresql+asyncpg"
+
+
+def test_missing_async_driver_is_named(monkeypatch):
+    import importlib.util
+
+    import pytest
+
+    from app.db.database import build_async_engine
+
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name: None)
+    with pytest.raises(RuntimeError, match="asyncpg"):
+        build_async_engine("postgresql+psycopg2://u:p@h/db")
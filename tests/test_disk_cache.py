@@ -0,0 +1,40 @@
+import os
+import time
+
+from app.services.disk_cache import DiskCache
+
+
+def test_get_put_and_counters(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1024 * 1024)
+    assert cache.get("ab12") is None
+    cache.put("ab12", "page OCR")
+    assert cache.get("ab12") == "page OCR"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_lru_eviction_keeps_recently_read_entries(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=250)
+    for key in ("aa01", "bb02", "cc03"):
+        cache.put(key, "x" * 80)
+        # Les horodatages de fichiers doivent être distincts pour ordonner l'éviction
+        past = time.time() - 100 + len(os.listdir(tmp_path))
+        os.utime(cache._path(key), (past, past))
+    cache.get("aa01")  # rafraîchit l'entrée la plus ancienne
+
+    cache.put("dd04", "x" * 80)
+
+    assert cache.get("aa01") is not None
+    assert cache.get("bb02") is None
+    assert cache.get("dd04") is not None
+
+
+def test_entries_older_than_max_age_expire(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1024 * 1024, max_age=3600)
+    cache.put("aa01", "ancien")
+    old = time.time() - 7200
+    os.utime(cache._path("aa01"), (old, old))
+
+    assert cache.get("aa01") is None
+    cache.evict()
+    assert not os.path.exists(cache._path("aa01"))
@@ -0,0 +1,73 @@
+import asyncio
+import hashlib
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.services import downloader
+from app.services.downloader import DownloadError, DownloadTooLarge, download_pdf
+
+PDF = b"%PDF-1.7\n" + b"0" * 5000
+
+
+def _download(handler, url, dest):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await download_pdf(url, str(dest), client=client)
+    return asyncio.run(run())
+
+
+def test_direct_download_is_hashed_while_streaming(tmp_path):
+    dest = tmp_path / "doc.pdf"
+    file_hash = _download(lambda request: httpx.Response(200, content=PDF), "https://exemple.fr/regles.pdf", dest)
+
+    assert file_hash == hashlib.sha256(PDF).hexdigest()
+    assert dest.read_bytes() == PDF
+
+
+def test_non_pdf_and_oversized_downloads_are_rejected(tmp_path, monkeypatch):
+    dest = tmp_path / "doc.pdf"
+    with pytest.raises(DownloadError):
+        _download(lambda request: httpx.Response(200, content=b"<html>connexion</html>"), "https://exemple.fr/x", dest)
+    assert not dest.exists()
+
+    monkeypatch.setattr(settings, "DOWNLOAD_MAX_MB", 0)
+    with pytest.raises(DownloadTooLarge):
+        _download(lambda request: httpx.Response(200, content=PDF), "https://exemple.fr/regles.pdf", dest)
+    assert not dest.exists()
+
+
+def test_google_drive_confirm_token_is_followed(tmp_path):
+    def handler(request):
+        if request.url.params.get("confirm") == "abc123":
+            assert request.headers["Cookie"] == "NID=42"
+            return httpx.Response(200, content=PDF)
+        html = b'<a href="/uc?export=download&amp;confirm=abc123&amp;id=XYZ">Download anyway</a>'
+        return httpx.Response(200, content=html, headers={"Content-Type": "text/html", "Set-Cookie": "NID=42"})
+
+    file_hash = _download(handler, "https://drive.google.com/file/d/XYZ/view", tmp_path / "doc.pdf")
+
+    assert file_hash == hashlib.sha256(PDF).hexdigest()
+
+
+def test_drive_cookies_are_not_replayed_to_the_next_download(tmp_path):
+    sent_cookies = []
+
+    def handler(request):
+        sent_cookies.append(request.headers.get("Cookie"))
+        if request.url.params.get("confirm") == "abc123":
+            return httpx.Response(200, content=PDF)
+        html = b'<a href="/uc?export=download&amp;confirm=abc123&amp;id=XYZ">Download anyway</a>'
+        return httpx.Response(200, content=html, headers={"Content-Type": "text/html", "Set-Cookie": "NID=42"})
+
+    async def run():
+        # Client partagé tel que construit en production : deux utilisateurs à la suite
+        async with downloader._build_client(transport=httpx.MockTransport(handler)) as client:
+            await download_pdf("https://drive.google.com/file/d/XYZ/view", str(tmp_path / "a.pdf"), client=client)
+            await download_pdf("https://drive.google.com/file/d/ABC/view", str(tmp_path / "b.pdf"), client=client)
+            return len(client.cookies)
+
+    assert asyncio.run(run()) == 0
+    # Seul le second passage de chaque téléchargement porte le cookie, reçu dans ce même téléchargement
+    assert sent_cookies == [None, "NID=42", None, "NID=42"]
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.core.config import settings
+from app.services import correction_cache, hf_corrector
+from app.services.checkpoint import JobCheckpoint
+from app.services.disk_cache import DiskCache
+
+
+class FakeInferenceHandler(BaseHTTPRequestHandler):
+    """Serveur d'inférence local compatible OpenAI : renvoie le morceau reçu en majuscules."""
+
+    attempts = {}
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = body["messages"][0]["content"]
+        chunk = re.search(r"\) :\n(.*)<\|eot_id\|><\|start_header_id\|>assistant", prompt, re.S).group(1)
+        cls = type(self)
+        label = chunk.split(" ")[0]
+        with cls.lock:
+            cls.attempts[label] = cls.attempts.get(label, 0) + 1
+            attempt = cls.attempts[label]
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            time.sleep(random.uniform(0.01, 0.05))
+            if chunk.startswith("REFUS"):
+                return self._reply(400, {"error": "bad request"})
+            if chunk.startswith("LIMITE") and attempt == 1:
+                return self._reply(429, {"error": "rate limited"}, {"Retry-After": "0"})
+            if chunk.startswith("PANNE") and attempt < 3:
+                return self._reply(503, {"error": "unavailable"})
+            self._reply(200, {
+                "id": "fake", "object": "chat.completion", "created": 0, "model": body["model"],
+                "system_fingerprint": "",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": chunk.upper()}}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            })
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def _reply(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_server(monkeypatch, tmp_path):
+    FakeInferenceHandler.attempts = {}
+    FakeInferenceHandler.max_in_flight = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeInferenceHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(settings, "HF_MAX_IN_FLIGHT", 3)
+    monkeypatch.setattr(settings, "HF_RATE_PER_SECOND", 200.0)
+    monkeypatch.setattr(settings, "HF_BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(correction_cache, "_correction_cache", DiskCache(str(tmp_path / "corrections"), 1024 * 1024))
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def _text(*chunks):
+    # Une ligne de 2900 caractères par morceau : chaque ligne devient exactement un morceau
+    return "\n".join(c + " " + "x" * (2900 - len(c) - 1) for c in chunks)
+
+
+def test_chunks_are_corrected_concurrently_in_order(fake_server):
+    labels = [f"page {i}" for i in range(12)]
+    corrected, truncated = asyncio.run(hf_corrector.correct_text_with_hf(_text(*labels), "token", base_url=fake_server))
+
+    parts = corrected.split("\n\n")
+    assert [p.split(" ")[0] + " " + p.split(" ")[1] for p in parts] == [l.upper() for l in labels]
+    assert truncated is False
+    assert 1 < FakeInferenceHandler.max_in_flight <= 3
+
+
+def test_transient_errors_are_retried_and_hard_errors_keep_original(fake_server):
+    corrected, _ = asyncio.run(hf_corrector.correct_text_with_hf(
+        _text("LIMITE a", "PANNE b", "REFUS c"), "token", base_url=fake_server
+    ))
+
+    parts = corrected.split("\n\n")
+    assert parts[0].startswith("LIMITE A")
+    assert parts[1].startswith("PANNE B")
+    assert parts[2].startswith("REFUS c")  # morceau original conservé
+    assert FakeInferenceHandler.attempts == {"LIMITE": 2, "PANNE": 3, "REFUS": 1}
+
+
+def test_second_run_is_served_from_cache(fake_server):
+    text = _text("mentions légales", "REFUS d")
+    asyncio.run(hf_corrector.correct_text_with_hf(text, "token", base_url=fake_server))
+    FakeInferenceHandler.attempts = {}
+
+    corrected, _ = asyncio.run(hf_corrector.correct_text_with_hf(text, "token", base_url=fake_server))
+
+    assert corrected.startswith("MENTIONS LÉGALES")
+    # Seul le morceau en échec (jamais mis en cache) est renvoyé au modèle
+    assert FakeInferenceHandler.attempts == {"REFUS": 1}
+    assert correction_cache.get_correction_cache().stats()["hits"] == 1
+
+
+def test_interrupted_correction_resumes_from_checkpoint(fake_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DATA_DIR", str(tmp_path))
+    checkpoint = JobCheckpoint(7, "hash")
+    text = _text("chapitre un", "chapitre deux")
+    first_chunk = hf_corrector.split_into_chunks(text)[0]
+    key = correction_cache.correction_cache_key(hf_corrector.HF_MODEL, hf_corrector.PROMPT_VERSION, first_chunk)
+    checkpoint.append("hf", 0, key=key, text="CHAPITRE UN (déjà corrigé)")
+
+    corrected, _ = asyncio.run(hf_corrector.correct_text_with_hf(text, "token", base_url=fake_server, checkpoint=checkpoint))
+
+    assert corrected.startswith("CHAPITRE UN (déjà corrigé)\n\nCHAPITRE DEUX")
+    assert FakeInferenceHandler.attempts == {"chapitre": 1}
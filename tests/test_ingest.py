@@ -0,0 +1,125 @@
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import Request, UploadFile
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.db.database import Base
+from app.db.models import ExtractionRequest, User
+from app.routes import api_routes
+from app.services import admission
+from app.services.blob_store import store_result
+from app.services.ingest import UPLOAD_CHUNK_SIZE, save_upload
+
+
+def test_streamed_hash_matches_the_written_file(tmp_path):
+    data = os.urandom(UPLOAD_CHUNK_SIZE * 2 + 123)
+    dest = str(tmp_path / "recu.pdf")
+
+    file_hash = asyncio.run(save_upload(UploadFile(io.BytesIO(data), filename="recu.pdf"), dest))
+
+    with open(dest, "rb") as f:
+        assert f.read() == data
+    assert file_hash == hashlib.sha256(data).hexdigest()
+
+
+def test_partial_file_is_removed_when_the_upload_fails(tmp_path):
+    class BrokenUpload:
+        """Connexion coupée après le premier bloc."""
+        calls = 0
+
+        async def read(self, size):
+            self.calls += 1
+            if self.calls > 1:
+                raise ConnectionResetError("client parti")
+            return b"%PDF-1.7" + b"x" * 100
+
+    dest = str(tmp_path / "recu.pdf")
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(save_upload(BrokenUpload(), dest))
+    assert not os.path.exists(dest)
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    for name in ("DATA_DIR", "TEMP_DIR"):
+        monkeypatch.setattr(settings, name, str(tmp_path / name.lower()))
+        os.makedirs(getattr(settings, name), exist_ok=True)
+    monkeypatch.setattr(admission, "_admission", None)
+    db_path = tmp_path / "ingest.db"
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine, autoflush=False), create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    engine.dispose()
+
+
+def test_duplicate_pdf_is_served_from_cache_without_queuing(database, monkeypatch):
+    Session, async_engine = database
+    pdf = b"%PDF-1.7 grimoire"
+    with Session() as db:
+        user = User(id=1, email="mj@exemple.fr", hashed_password="x", is_validated=True)
+        done = ExtractionRequest(id_texte="grimoire", user_id=1, webhook_url="http://hook", status="success",
+                                 file_hash=hashlib.sha256(pdf).hexdigest(), page_count=3, ocr_page_count=1)
+        db.add_all([user, done])
+        store_result(db, done, "Texte du grimoire", "grimoire.txt")
+        db.commit()
+        db.refresh(user)
+        db.expunge(user)
+    queued = []
+    monkeypatch.setattr(api_routes, "notify_new_job", lambda: queued.append(True))
+    monkeypatch.setattr(api_routes, "notify_webhooks", lambda: None)
+
+    async def submit():
+        async with async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)() as db:
+            return await api_routes.extract_document(
+                id_texte="grimoire_copie", webhook_url="http://hook", ia_validate=False,
+                pdf_file=UploadFile(io.BytesIO(pdf), filename="copie.pdf"), pdf_url=None,
+                db=db, current_user=user,
+            )
+
+    response = asyncio.run(submit())
+    asyncio.run(async_engine.dispose())
+
+    assert response["status"] == "success_cached"
+    assert queued == []
+    assert os.listdir(settings.TEMP_DIR) == []
+    with Session() as db:
+        copy = db.scalar(select(ExtractionRequest).where(ExtractionRequest.id_texte == "grimoire_copie"))
+        assert copy.status == "success_cached"
+        assert copy.page_count == 3
+        assert copy.file_path is None
+
+
+def test_download_etag_follows_the_result_text(database):
+    Session, async_engine = database
+    with Session() as db:
+        db.add(User(id=1, email="mj@exemple.fr", hashed_password="x", is_validated=True))
+        brut = ExtractionRequest(id_texte="brut", user_id=1, webhook_url="http://hook", status="success", file_hash="meme-pdf")
+        corrige = ExtractionRequest(id_texte="corrige", user_id=1, webhook_url="http://hook", status="success", file_hash="meme-pdf")
+        db.add_all([brut, corrige])
+        store_result(db, brut, "Texte brut", "brut.txt")
+        store_result(db, corrige, "Texte corrigé par l'IA", "corrige.txt")
+        db.commit()
+        requests = [(brut.id, brut.result_hash), (corrige.id, corrige.result_hash)]
+
+    async def download(request_id, if_none_match=None):
+        headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+        token = create_access_token({"sub": str(request_id), "type": "download"})
+        async with async_sessionmaker(async_engine, expire_on_commit=False)() as db:
+            return await api_routes.download_text(
+                request_id, Request({"type": "http", "headers": headers}), token=token, db=db)
+
+    etags = [asyncio.run(download(request_id)).headers["etag"] for request_id, _ in requests]
+    revalidated = asyncio.run(download(requests[0][0], etags[0]))
+    asyncio.run(async_engine.dispose())
+
+    # Même PDF, textes différents : les ETag diffèrent et suivent l'empreinte du texte
+    assert etags == [f'"{result_hash}"' for _, result_hash in requests]
+    assert revalidated.status_code == 304
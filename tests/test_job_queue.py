@@ -0,0 +1,130 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import worker
+from app.core.config import settings
+from app.db.database import Base
+from app.db.models import ExtractionRequest, User
+from app.services import job_queue
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'queue.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add(User(id=1, email="mj@exemple.fr", hashed_password="x", is_validated=True))
+    session.commit()
+    yield session
+    session.close()
+
+
+def _add_request(db, id_texte, user_id=1, **kwargs):
+    req = ExtractionRequest(id_texte=id_texte, user_id=user_id, webhook_url="http://hook", status="pending", **kwargs)
+    db.add(req)
+    db.commit()
+    return req
+
+
+def test_claim_is_fifo_and_exclusive(db):
+    first = _add_request(db, "manuel_01")
+    second = _add_request(db, "manuel_02")
+
+    assert job_queue.claim_next_job(db, "w1") == first.id
+    assert job_queue.claim_next_job(db, "w2") == second.id
+    assert job_queue.claim_next_job(db, "w1") is None
+
+    db.refresh(first)
+    assert first.status == "processing"
+    assert first.worker_id == "w1"
+
+
+def test_stale_processing_jobs_are_recovered(db):
+    old = datetime.now(timezone.utc) - timedelta(hours=1)
+    stale = _add_request(db, "bestiaire")
+    alive = _add_request(db, "ecran")
+    job_queue.claim_next_job(db, "w1")
+    job_queue.claim_next_job(db, "w2")
+    db.query(ExtractionRequest).filter(ExtractionRequest.id == stale.id).update({"heartbeat_at": old})
+    db.commit()
+
+    assert job_queue.recover_stale_jobs(db, stale_after_seconds=60) == 1
+
+    db.refresh(stale)
+    db.refresh(alive)
+    assert stale.status == "pending"
+    assert alive.status == "processing"
+
+
+def test_queue_positions_follow_claim_order(db):
+    same_time = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    done = _add_request(db, "termine", created_at=same_time - timedelta(minutes=1))
+    done.status = "success"
+    late = _add_request(db, "tardif", created_at=same_time + timedelta(minutes=1))
+    first = _add_request(db, "premier", created_at=same_time)
+    second = _add_request(db, "second", created_at=same_time)
+    db.commit()
+
+    positions = job_queue.queue_positions(db, [done.id, late.id, first.id, second.id])
+
+    assert positions == {first.id: 0, second.id: 1, late.id: 2}
+    assert job_queue.claim_next_job(db, "w1") == first.id
+    # Une demande en cours reste comptée : les positions ne bougent pas à la réservation
+    assert job_queue.queue_positions(db, [second.id]) == {second.id: 1}
+
+
+def test_claim_skips_pdf_already_being_extracted(db):
+    first = _add_request(db, "manuel_01", file_hash="abc")
+    duplicate = _add_request(db, "manuel_01_bis", file_hash="abc")
+    other = _add_request(db, "manuel_02", file_hash="def")
+
+    assert job_queue.claim_next_job(db, "w1") == first.id
+    assert job_queue.claim_next_job(db, "w2") == other.id
+    assert job_queue.claim_next_job(db, "w2") is None
+
+    first.status = "success"
+    db.commit()
+    assert job_queue.claim_next_job(db, "w2") == duplicate.id
+
+
+def test_fair_share_priority_and_shortest_job_first(db):
+    db.add_all([
+        User(id=2, email="joueur@exemple.fr", hashed_password="x", is_validated=True, priority="normal"),
+        User(id=3, email="editeur@exemple.fr", hashed_password="x", is_validated=True, priority="high"),
+    ])
+    db.commit()
+    # Gros envoi de l'utilisateur 1 : ses travaux ne passent pas tous devant ceux des autres
+    bulk = [_add_request(db, f"scan_{i}", estimated_cost=12000) for i in range(3)]
+    small = _add_request(db, "aide_de_jeu", user_id=2, estimated_cost=2)
+    big = _add_request(db, "livre_de_base", user_id=2, estimated_cost=600)
+    vip = [_add_request(db, f"editeur_{i}", user_id=3, estimated_cost=50) for i in range(3)]
+    # Plus court d'abord chez un même utilisateur, puis tours pondérés (editeur : "high")
+    expected = [vip[0].id, small.id, vip[1].id, bulk[0].id, vip[2].id, big.id, bulk[1].id, bulk[2].id]
+
+    positions = job_queue.queue_positions(db, expected)
+    assert sorted(positions, key=positions.get) == expected
+    claimed = [job_queue.claim_next_job(db, "w1") for _ in expected]
+    assert claimed == expected
+
+
+def test_shared_worker_id_does_not_recover_other_workers_jobs(db, monkeypatch):
+    monkeypatch.setattr(worker, "SessionLocal", sessionmaker(bind=db.get_bind()))
+    monkeypatch.setattr(settings, "WORKER_ID", "partage")
+    running = _add_request(db, "bestiaire")
+    job_queue.claim_next_job(db, "partage")
+    stop = asyncio.Event()
+    stop.set()
+
+    # Un autre processus démarré avec le même WORKER_ID ne touche pas à la demande en cours
+    asyncio.run(worker.run_worker(stop))
+    db.refresh(running)
+    assert running.status == "processing"
+
+    # Relancé avec son propre --worker-id, le worker reprend ce qu'il avait laissé
+    asyncio.run(worker.run_worker(stop, worker_id="partage"))
+    db.refresh(running)
+    assert running.status == "pending"
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services import metrics
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "_registry", {})
+    monkeypatch.setattr(metrics, "_process_name", "web-test")
+    return tmp_path
+
+
+def test_render_merges_other_process_snapshots(registry):
+    jobs = metrics.Counter("test_jobs_total", "Demandes", ["outcome"])
+    stage = metrics.Histogram("test_stage_seconds", "Étapes", ["stage"], buckets=(0.1, 1))
+    jobs.inc("success")
+    stage.observe(0.05, "ocr")
+    stage.observe(5, "ocr")
+
+    # Instantané d'un worker : ses valeurs s'ajoutent à celles du processus courant
+    metrics.set_process_name("worker-1")
+    metrics.write_snapshot()
+    metrics.set_process_name("web-test")
+    jobs.inc("error", amount=2)
+
+    text = metrics.render([("test_queue_depth", "File", (), [((), 3)])])
+
+    assert 'test_jobs_total{outcome="success"} 2' in text
+    assert 'test_jobs_total{outcome="error"} 2' in text
+    assert 'test_stage_seconds_bucket{stage="ocr",le="0.1"} 2' in text
+    assert 'test_stage_seconds_bucket{stage="ocr",le="1"} 2' in text
+    assert 'test_stage_seconds_bucket{stage="ocr",le="+Inf"} 4' in text
+    assert 'test_stage_seconds_count{stage="ocr"} 4' in text
+    assert "# TYPE test_queue_depth gauge\ntest_queue_depth 3" in text
+
+
+def test_stage_timer_records_each_stage(registry, monkeypatch):
+    stage = metrics.Histogram("test_stage_seconds", "Étapes", ["stage"])
+    monkeypatch.setattr(metrics, "STAGE_SECONDS", stage)
+    timer = metrics.StageTimer()
+    timer.start("hashing")
+    timer.start("ocr")
+    timer.stop()
+    timer.stop()
+
+    metrics.write_snapshot()
+    with open(os.path.join(registry, "metrics", "web-test.json")) as f:
+        samples = json.load(f)["test_stage_seconds"]
+    assert sorted((labels[0], sum(counts)) for labels, counts, _ in samples) == [("hashing", 1), ("ocr", 1)]
+
+
+def test_snapshots_of_stopped_processes_are_dropped(registry):
+    jobs = metrics.Counter("test_jobs_total", "Demandes", ["outcome"])
+    jobs.inc("success")
+    metrics.set_process_name("worker-1")
+    metrics.write_snapshot()
+    metrics.set_process_name("web-test")
+
+    # Worker local arrêté brutalement (pid disparu) et worker d'un autre hôte muet depuis longtemps
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    snapshots = registry / "metrics"
+    for name, process in (("worker-2", {"host": socket.gethostname(), "pid": dead.pid}),
+                          ("worker-3", {"host": "autre-hote", "pid": 1})):
+        (snapshots / f"{name}.json").write_text(json.dumps({
+            "test_jobs_total": [[["success"], 5]], metrics.PROCESS_KEY: process,
+        }))
+    old = time.time() - 10 * metrics.STALE_FLUSH_INTERVALS * settings.METRICS_FLUSH_INTERVAL
+    os.utime(snapshots / "worker-3.json", (old, old))
+
+    text = metrics.render()
+
+    assert 'test_jobs_total{outcome="success"} 2' in text
+    assert sorted(os.listdir(snapshots)) == ["worker-1.json"]
+
+
+def test_snapshot_is_removed_when_the_flush_loop_stops(registry, monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_FLUSH_INTERVAL", 0.01)
+
+    async def run():
+        stop = asyncio.Event()
+        task = asyncio.create_task(metrics.run_metrics_flush(stop))
+        await asyncio.sleep(0.1)
+        written = os.path.exists(registry / "metrics" / "web-test.json")
+        stop.set()
+        await task
+        return written
+
+    assert asyncio.run(run())
+    assert os.listdir(registry / "metrics") == []
@@ -0,0 +1,49 @@
+from PIL import Image
+
+from app.services import ocr_backends
+
+
+class FakeTessBaseAPI:
+    """Moteur factice : enregistre les appels faits par le backend tesserocr."""
+    instances = []
+
+    def __init__(self, lang="eng"):
+        self.lang = lang
+        self.calls = []
+        FakeTessBaseAPI.instances.append(self)
+
+    def SetImageBytes(self, data, width, height, bytes_per_pixel, bytes_per_line):
+        self.calls.append(("image", len(data), width, height, bytes_per_pixel, bytes_per_line))
+
+    def GetUTF8Text(self):
+        return f"page {len(self.calls)}"
+
+    def Clear(self):
+        self.calls.append(("clear",))
+
+    def End(self):
+        self.calls.append(("end",))
+
+
+def test_tesserocr_engine_is_loaded_once_and_fed_raw_pixels(monkeypatch):
+    FakeTessBaseAPI.instances = []
+    monkeypatch.setattr(ocr_backends, "tesserocr", type("FakeModule", (), {"PyTessBaseAPI": FakeTessBaseAPI}))
+
+    backend = ocr_backends.create_backend("auto")
+    first = backend.image_to_string(Image.new("L", (40, 10)))
+    second = backend.image_to_string(Image.new("L", (40, 10)))
+    backend.close()
+
+    assert backend.name == "tesserocr"
+    assert (first, second) == ("page 1", "page 3")
+    [api] = FakeTessBaseAPI.instances
+    assert api.lang == "fra"
+    assert api.calls[0] == ("image", 400, 40, 10, 1, 40)
+    assert api.calls[-1] == ("end",)
+
+
+def test_pytesseract_is_the_fallback(monkeypatch):
+    monkeypatch.setattr(ocr_backends, "tesserocr", None)
+    assert ocr_backends.create_backend("auto").name == "pytesseract"
+    assert ocr_backends.create_backend("tesserocr").name == "pytesseract"
+    assert ocr_backends.create_backend("pytesseract").name == "pytesseract"
@@ -0,0 +1,79 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.services import ocr_engine
+
+
+class StubOcr:
+    """OCR factice : les premières pages sont les plus lentes, la concurrence maximale est relevée."""
+
+    def __init__(self, pages: int, fail_on=None):
+        self.pages = pages
+        self.fail_on = fail_on
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, pdf_path, page_index, dpi):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(0.01 * (self.pages - page_index))
+            if page_index == self.fail_on:
+                raise ValueError("image illisible")
+            return f"page {page_index}"
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+@pytest.fixture
+def thread_pool(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=8)
+    monkeypatch.setattr(ocr_engine, "get_ocr_pool", lambda: pool)
+    monkeypatch.setattr(ocr_engine, "estimate_pages_in_flight", lambda pdf_path, dpi: 2)
+    yield pool
+    pool.shutdown()
+
+
+def test_pages_come_back_in_order_within_the_in_flight_window(thread_pool, monkeypatch):
+    stub = StubOcr(pages=6)
+    monkeypatch.setattr(ocr_engine, "_ocr_page", stub)
+    seen = []
+
+    texts = asyncio.run(ocr_engine.ocr_pdf_pages("doc.pdf", [5, 0, 3, 1, 4, 2], dpi=100,
+                                                 on_page=lambda i, text: seen.append(i)))
+
+    assert texts == ["page 5", "page 0", "page 3", "page 1", "page 4", "page 2"]
+    assert sorted(seen) == [0, 1, 2, 3, 4, 5]
+    assert stub.max_running == 2
+
+
+def test_failed_page_fails_the_whole_document(thread_pool, monkeypatch):
+    monkeypatch.setattr(ocr_engine, "_ocr_page", StubOcr(pages=4, fail_on=2))
+
+    with pytest.raises(RuntimeError, match="page 3"):
+        asyncio.run(ocr_engine.ocr_pdf_pages("doc.pdf", [0, 1, 2, 3], dpi=100))
+
+
+def test_broken_pool_reset_spares_a_replacement_pool(monkeypatch):
+    broken, replacement = ThreadPoolExecutor(1), ThreadPoolExecutor(1)
+    monkeypatch.setattr(ocr_engine, "_ocr_pool", replacement)
+
+    ocr_engine.shutdown_ocr_pool(broken)
+    assert ocr_engine._ocr_pool is replacement
+
+    monkeypatch.setattr(ocr_engine, "get_ocr_pool", lambda: broken)
+    monkeypatch.setattr(ocr_engine, "estimate_pages_in_flight", lambda pdf_path, dpi: 1)
+    monkeypatch.setattr(ocr_engine, "_ocr_page", lambda *args: (_ for _ in ()).throw(BrokenProcessPool()))
+    with pytest.raises(BrokenProcessPool):
+        asyncio.run(ocr_engine.ocr_pdf_pages("doc.pdf", [0], dpi=100))
+    assert ocr_engine._ocr_pool is replacement
+    broken.shutdown()
+    replacement.shutdown()
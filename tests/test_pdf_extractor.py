@@ -0,0 +1,60 @@
+import os
+
+import fitz
+import pytest
+
+from app.core.config import settings
+from app.services import page_cache, pdf_extractor
+
+
+def _build_mixed_pdf(path):
+    """PDF de 3 pages : texte natif, scan (image seule), page blanche."""
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(50, 50, 550, 800), "Le gobelin attaque le paladin. " * 60)
+
+    scan_src = fitz.open()
+    scan_src.new_page().insert_text((72, 72), "Carte du donjon")
+    pixmap = scan_src[0].get_pixmap(dpi=50)
+    page = doc.new_page()
+    page.insert_image(page.rect, pixmap=pixmap)
+
+    doc.new_page()
+    doc.save(path)
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Cache des pages OCRisées sous tmp_path : le texte factice ne doit pas atteindre le vrai cache."""
+    monkeypatch.setattr(settings, "DATA_DIR", str(tmp_path / "data"))
+    monkeypatch.setattr(page_cache, "_page_cache", None)
+    return tmp_path / "data"
+
+
+def test_only_image_pages_are_ocred(tmp_path, data_dir, monkeypatch):
+    pdf_path = str(tmp_path / "mixed.pdf")
+    _build_mixed_pdf(pdf_path)
+    monkeypatch.setattr(pdf_extractor, "ocr_image", lambda img: "TEXTE OCR")
+
+    result = pdf_extractor.extract_pdf(pdf_path)
+
+    assert result.page_count == 3
+    assert result.ocr_page_indexes == [1]
+    assert result.native_pages == 2
+    assert result.text.startswith("Le gobelin attaque")
+    assert result.text.endswith("TEXTE OCR")
+    assert page_cache.get_page_cache().directory == os.path.join(data_dir, "cache", "pages")
+    assert os.listdir(data_dir / "cache" / "pages")
+
+
+def test_ocr_error_fails_the_extraction(tmp_path, data_dir, monkeypatch):
+    pdf_path = str(tmp_path / "mixed.pdf")
+    _build_mixed_pdf(pdf_path)
+
+    def broken_ocr(img):
+        raise OSError("tesseract introuvable")
+
+    monkeypatch.setattr(pdf_extractor, "ocr_image", broken_ocr)
+
+    with pytest.raises(RuntimeError, match="page 2"):
+        pdf_extractor.extract_text_from_pdf(pdf_path)
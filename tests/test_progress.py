@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.db.database import Base
+from app.db.models import ExtractionRequest, User
+from app.services import progress
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'progress.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    db.add(User(id=1, email="mj@exemple.fr", hashed_password="x", is_validated=True))
+    db.add(ExtractionRequest(id=1, id_texte="bestiaire", user_id=1, webhook_url="http://hook", status="processing"))
+    db.commit()
+    db.close()
+    monkeypatch.setattr(progress, "SessionLocal", factory)
+    monkeypatch.setattr(settings, "PROGRESS_POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(settings, "PROGRESS_MIN_INTERVAL", 60)
+    return factory
+
+
+def test_reporter_throttles_within_a_stage(session_factory):
+    reporter = progress.ProgressReporter(1)
+    reporter.report("ocr", 1, 300)
+    reporter.report("ocr", 2, 300)  # ignorée : moins d'un intervalle depuis la précédente
+    db = session_factory()
+    assert (db.get(ExtractionRequest, 1).progress_current) == 1
+    reporter.report("ocr", 300, 300)  # fin d'étape toujours publiée
+    db.expire_all()
+    assert db.get(ExtractionRequest, 1).progress_current == 300
+    db.close()
+
+
+def test_reporter_writes_off_the_event_loop(session_factory):
+    async def scenario():
+        reporter = progress.ProgressReporter(1)
+        reporter.report("ocr", 0, 300)
+        reporter.report("correction", 1, 10)  # fusionnée avec la précédente si elle n'est pas encore écrite
+        await reporter._writer
+        return reporter
+
+    asyncio.run(scenario())
+    db = session_factory()
+    req = db.get(ExtractionRequest, 1)
+    assert (req.progress_stage, req.progress_current, req.progress_total) == ("correction", 1, 10)
+    db.close()
+
+
+def test_broker_pushes_only_changes_to_subscribers(session_factory):
+    async def scenario():
+        broker = progress.ProgressBroker()
+        queue = broker.subscribe(1)
+        first = await asyncio.wait_for(queue.get(), 1)
+        await asyncio.to_thread(progress.ProgressReporter(1).report, "correction", 3, 10)
+        second = await asyncio.wait_for(queue.get(), 1)
+        await asyncio.sleep(0.2)
+        assert queue.empty()  # aucun changement : rien n'est renvoyé
+        broker.unsubscribe(1, queue)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first["status"] == "processing" and first["stage"] is None
+    assert (second["stage"], second["current"], second["total"]) == ("correction", 3, 10)
+
+
+def test_broker_pushes_queue_position_changes(session_factory):
+    db = session_factory()
+    db.add(ExtractionRequest(id=2, id_texte="grimoire", user_id=1, webhook_url="http://hook", status="pending"))
+    db.commit()
+
+    async def scenario():
+        broker = progress.ProgressBroker()
+        queue = broker.subscribe(1)
+        initial = {e["id"]: e for e in [await asyncio.wait_for(queue.get(), 1) for _ in range(2)]}
+        # La demande en cours se termine : celle en attente avance dans la file
+        req = db.get(ExtractionRequest, 1)
+        req.status = "success"
+        req.completed_at = datetime.now(timezone.utc)
+        await asyncio.to_thread(db.commit)
+        updates = {e["id"]: e for e in [await asyncio.wait_for(queue.get(), 1) for _ in range(2)]}
+        broker.unsubscribe(1, queue)
+        return initial, updates
+
+    initial, updates = asyncio.run(scenario())
+    db.close()
+    assert initial[2]["queue_position"] == 1
+    assert updates[2]["queue_position"] == 0
+    assert updates[1]["status"] == "success"
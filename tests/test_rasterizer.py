@@ -0,0 +1,35 @@
+import time
+
+import fitz
+
+from app.services import rasterizer
+
+
+def _build_pdf(path, pages=2):
+    """Pages de 2 x 3 pouces (144 x 216 points)."""
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page(width=144, height=216).insert_text((20, 40), f"Page {i + 1}")
+    doc.save(path)
+
+
+def test_pages_are_rendered_in_grayscale_at_the_requested_dpi(tmp_path):
+    pdf_path = str(tmp_path / "doc.pdf")
+    _build_pdf(pdf_path)
+
+    images = [(index, img.mode, img.size) for index, img in rasterizer.iter_page_images(pdf_path, 100)]
+
+    assert images == [(0, "L", (200, 300)), (1, "L", (200, 300))]
+
+
+def test_open_document_is_closed_once_idle(tmp_path, monkeypatch):
+    pdf_path = str(tmp_path / "doc.pdf")
+    _build_pdf(pdf_path)
+    monkeypatch.setattr(rasterizer, "OPEN_DOC_IDLE_SECONDS", 0.05)
+
+    img = rasterizer.render_page_from_path(pdf_path, 1, 50)
+    assert img.size == (100, 150)
+    assert rasterizer._open_doc is not None
+
+    time.sleep(0.3)
+    assert rasterizer._open_doc is None
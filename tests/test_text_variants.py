@@ -0,0 +1,30 @@
+import gzip
+
+from app.services import text_variants
+
+
+def test_choose_encoding_follows_quality_values(monkeypatch):
+    monkeypatch.setattr(text_variants, "zstandard", None)
+    assert text_variants.choose_encoding("gzip, deflate, br, zstd") == "gzip"
+    assert text_variants.choose_encoding("gzip;q=0, identity") is None
+    assert text_variants.choose_encoding(None) is None
+    assert text_variants.choose_encoding("*") == "gzip"
+
+
+def test_etag_matching():
+    assert text_variants.etag_matches('W/"abc-gzip", "def"', '"abc-gzip"')
+    assert text_variants.etag_matches("*", '"abc"')
+    assert not text_variants.etag_matches('"abc"', '"abc-gzip"')
+
+
+def test_variants_are_written_refreshed_and_removed(tmp_path):
+    txt = tmp_path / "livre.txt"
+    txt.write_text("Le gobelin attaque. " * 1000, encoding="utf-8")
+
+    text_variants.write_compressed_variants(str(txt))
+    gz = text_variants.fresh_variant(str(txt), "gzip")
+
+    assert gzip.decompress(open(gz, "rb").read()).decode("utf-8") == txt.read_text(encoding="utf-8")
+    assert (tmp_path / "livre.txt.gz").stat().st_size < txt.stat().st_size // 10
+    text_variants.remove_variants(str(txt))
+    assert text_variants.fresh_variant(str(txt), "gzip") is None
@@ -0,0 +1,54 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.database import Base
+from app.db.models import User
+from app.services import user_cache
+from app.services.user_cache import UserCache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = UserCache(max_entries=2, ttl=60)
+    monkeypatch.setattr(user_cache, "_user_cache", cache)
+    return cache
+
+
+def _user(user_id, **kwargs):
+    return User(id=user_id, email=f"joueur{user_id}@exemple.fr", hashed_password="x", **kwargs)
+
+
+def test_lru_eviction_and_expiry(cache):
+    cache.put(("api", "a"), _user(1))
+    cache.put(("api", "b"), _user(2))
+    assert cache.get(("api", "a")).id == 1
+    cache.put(("api", "c"), _user(3))  # évince "b", le moins récemment utilisé
+
+    assert cache.get(("api", "b")) is None
+    assert cache.get(("api", "c")).id == 3
+    cache.put(("jwt", "expiré"), _user(4), expires_at=time.time() - 1)
+    assert cache.get(("jwt", "expiré")) is None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["hits"] == 2
+
+
+def test_orm_update_invalidates_cached_user(cache, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'users.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add(_user(1, role="user", is_validated=False))
+    db.commit()
+    cache.put(("jwt", "jeton"), _user(1))
+    cache.put(("api", "clé"), _user(1))
+
+    user = db.get(User, 1)
+    user.is_validated = True
+    db.commit()
+
+    assert cache.get(("jwt", "jeton")) is None
+    assert cache.get(("api", "clé")) is None
+    assert cache.stats()["invalidations"] == 2
+    db.close()
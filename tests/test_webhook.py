@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.database import Base
+from app.db.models import WebhookDelivery
+from app.services import webhook
+
+DISCORD = "https://discord.com/api/webhooks/1/abc"
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'outbox.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def _deliver(deliveries, handler):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await webhook.deliver_batch(deliveries, client=client)
+    return asyncio.run(run())
+
+
+def test_claim_batches_discord_messages_and_records_outcomes(db):
+    for i in range(3):
+        webhook.enqueue_discord_notification(db, DISCORD, f"Nouveau compte {i}")
+    webhook.enqueue_client_webhook(db, "https://client.fr/ok", {"etat": "succès"})
+    webhook.enqueue_client_webhook(db, "https://client.fr/indisponible", {"etat": "succès"})
+    webhook.enqueue_client_webhook(db, "https://client.fr/inconnu", {"etat": "succès"})
+    db.commit()
+
+    deliveries = webhook.claim_due_deliveries(db, limit=10)
+    assert len(deliveries) == 6
+    assert webhook.claim_due_deliveries(db, limit=10) == []
+
+    posted = []
+
+    def handler(request):
+        posted.append((str(request.url), json.loads(request.content)))
+        return httpx.Response({"/indisponible": 503, "/inconnu": 404}.get(request.url.path, 204))
+
+    webhook.record_results(db, _deliver(deliveries, handler))
+
+    discord_posts = [body for url, body in posted if url == DISCORD]
+    assert discord_posts == [{"content": "Nouveau compte 0\n\nNouveau compte 1\n\nNouveau compte 2"}]
+    statuses = {d.url: (d.status, d.attempts) for d in db.query(WebhookDelivery).all()}
+    assert statuses[DISCORD] == ("delivered", 0)
+    assert statuses["https://client.fr/ok"] == ("delivered", 0)
+    assert statuses["https://client.fr/indisponible"] == ("pending", 1)  # reprogrammé plus tard
+    assert statuses["https://client.fr/inconnu"] == ("failed", 1)
+    assert webhook.claim_due_deliveries(db, limit=10) == []